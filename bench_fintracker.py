@@ -0,0 +1,265 @@
+"""Скрипт для замера производительности финансового трекера.
+
+Запуск::
+
+    py bench_fintracker.py
+"""
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager, redirect_stdout
+import io
+
+import fintracker.database
+from fintracker.storage import init_storage, add_expense
+
+
+@contextmanager
+def temporary_database():
+    """Подменяет файл базы данных временным на время замера."""
+    test_dir = tempfile.mkdtemp()
+    original_db_file = fintracker.database.DATABASE_FILE
+    fintracker.database.DATABASE_FILE = os.path.join(test_dir, "bench.db")
+    try:
+        with redirect_stdout(io.StringIO()):
+            init_storage()
+        yield
+    finally:
+        fintracker.database.DATABASE_FILE = original_db_file
+        shutil.rmtree(test_dir)
+
+
+def report(name: str, count: int, elapsed: float):
+    """Выводит результат замера."""
+    print(f"{name:45} {count:8d} опер. {elapsed:8.3f} с {count / elapsed:10.0f} опер./с")
+
+
+def bench_add_expense(count: int = 2000):
+    """Замер вставки через storage.add_expense (commit на каждую операцию)."""
+    with temporary_database():
+        start = time.perf_counter()
+        for i in range(count):
+            add_expense("еда", -i, f"Операция {i}")
+        report("storage.add_expense", count, time.perf_counter() - start)
+
+
+def bench_buffered_writer(count: int = 20000, threads: int = 8, durability: str = "normal"):
+    """Замер вставки через BufferedWriter из нескольких потоков."""
+    from fintracker.writer import BufferedWriter
+
+    with temporary_database():
+        start = time.perf_counter()
+        with BufferedWriter(durability=durability) as writer:
+            def worker(offset):
+                futures = [writer.submit("еда", -i, f"Операция {i}")
+                           for i in range(offset, count, threads)]
+                for future in futures:
+                    future.result()
+
+            pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+            for thread in pool:
+                thread.start()
+            for thread in pool:
+                thread.join()
+        report(f"BufferedWriter ({threads} потоков, {durability})", count,
+               time.perf_counter() - start)
+
+
+def bench_list_rendering(count: int = 200000):
+    """Замер вывода списка: построчный print против блочного render_expenses."""
+    from fintracker.models import Expense
+    from fintracker.render import render_expenses
+
+    expenses = [Expense("еда", -i, f"Операция {i}", "2025-01-15 12:00:00") for i in range(count)]
+    with open(os.devnull, "w", buffering=1) as devnull:
+        start = time.perf_counter()
+        with redirect_stdout(devnull):
+            for i, expense in enumerate(expenses, 1):
+                sign = "-" if expense.amount < 0 else "+"
+                print(f"{i}. {expense.date} | {expense.category:15} | "
+                      f"{sign} {abs(expense.amount):8.2f} руб. | {expense.description}")
+        report("print построчно", count, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        render_expenses(expenses, "table", devnull)
+        report("render_expenses (блоки по 64 КБ)", count, time.perf_counter() - start)
+
+
+def bench_sync(count: int = 200000, differing: int = 20):
+    """Замер синхронизации двух больших почти одинаковых баз.
+
+    Обе базы содержат одну историю из ``count`` операций за пять лет,
+    и в каждую добавлено по ``differing`` своих операций в разные дни.
+    """
+    from fintracker.database import run_write, _insert_expenses, snapshot
+    from fintracker.sync import sync_ledgers
+
+    with temporary_database():
+        local_file = fintracker.database.DATABASE_FILE
+        remote_file = os.path.join(os.path.dirname(local_file), "remote.db")
+        history = [("еда", -(i % 5000), f"Операция {i}",
+                    f"{2020 + i % 5}-{1 + i % 12:02d}-{1 + i % 28:02d} {i % 24:02d}:00:00") for i in range(count)]
+        run_write(lambda cursor: _insert_expenses(cursor, history))
+        snapshot(remote_file)
+
+        for path, name in ((local_file, "ноутбук"), (remote_file, "сервер")):
+            rows = [("кафе", -i, f"{name} {i}", f"2024-{1 + i % 12:02d}-{1 + i % 28:02d} 21:00:00")
+                    for i in range(differing)]
+            run_write(lambda cursor: _insert_expenses(cursor, rows), path=path)
+
+        with redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            stats = sync_ledgers(remote_file)
+            elapsed = time.perf_counter() - start
+        report(f"sync (перенесено {stats['pulled'] + stats['pushed']})", count, elapsed)
+
+        with redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            stats = sync_ledgers(remote_file)
+            elapsed = time.perf_counter() - start
+        report(f"sync одинаковых баз ({stats['ranges']} диапазонов)", count, elapsed)
+
+
+def bench_batch_report(count: int = 200000, months: int = 12):
+    """Замер пакета месячных отчетов по сравнению с отдельными отчетами за каждый месяц."""
+    from fintracker.database import run_write, _insert_expenses
+    from fintracker.report import generate_category_report, generate_batch_reports, parse_months, _month_dates
+    from fintracker.storage import ExpenseQuery
+
+    with temporary_database():
+        rows = [(f"категория {i % 40}", -(i % 5000), f"Операция {i}",
+                 f"{2020 + i % 5}-{1 + i % 12:02d}-{1 + i % 28:02d} {i % 24:02d}:00:00", None,
+                 ("main", "card")[i % 2]) for i in range(count)]
+        run_write(lambda cursor: _insert_expenses(cursor, rows))
+        directory = os.path.join(os.path.dirname(fintracker.database.DATABASE_FILE), "reports")
+        single_directory = directory + "_single"
+        os.makedirs(single_directory)
+        batch = parse_months("2024")[:months]
+
+        with redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            for month in batch:
+                for account in ("main", "card"):
+                    first, last = _month_dates(month)
+                    generate_category_report(ExpenseQuery(start_date=first, end_date=last, account=account),
+                                             os.path.join(single_directory, f"{month}_{account}.csv"))
+            elapsed = time.perf_counter() - start
+        report(f"{months * 2} отдельных отчетов по категориям", count, elapsed)
+
+        with redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            generate_batch_reports(batch, directory, by_account=True, workers=4)
+            elapsed = time.perf_counter() - start
+        report(f"report --batch ({months * 2} отчетов)", count, elapsed)
+
+
+def bench_stats_report(count: int = 200000):
+    """Замер отчета stats (агрегаты внутри SQLite) по сравнению с выгрузкой сумм в Python."""
+    import statistics
+    from fintracker.database import run_write, _insert_expenses, get_connection
+    from fintracker.report import generate_stats_report
+
+    with temporary_database():
+        rows = [(f"категория {i % 40}", -(i % 5000), f"Операция {i}",
+                 f"{2020 + i % 5}-{1 + i % 12:02d}-{1 + i % 28:02d} {i % 24:02d}:00:00") for i in range(count)]
+        run_write(lambda cursor: _insert_expenses(cursor, rows))
+
+        start = time.perf_counter()
+        conn = get_connection()
+        amounts = {}
+        for category, amount in conn.execute('SELECT category, ABS(amount) FROM expenses'):
+            amounts.setdefault(category, []).append(amount)
+        conn.close()
+        for values in amounts.values():
+            statistics.median(values), statistics.quantiles(values, n=10)[-1], statistics.stdev(values)
+        elapsed = time.perf_counter() - start
+        report("статистика по спискам в Python", count, elapsed)
+
+        start = time.perf_counter()
+        generate_stats_report("all")
+        elapsed = time.perf_counter() - start
+        report("report --type stats", count, elapsed)
+
+
+def _stress_writer(database_file: str, writer: int, count: int, results):
+    """Процесс-писатель: добавляет операции по одной, как отдельные запуски main.py add.
+
+    Описания общие для всех писателей: они одновременно добавляют одни и те же
+    новые описания в словарь.
+    """
+    fintracker.database.DATABASE_FILE = database_file
+    with redirect_stdout(io.StringIO()):
+        added = sum(add_expense("еда", -(writer * count + i + 1), f"Операция {i}") for i in range(count))
+    results.put(("writer", added))
+
+
+def _stress_reader(database_file: str, stop, results):
+    """Процесс-читатель: строит отчеты по категориям, пока работают писатели."""
+    from fintracker.report import generate_category_report
+
+    fintracker.database.DATABASE_FILE = database_file
+    reports = 0
+    with redirect_stdout(io.StringIO()):
+        while not stop.is_set():
+            generate_category_report("all")
+            reports += 1
+    results.put(("reader", reports))
+
+
+def stress_concurrent_processes(writers: int = 4, readers: int = 2, count: int = 300) -> bool:
+    """Стресс-тест: несколько процессов пишут и читают одну базу одновременно.
+
+    Returns:
+        bool: True если все операции записаны и ни одна не потеряна.
+    """
+    from fintracker.storage import get_expenses
+
+    with temporary_database():
+        database_file = fintracker.database.DATABASE_FILE
+        results = multiprocessing.Queue()
+        stop = multiprocessing.Event()
+        reader_processes = [multiprocessing.Process(target=_stress_reader, args=(database_file, stop, results))
+                            for _ in range(readers)]
+        writer_processes = [multiprocessing.Process(target=_stress_writer,
+                                                    args=(database_file, writer, count, results))
+                            for writer in range(writers)]
+
+        start = time.perf_counter()
+        for process in reader_processes + writer_processes:
+            process.start()
+        for process in writer_processes:
+            process.join()
+        elapsed = time.perf_counter() - start
+        stop.set()
+        for process in reader_processes:
+            process.join()
+
+        outcome = [results.get() for _ in range(writers + readers)]
+        added = sum(value for role, value in outcome if role == "writer")
+        reports = sum(value for role, value in outcome if role == "reader")
+        stored = len(get_expenses("all"))
+        conn = fintracker.database.get_connection()
+        try:
+            stats_count = conn.execute("SELECT count FROM category_stats WHERE category = 'еда'").fetchone()[0]
+        finally:
+            conn.close()
+
+        report(f"{writers} процесса add + {readers} читателя ({reports} отчетов)", stored, elapsed)
+        lost = writers * count - stored
+        print(f"{'':45} подтверждено: {added}, в базе: {stored}, потеряно: {lost}, в статистике: {stats_count}")
+        return added == stored == stats_count == writers * count
+
+
+if __name__ == "__main__":
+    bench_add_expense()
+    bench_list_rendering()
+    for mode in ("full", "normal", "off"):
+        bench_buffered_writer(durability=mode)
+    bench_sync()
+    bench_batch_report()
+    bench_stats_report()
+    stress_concurrent_processes()
@@ -0,0 +1,217 @@
+"""Модуль вложений к операциям (сканов чеков).
+
+Содержимое файлов читается и записывается порциями по ATTACHMENT_CHUNK
+байт через ``sqlite3.Connection.blobopen``, поэтому даже большой файл
+не копируется в память целиком. Файлы больше ATTACHMENT_INLINE_LIMIT
+хранятся отдельно в каталоге рядом с базой (по имени хэша содержимого,
+так что одинаковые файлы хранятся один раз), а в базе остается только
+путь к ним. Резервная копия базы (команда ``backup``) внешние файлы
+не включает.
+"""
+
+import hashlib
+import os
+import sqlite3
+import tempfile
+from typing import BinaryIO, Dict, Any, Iterator, List, Optional
+from . import database
+from .database import get_connection, run_write
+
+# Файлы больше этого размера, байт, хранятся вне базы: небольшие
+# блобы SQLite читает быстрее файловой системы, большие - медленнее
+ATTACHMENT_INLINE_LIMIT = 100 * 1024
+
+# Размер порции чтения и записи содержимого, байт
+ATTACHMENT_CHUNK = 64 * 1024
+
+# Колонки описания вложения (без содержимого)
+ATTACHMENT_COLUMNS = "id, expense_id, name, size, sha256, path, created_at"
+
+
+def attachments_dir() -> str:
+    """Возвращает каталог внешних файлов вложений текущей базы."""
+    return os.path.splitext(database.DATABASE_FILE)[0] + "_attachments"
+
+
+def _store_external(source: BinaryIO) -> tuple:
+    """Копирует файл в каталог вложений под именем хэша содержимого.
+
+    Returns:
+        tuple: (путь относительно каталога вложений, размер, sha256).
+    """
+    directory = attachments_dir()
+    os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    handle, temp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+    try:
+        with os.fdopen(handle, "wb") as target:
+            for chunk in iter(lambda: source.read(ATTACHMENT_CHUNK), b""):
+                target.write(chunk)
+                digest.update(chunk)
+                size += len(chunk)
+        sha256 = digest.hexdigest()
+        relative = os.path.join(sha256[:2], sha256)
+        os.makedirs(os.path.join(directory, sha256[:2]), exist_ok=True)
+        os.replace(temp_path, os.path.join(directory, relative))
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return relative, size, sha256
+
+
+def _expense_exists(expense_id: int) -> bool:
+    """Проверяет, что операция с таким номером есть в базе."""
+    conn = get_connection()
+    try:
+        cursor = conn.execute('SELECT EXISTS (SELECT 1 FROM expenses WHERE id = ?)', (expense_id,))
+        return bool(cursor.fetchone()[0])
+    except sqlite3.Error as e:
+        print(f"Ошибка проверки операции: {e}")
+        return False
+    finally:
+        conn.close()
+
+
+def add_attachment(expense_id: int, filename: str, name: str = None,
+                   inline_limit: int = ATTACHMENT_INLINE_LIMIT) -> Optional[int]:
+    """Прикрепляет файл к операции.
+
+    Файл не больше ``inline_limit`` байт записывается в базу порциями
+    через blobopen, больший файл копируется в каталог вложений.
+
+    Args:
+        expense_id (int): Номер операции.
+        filename (str): Прикрепляемый файл.
+        name (str, optional): Имя вложения. По умолчанию имя файла.
+        inline_limit (int, optional): Наибольший размер файла, хранимого в базе.
+            По умолчанию ATTACHMENT_INLINE_LIMIT.
+
+    Returns:
+        Optional[int]: Номер вложения или None при ошибке.
+
+    Raises:
+        OSError: Если файл не удалось прочитать или скопировать.
+    """
+    name = name or os.path.basename(filename)
+    if not _expense_exists(expense_id):
+        print(f"Операция {expense_id} не найдена")
+        return None
+    with open(filename, "rb") as source:
+        size = os.fstat(source.fileno()).st_size
+        external = _store_external(source) if size > inline_limit else None
+
+    def work(cursor):
+        cursor.execute('SELECT EXISTS (SELECT 1 FROM expenses WHERE id = ?)', (expense_id,))
+        if not cursor.fetchone()[0]:
+            return None
+        if external is not None:
+            path, stored_size, sha256 = external
+            cursor.execute(
+                'INSERT INTO attachments (expense_id, name, size, sha256, path) VALUES (?, ?, ?, ?, ?)',
+                (expense_id, name, stored_size, sha256, path)
+            )
+            return cursor.lastrowid
+
+        # Место под содержимое выделяется заранее, затем заполняется порциями
+        cursor.execute(
+            "INSERT INTO attachments (expense_id, name, size, sha256, data) VALUES (?, ?, ?, '', zeroblob(?))",
+            (expense_id, name, size, size)
+        )
+        attachment_id = cursor.lastrowid
+        digest = hashlib.sha256()
+        with open(filename, "rb") as source, \
+                cursor.connection.blobopen("attachments", "data", attachment_id, readonly=False) as blob:
+            for chunk in iter(lambda: source.read(ATTACHMENT_CHUNK), b""):
+                blob.write(chunk)
+                digest.update(chunk)
+        cursor.execute('UPDATE attachments SET sha256 = ? WHERE id = ?', (digest.hexdigest(), attachment_id))
+        return attachment_id
+
+    try:
+        attachment_id = run_write(work)
+    except (sqlite3.Error, ValueError) as e:
+        # ValueError: файл изменился во время записи и не помещается в выделенное место
+        print(f"Ошибка добавления вложения: {e}")
+        return None
+    if attachment_id is None:
+        print(f"Операция {expense_id} не найдена")
+    return attachment_id
+
+
+def get_attachment(attachment_id: int) -> Optional[Dict[str, Any]]:
+    """Возвращает описание вложения без содержимого.
+
+    Returns:
+        Optional[Dict]: Описание с ключами id, expense_id, name, size, sha256,
+        path, created_at или None, если вложения нет.
+    """
+    conn = get_connection()
+    try:
+        cursor = conn.execute(f'SELECT {ATTACHMENT_COLUMNS} FROM attachments WHERE id = ?', (attachment_id,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+    except sqlite3.Error as e:
+        print(f"Ошибка получения вложения: {e}")
+        return None
+    finally:
+        conn.close()
+
+
+def list_attachments(expense_id: int) -> List[Dict[str, Any]]:
+    """Возвращает описания вложений операции (без содержимого)."""
+    conn = get_connection()
+    try:
+        cursor = conn.execute(f'SELECT {ATTACHMENT_COLUMNS} FROM attachments WHERE expense_id = ? ORDER BY id',
+                              (expense_id,))
+        return [dict(row) for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        print(f"Ошибка получения вложений: {e}")
+        return []
+    finally:
+        conn.close()
+
+
+def iter_attachment(attachment_id: int, chunk_size: int = ATTACHMENT_CHUNK) -> Iterator[bytes]:
+    """Выдает содержимое вложения порциями, не загружая его в память целиком.
+
+    Args:
+        attachment_id (int): Номер вложения.
+        chunk_size (int, optional): Размер порции. По умолчанию ATTACHMENT_CHUNK.
+
+    Yields:
+        bytes: Очередная порция содержимого.
+
+    Raises:
+        ValueError: Если вложения нет.
+        OSError: Если внешний файл вложения недоступен.
+    """
+    attachment = get_attachment(attachment_id)
+    if attachment is None:
+        raise ValueError(f"Вложение {attachment_id} не найдено")
+
+    if attachment["path"] is not None:
+        with open(os.path.join(attachments_dir(), attachment["path"]), "rb") as source:
+            yield from iter(lambda: source.read(chunk_size), b"")
+        return
+
+    conn = get_connection()
+    try:
+        with conn.blobopen("attachments", "data", attachment_id) as blob:
+            yield from iter(lambda: blob.read(chunk_size), b"")
+    finally:
+        conn.close()
+
+
+def save_attachment(attachment_id: int, target: BinaryIO) -> int:
+    """Записывает содержимое вложения в двоичный поток.
+
+    Returns:
+        int: Количество записанных байт.
+    """
+    written = 0
+    for chunk in iter_attachment(attachment_id):
+        target.write(chunk)
+        written += len(chunk)
+    return written
@@ -0,0 +1,565 @@
+"""Модуль с подключаемыми движками хранения данных.
+
+Определяет общий интерфейс хранилища и две его реализации: основную
+на SQLite и быструю в памяти для временных данных и тестов.
+"""
+
+from abc import ABC, abstractmethod
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Iterator, Union
+from . import database
+from .bitmap import Bitmap
+from .models import day_number, day_to_date, month_number, DEFAULT_ACCOUNT
+from .query import ExpenseQuery
+from .sketch import QuantileSketch
+from .stats import RunningStats
+
+
+class StorageBackend(ABC):
+    """Интерфейс движка хранения операций и категорий.
+
+    Все методы возвращают данные в том же формате, что и функции
+    модуля ``database``: операции и категории - словарями, отчеты -
+    словарями с ключами 'period', 'total_expenses', 'total_amount' и т.д.
+    Движок должен реализовать все абстрактные методы, иначе его нельзя
+    создать.
+    """
+
+    @abstractmethod
+    def init(self):
+        """Подготавливает хранилище к работе."""
+
+    @abstractmethod
+    def add_expense(self, category: str, amount: float, description: str = "",
+                    date: str = None, tags: List[str] = None, account: str = None) -> bool:
+        """Добавляет операцию с метками на счет. Возвращает True если операция добавлена."""
+
+    @abstractmethod
+    def import_expenses(self, rows: List[tuple], on_conflict: str = "ignore") -> Dict[str, int]:
+        """Импортирует пакет операций с дедупликацией по хешу содержимого."""
+
+    @abstractmethod
+    def get_expenses(self, period: Union[str, ExpenseQuery] = "all") -> List[Dict[str, Any]]:
+        """Возвращает операции за период или по запросу в порядке убывания даты."""
+
+    def iter_expenses(self, period: Union[str, ExpenseQuery] = "all") -> Iterator[Dict[str, Any]]:
+        """Построчно выдает операции за период или по запросу в порядке убывания даты."""
+        return iter(self.get_expenses(period))
+
+    @abstractmethod
+    def iter_changes(self, since: int = 0, chunk_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """Выдает изменения операций с номером больше since в порядке номеров."""
+
+    @abstractmethod
+    def add_category(self, name: str, category_type: str, parent: str = None, account: str = None) -> bool:
+        """Добавляет категорию, при необходимости вложенную в родительскую.
+
+        Категория без счета общая для всех счетов. Возвращает False для
+        дубликата или несуществующего родителя.
+        """
+
+    @abstractmethod
+    def get_categories(self, account: str = None) -> List[Dict[str, Any]]:
+        """Возвращает категории (для счета - общие и категории счета) в алфавитном порядке."""
+
+    @abstractmethod
+    def category_report(self, period: Union[str, ExpenseQuery] = "month") -> Dict[str, Any]:
+        """Возвращает суммы по категориям за период или по запросу."""
+
+    @abstractmethod
+    def period_report(self, start_date: str, end_date: str, bucket: str = "day",
+                      query: ExpenseQuery = None) -> Dict[str, Any]:
+        """Возвращает суммы по дням, неделям или месяцам между двумя датами включительно."""
+
+    @abstractmethod
+    def timeseries_report(self, period: Union[str, ExpenseQuery] = "all", bucket: str = "month") -> Dict[str, Any]:
+        """Возвращает доходы и расходы по интервалам за один проход."""
+
+    @abstractmethod
+    def pivot_report(self, period: Union[str, ExpenseQuery] = "all", bucket: str = "month") -> Dict[str, Any]:
+        """Возвращает сводную таблицу категория x интервал за один проход."""
+
+    @abstractmethod
+    def anomaly_report(self, period: Union[str, ExpenseQuery] = "all") -> Dict[str, Any]:
+        """Возвращает операции, отмеченные при добавлении как необычные для категории."""
+
+    @abstractmethod
+    def tree_report(self, period: Union[str, ExpenseQuery] = "month") -> Dict[str, Any]:
+        """Возвращает суммы по поддеревьям категорий в порядке обхода дерева."""
+
+    @abstractmethod
+    def tag_report(self, period: Union[str, ExpenseQuery] = "all") -> Dict[str, Any]:
+        """Возвращает количество и сумму операций по каждой метке."""
+
+    @abstractmethod
+    def account_report(self, period: Union[str, ExpenseQuery] = "all") -> Dict[str, Any]:
+        """Возвращает доходы, расходы и итог по каждому счету за один проход."""
+
+    @abstractmethod
+    def merchant_report(self, period: Union[str, ExpenseQuery] = "all") -> Dict[str, Any]:
+        """Возвращает количество и сумму операций по каждому описанию."""
+
+    @abstractmethod
+    def stats_report(self, period: Union[str, ExpenseQuery] = "all") -> Dict[str, Any]:
+        """Возвращает среднее, медиану, p90 и стандартное отклонение сумм по категориям."""
+
+    @abstractmethod
+    def monthly_category_totals(self, query: ExpenseQuery) -> List[tuple]:
+        """Возвращает кортежи (номер месяца, счет, категория, операций, сумма) за один проход."""
+
+    @abstractmethod
+    def distribution_report(self, period: Union[str, ExpenseQuery] = "month") -> Dict[str, Any]:
+        """Возвращает количество, медиану, p90 и p99 сумм по категориям."""
+
+
+class SQLiteBackend(StorageBackend):
+    """Движок хранения на SQLite (используется по умолчанию)."""
+
+    def init(self):
+        database.init_database()
+
+    def add_expense(self, category: str, amount: float, description: str = "",
+                    date: str = None, tags: List[str] = None, account: str = None) -> bool:
+        return database.add_expense_to_db(category, amount, description, date, tags=tags, account=account)
+
+    def import_expenses(self, rows: List[tuple], on_conflict: str = "ignore") -> Dict[str, int]:
+        return database.import_expenses_to_db(rows, on_conflict)
+
+    def get_expenses(self, period: Union[str, ExpenseQuery] = "all") -> List[Dict[str, Any]]:
+        return database.get_expenses_from_db(period)
+
+    def iter_expenses(self, period: Union[str, ExpenseQuery] = "all") -> Iterator[Dict[str, Any]]:
+        return database.iter_expenses_from_db(period)
+
+    def iter_changes(self, since: int = 0, chunk_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        return database.iter_changes_from_db(since, chunk_size)
+
+    def add_category(self, name: str, category_type: str, parent: str = None, account: str = None) -> bool:
+        return database.add_category_to_db(name, category_type, parent, account)
+
+    def get_categories(self, account: str = None) -> List[Dict[str, Any]]:
+        return database.get_categories_from_db(account)
+
+    def category_report(self, period: Union[str, ExpenseQuery] = "month") -> Dict[str, Any]:
+        return database.get_category_report_from_db(period)
+
+    def period_report(self, start_date: str, end_date: str, bucket: str = "day",
+                      query: ExpenseQuery = None) -> Dict[str, Any]:
+        return database.get_period_report_from_db(start_date, end_date, bucket, query)
+
+    def timeseries_report(self, period: Union[str, ExpenseQuery] = "all", bucket: str = "month") -> Dict[str, Any]:
+        return database.get_timeseries_report_from_db(period, bucket)
+
+    def pivot_report(self, period: Union[str, ExpenseQuery] = "all", bucket: str = "month") -> Dict[str, Any]:
+        return database.get_pivot_report_from_db(period, bucket)
+
+    def anomaly_report(self, period: Union[str, ExpenseQuery] = "all") -> Dict[str, Any]:
+        return database.get_anomaly_report_from_db(period)
+
+    def tree_report(self, period: Union[str, ExpenseQuery] = "month") -> Dict[str, Any]:
+        return database.get_category_tree_report_from_db(period)
+
+    def tag_report(self, period: Union[str, ExpenseQuery] = "all") -> Dict[str, Any]:
+        return database.get_tag_report_from_db(period)
+
+    def account_report(self, period: Union[str, ExpenseQuery] = "all") -> Dict[str, Any]:
+        return database.get_account_report_from_db(period)
+
+    def merchant_report(self, period: Union[str, ExpenseQuery] = "all") -> Dict[str, Any]:
+        return database.get_merchant_report_from_db(period)
+
+    def stats_report(self, period: Union[str, ExpenseQuery] = "all") -> Dict[str, Any]:
+        return database.get_stats_report_from_db(period)
+
+    def monthly_category_totals(self, query: ExpenseQuery) -> List[tuple]:
+        return database.get_monthly_category_totals_from_db(query)
+
+    def distribution_report(self, period: Union[str, ExpenseQuery] = "month") -> Dict[str, Any]:
+        return database.get_distribution_report_from_db(period)
+
+
+class MemoryBackend(StorageBackend):
+    """Движок хранения в памяти процесса.
+
+    Операции индексируются отсортированным списком дат, поэтому выборка
+    за период сводится к двоичному поиску диапазона. Суммы по категориям
+    поддерживаются в хеш-таблице и для периода 'all' не требуют прохода
+    по операциям, а статистика сумм для поиска аномалий и битовые
+    множества меток обновляются при каждой вставке. Данные не сохраняются
+    между запусками.
+    """
+
+    def __init__(self):
+        self.init()
+
+    def init(self):
+        self._expenses = {}
+        self._date_index = []
+        self._hashes = {}
+        self._categories = {}
+        self._parents = {}
+        self._category_accounts = {}
+        self._by_category = {}
+        self._stats = {}
+        self._tags = {}
+        self._changes = []
+
+    def _insert(self, row: tuple, on_conflict: str, batch_hashes: set = None) -> bool:
+        """Вставляет одну операцию, обновляя индексы и агрегаты."""
+        category, amount, description, date, external_id, account = (tuple(row) + (None, None))[:6]
+        account = account or DEFAULT_ACCOUNT
+        content_hash = database.compute_content_hash(date, amount, category, description, external_id, account)
+        if batch_hashes is not None:
+            on_conflict = database._row_conflict_mode(on_conflict, external_id, content_hash, batch_hashes)
+
+        if content_hash in self._hashes and on_conflict != "keep":
+            if on_conflict == "update":
+                old_id = self._hashes[content_hash]
+                anomaly = self._expenses[old_id]["anomaly"]
+                self._remove(old_id)
+                self._hashes[content_hash] = self._append(category, amount, description, date, anomaly, account)
+                for bitmap in self._tags.values():
+                    if old_id in bitmap:
+                        bitmap.discard(old_id)
+                        bitmap.add(self._hashes[content_hash])
+            return False
+
+        stats = self._stats.setdefault(category, RunningStats())
+        anomaly = database.anomaly_score(stats, amount)
+        stats.add(abs(amount))
+        expense_id = self._append(category, amount, description, date, anomaly, account)
+        self._hashes.setdefault(content_hash, expense_id)
+        if batch_hashes is not None:
+            batch_hashes.add(content_hash)
+        return True
+
+    def _append(self, category: str, amount: float, description: str, date: str,
+                anomaly: float = None, account: str = DEFAULT_ACCOUNT) -> int:
+        """Добавляет запись операции и возвращает ее номер (с 1, как в SQLite)."""
+        expense_id = len(self._expenses) + 1
+        self._expenses[expense_id] = {
+            "id": expense_id,
+            "category": category,
+            "amount": amount,
+            "description": description,
+            "date": date,
+            "account": account,
+            "anomaly": anomaly
+        }
+        insort(self._date_index, (date, expense_id))
+        totals = self._by_category.setdefault(category, [0, 0])
+        totals[0] += 1
+        totals[1] += amount
+        self._log_change("insert", expense_id)
+        return expense_id
+
+    def _log_change(self, op: str, expense_id: int):
+        """Добавляет запись в журнал изменений."""
+        self._changes.append((op, expense_id, datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')))
+
+    def _remove(self, expense_id: int):
+        """Удаляет запись операции из индексов и агрегатов."""
+        expense = self._expenses[expense_id]
+        self._date_index.pop(bisect_left(self._date_index, (expense["date"], expense_id)))
+        totals = self._by_category[expense["category"]]
+        totals[0] -= 1
+        totals[1] -= expense["amount"]
+        self._expenses[expense_id] = None
+        self._log_change("delete", expense_id)
+
+    def _range(self, start: str, end: str) -> List[Dict[str, Any]]:
+        """Возвращает операции с датой в диапазоне [start, end] по возрастанию даты."""
+        low = bisect_left(self._date_index, (start,))
+        high = bisect_right(self._date_index, (end, len(self._expenses) + 1))
+        return [self._expenses[expense_id] for _, expense_id in self._date_index[low:high]]
+
+    def _select(self, query: ExpenseQuery) -> List[Dict[str, Any]]:
+        """Возвращает операции по запросу в порядке возрастания даты.
+
+        Диапазон дат выбирается двоичным поиском по индексу, остальные
+        фильтры проверяются только для операций внутри диапазона.
+        """
+        query = database.apply_tag_index(query, self._tags)
+        start, end = "", "\uffff"
+        if query.period == "today":
+            start = datetime.now().strftime('%Y-%m-%d')
+            end = start + "\uffff"
+        elif query.period == "month":
+            start = datetime.now().strftime('%Y-%m')
+            end = start + "\uffff"
+        if query.start_date:
+            start = max(start, query.start_date)
+        if query.end_date:
+            end = min(end, query.end_date + "\uffff")
+
+        expenses = self._range(start, end)
+        if query.replace(period="all", start_date=None, end_date=None) == ExpenseQuery():
+            return expenses
+        return [expense for expense in expenses if query.matches(expense)]
+
+    @staticmethod
+    def _bucket(date: str, bucket: str) -> str:
+        """Возвращает подпись интервала для даты операции."""
+        if bucket == "week":
+            return day_to_date((day_number(date) - 4) // 7 * 7 + 4)
+        if bucket == "month":
+            return date[:7]
+        if bucket == "year":
+            return date[:4]
+        return date[:10]
+
+    def add_expense(self, category: str, amount: float, description: str = "",
+                    date: str = None, tags: List[str] = None, account: str = None) -> bool:
+        date = date or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self._insert((category, amount, description, date, None, account), "keep")
+        for tag in database.normalize_tags(tags):
+            self._tags.setdefault(tag, Bitmap()).add(len(self._expenses))
+        return True
+
+    def import_expenses(self, rows: List[tuple], on_conflict: str = "ignore") -> Dict[str, int]:
+        if on_conflict not in database.CONFLICT_MODES:
+            raise ValueError(f"Неизвестный режим обработки дубликатов: '{on_conflict}'")
+        batch_hashes = set()
+        added = sum(self._insert(row, on_conflict, batch_hashes) for row in rows)
+        return {"inserted": added, "duplicates": len(rows) - added}
+
+    def get_expenses(self, period: Union[str, ExpenseQuery] = "all") -> List[Dict[str, Any]]:
+        return [{field: expense[field] for field in ("id", "category", "amount", "description", "date", "account")}
+                for expense in reversed(self._select(ExpenseQuery.coerce(period)))]
+
+    def iter_changes(self, since: int = 0, chunk_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        # Изменение записи в памяти - это удаление и вставка под новым номером
+        for seq, (op, expense_id, changed_at) in enumerate(self._changes[since:], since + 1):
+            expense = self._expenses[expense_id] if op != "delete" else None
+            change = {"seq": seq, "op": op, "expense_id": expense_id, "changed_at": changed_at}
+            change.update({field: expense[field] if expense else None
+                           for field in ("category", "amount", "description", "date", "account")})
+            yield change
+
+    def add_category(self, name: str, category_type: str, parent: str = None, account: str = None) -> bool:
+        if parent is not None and parent not in self._categories:
+            print(f"Родительская категория '{parent}' не найдена")
+            return False
+        if name in self._categories:
+            print(f"Категория '{name}' уже существует")
+            return False
+        self._categories[name] = category_type
+        self._parents[name] = parent
+        self._category_accounts[name] = account
+        return True
+
+    def get_categories(self, account: str = None) -> List[Dict[str, Any]]:
+        return [{"name": name, "type": self._categories[name], "parent": self._parents[name],
+                 "account": self._category_accounts[name]}
+                for name in sorted(self._categories)
+                if not account or self._category_accounts[name] in (None, account)]
+
+    def category_report(self, period: Union[str, ExpenseQuery] = "month") -> Dict[str, Any]:
+        query = ExpenseQuery.coerce(period)
+        if query == ExpenseQuery():
+            totals = {category: total for category, (count, total) in self._by_category.items() if count}
+            count = sum(count for count, _ in self._by_category.values())
+        else:
+            totals = {}
+            expenses = self._select(query)
+            for expense in expenses:
+                totals[expense["category"]] = totals.get(expense["category"], 0) + expense["amount"]
+            count = len(expenses)
+
+        return {
+            "period": query.describe(),
+            "total_expenses": count,
+            "total_amount": sum(totals.values()),
+            "categories": sorted(totals.items(), key=lambda item: item[1], reverse=True),
+            "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+    def period_report(self, start_date: str, end_date: str, bucket: str = "day",
+                      query: ExpenseQuery = None) -> Dict[str, Any]:
+        query = ExpenseQuery.coerce(query).replace(period="all", start_date=start_date, end_date=end_date)
+        expenses = self._select(query)
+        daily_totals = {}
+        for expense in expenses:
+            day = self._bucket(expense["date"], bucket)
+            daily_totals[day] = daily_totals.get(day, 0) + expense["amount"]
+
+        return {
+            "period": query.describe(),
+            "total_expenses": len(expenses),
+            "total_amount": sum(expense["amount"] for expense in expenses),
+            "daily_totals": daily_totals,
+            "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+    def timeseries_report(self, period: Union[str, ExpenseQuery] = "all", bucket: str = "month") -> Dict[str, Any]:
+        query = ExpenseQuery.coerce(period)
+        series = {}
+        for expense in self._select(query):
+            row = series.setdefault(self._bucket(expense["date"], bucket), [0, 0.0, 0.0, 0])
+            amount = expense["amount"]
+            row[0] += 1
+            if amount > 0:
+                row[1] += amount
+            elif amount < 0:
+                row[2] += amount
+            row[3] += amount
+
+        timeseries = [(label, *row) for label, row in sorted(series.items())]
+        return {
+            "period": query.describe(),
+            "total_expenses": sum(row[1] for row in timeseries),
+            "total_amount": sum(row[4] for row in timeseries),
+            "timeseries": timeseries,
+            "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+    def pivot_report(self, period: Union[str, ExpenseQuery] = "all", bucket: str = "month") -> Dict[str, Any]:
+        query = ExpenseQuery.coerce(period)
+        cells = {}
+        for expense in self._select(query):
+            cell = cells.setdefault((expense["category"], self._bucket(expense["date"], bucket)), [0, 0])
+            cell[0] += expense["amount"]
+            cell[1] += 1
+
+        pivot = database.build_pivot([(category, label, total, count)
+                                      for (category, label), (total, count) in cells.items()])
+        return {
+            "period": query.describe(),
+            "total_expenses": pivot.pop("count"),
+            "total_amount": sum(row[2] for row in pivot["rows"]),
+            "pivot": pivot,
+            "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+    def anomaly_report(self, period: Union[str, ExpenseQuery] = "all") -> Dict[str, Any]:
+        query = ExpenseQuery.coerce(period).replace(anomalies=True)
+        anomalies = [(expense["date"], expense["category"], expense["amount"], expense["description"],
+                      expense["anomaly"]) for expense in reversed(self._select(query))]
+        return {
+            "period": query.describe(),
+            "total_expenses": len(anomalies),
+            "total_amount": sum(row[2] for row in anomalies),
+            "anomalies": anomalies,
+            "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+    def tree_report(self, period: Union[str, ExpenseQuery] = "month") -> Dict[str, Any]:
+        query = ExpenseQuery.coerce(period)
+        totals = {}
+        for expense in self._select(query):
+            category = expense["category"]
+            own = category
+            while category is not None:
+                node = totals.setdefault(category, [0, 0, 0])
+                node[0] += expense["amount"]
+                node[1] += expense["amount"] if category == own else 0
+                node[2] += 1
+                category = self._parents.get(category)
+        tree = database.build_tree(self._parents, {name: tuple(node) for name, node in totals.items()})
+        roots = [row for row in tree if row[1] == 0]
+        return {
+            "period": query.describe(),
+            "total_expenses": sum(row[4] for row in roots),
+            "total_amount": sum(row[2] for row in roots),
+            "tree": tree,
+            "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+    def tag_report(self, period: Union[str, ExpenseQuery] = "all") -> Dict[str, Any]:
+        query = ExpenseQuery.coerce(period)
+        amounts = {expense["id"]: expense["amount"] for expense in self._select(query)}
+        return {
+            "period": query.describe(),
+            "total_expenses": len(amounts),
+            "total_amount": sum(amounts.values()),
+            "tags": database.build_tag_totals(self._tags, amounts),
+            "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+    def account_report(self, period: Union[str, ExpenseQuery] = "all") -> Dict[str, Any]:
+        query = ExpenseQuery.coerce(period)
+        totals = {}
+        for expense in self._select(query):
+            amount = expense["amount"]
+            row = totals.setdefault(expense["account"], [0, 0.0, 0.0, 0.0])
+            row[0] += 1
+            if amount > 0:
+                row[1] += amount
+            elif amount < 0:
+                row[2] += amount
+            row[3] += amount
+        accounts = [(account, *totals[account]) for account in sorted(totals)]
+        return {
+            "period": query.describe(),
+            "total_expenses": sum(row[1] for row in accounts),
+            "total_amount": sum(row[4] for row in accounts),
+            "accounts": accounts,
+            "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+    def merchant_report(self, period: Union[str, ExpenseQuery] = "all") -> Dict[str, Any]:
+        query = ExpenseQuery.coerce(period)
+        totals = {}
+        for expense in self._select(query):
+            total = totals.setdefault(expense["description"] or "", [0, 0.0])
+            total[0] += 1
+            total[1] += expense["amount"]
+        merchants = sorted(((text, count, amount) for text, (count, amount) in totals.items()),
+                           key=lambda row: (-abs(row[2]), row[0]))
+        return {
+            "period": query.describe(),
+            "total_expenses": sum(row[1] for row in merchants),
+            "total_amount": sum(row[2] for row in merchants),
+            "merchants": merchants,
+            "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+    def stats_report(self, period: Union[str, ExpenseQuery] = "all") -> Dict[str, Any]:
+        query = ExpenseQuery.coerce(period)
+        groups = {}
+        for expense in self._select(query):
+            group = groups.setdefault(expense["category"], [0.0, RunningStats(), QuantileSketch()])
+            group[0] += expense["amount"]
+            group[1].add(abs(expense["amount"]))
+            group[2].add(abs(expense["amount"]))
+        stats = [
+            (category, running.count, total, running.mean, sketch.quantile(0.5), sketch.quantile(0.9),
+             running.stddev)
+            for category, (total, running, sketch) in sorted(groups.items())
+        ]
+        return {
+            "period": query.describe(),
+            "total_expenses": sum(row[1] for row in stats),
+            "total_amount": sum(row[2] for row in stats),
+            "stats": stats,
+            "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+    def distribution_report(self, period: Union[str, ExpenseQuery] = "month") -> Dict[str, Any]:
+        query = database._month_bounds(ExpenseQuery.coerce(period))
+        sketches = {}
+        totals = {}
+        for expense in self._select(query):
+            sketches.setdefault(expense["category"], QuantileSketch()).add(abs(expense["amount"]))
+            totals[expense["category"]] = totals.get(expense["category"], 0) + expense["amount"]
+        distribution = [
+            (category, sketch.count, sketch.quantile(0.5), sketch.quantile(0.9), sketch.quantile(0.99))
+            for category, sketch in sorted(sketches.items())
+        ]
+        return {
+            "period": query.describe(),
+            "total_expenses": sum(sketch.count for sketch in sketches.values()),
+            "total_amount": sum(totals.values()),
+            "distribution": distribution,
+            "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+    def monthly_category_totals(self, query: ExpenseQuery) -> List[tuple]:
+        totals = {}
+        for expense in self._select(query):
+            key = (month_number(expense["date"]), expense.get("account", DEFAULT_ACCOUNT), expense["category"])
+            total = totals.setdefault(key, [0, 0.0])
+            total[0] += 1
+            total[1] += expense["amount"]
+        return [key + tuple(total) for key, total in totals.items()]
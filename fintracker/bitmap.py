@@ -0,0 +1,198 @@
+"""Модуль со сжатым битовым множеством целых чисел.
+
+Множество делится на блоки по 65536 значений (старшие 16 бит числа).
+Разреженный блок хранится отсортированным массивом младших 16 бит
+(2 байта на значение), плотный - битовой строкой в целом числе Python,
+побитовые операции над которой выполняются на C. Пересечение,
+объединение и разность вычисляются поблочно, поэтому блоки,
+отсутствующие в одном из операндов, не просматриваются вовсе.
+"""
+
+from array import array
+from bisect import bisect_left
+from itertools import groupby
+from typing import Iterable, Iterator, Union
+
+CHUNK_BITS = 16
+CHUNK_SIZE = 1 << CHUNK_BITS
+LOW_MASK = CHUNK_SIZE - 1
+
+# Блок с большим числом значений хранится битовой строкой (8 КБ на блок)
+ARRAY_LIMIT = 4096
+
+Container = Union[array, int]
+
+
+def _to_bits(container: Container) -> int:
+    """Возвращает блок в виде битовой строки."""
+    if isinstance(container, int):
+        return container
+    bits = bytearray(CHUNK_SIZE // 8)
+    for low in container:
+        bits[low >> 3] |= 1 << (low & 7)
+    return int.from_bytes(bits, "little")
+
+
+def _bit_positions(bits: int) -> Iterator[int]:
+    """Перебирает номера установленных битов по возрастанию."""
+    data = bits.to_bytes(CHUNK_SIZE // 8, "little")
+    return (index << 3 | bit for index, byte in enumerate(data) if byte for bit in range(8) if byte >> bit & 1)
+
+
+def _from_bits(bits: int) -> Container:
+    """Упаковывает битовую строку в блок подходящего вида (None для пустого)."""
+    if not bits:
+        return None
+    if bits.bit_count() > ARRAY_LIMIT:
+        return bits
+    return array("H", _bit_positions(bits))
+
+
+def _pack(values: array) -> Container:
+    """Выбирает вид блока для отсортированного массива значений."""
+    if not values:
+        return None
+    return _to_bits(values) if len(values) > ARRAY_LIMIT else values
+
+
+def _and(left: Container, right: Container) -> Container:
+    """Пересечение двух блоков."""
+    if isinstance(left, int) and isinstance(right, int):
+        return _from_bits(left & right)
+    if isinstance(left, int):
+        left, right = right, left
+    if isinstance(right, int):
+        data = right.to_bytes(CHUNK_SIZE // 8, "little")
+        return _pack(array("H", [low for low in left if data[low >> 3] >> (low & 7) & 1]))
+    if len(left) > len(right):
+        left, right = right, left
+    members = set(right)
+    return _pack(array("H", [low for low in left if low in members]))
+
+
+def _or(left: Container, right: Container) -> Container:
+    """Объединение двух блоков."""
+    if isinstance(left, int) or isinstance(right, int):
+        return _to_bits(left) | _to_bits(right)
+    return _pack(array("H", sorted(set(left).union(right))))
+
+
+def _sub(left: Container, right: Container) -> Container:
+    """Разность двух блоков."""
+    if isinstance(left, int):
+        return _from_bits(left & ~_to_bits(right))
+    if isinstance(right, int):
+        data = right.to_bytes(CHUNK_SIZE // 8, "little")
+        return _pack(array("H", [low for low in left if not data[low >> 3] >> (low & 7) & 1]))
+    members = set(right)
+    return _pack(array("H", [low for low in left if low not in members]))
+
+
+class Bitmap:
+    """Сжатое множество неотрицательных целых чисел (например, rowid операций).
+
+    Поддерживает операторы ``&`` (пересечение), ``|`` (объединение) и
+    ``-`` (разность), проверку ``in``, ``len`` и перебор по возрастанию.
+    """
+
+    __slots__ = ("_chunks",)
+
+    def __init__(self, values: Iterable[int] = ()):
+        """Создает множество из значений в любом порядке.
+
+        Args:
+            values (Iterable[int], optional): Начальные значения. По умолчанию пустое.
+        """
+        self._chunks = {}
+        for high, lows in groupby(sorted(set(values)), key=lambda value: value >> CHUNK_BITS):
+            container = _pack(array("H", [value & LOW_MASK for value in lows]))
+            if container is not None:
+                self._chunks[high] = container
+
+    @classmethod
+    def _from_chunks(cls, chunks: dict) -> "Bitmap":
+        """Создает множество из готовых блоков, отбрасывая пустые."""
+        bitmap = cls()
+        bitmap._chunks = {high: container for high, container in chunks.items() if container is not None}
+        return bitmap
+
+    def add(self, value: int):
+        """Добавляет значение."""
+        high, low = value >> CHUNK_BITS, value & LOW_MASK
+        container = self._chunks.get(high)
+        if container is None:
+            self._chunks[high] = array("H", [low])
+        elif isinstance(container, int):
+            self._chunks[high] = container | 1 << low
+        else:
+            position = bisect_left(container, low)
+            if position == len(container) or container[position] != low:
+                # Массивы блоков могут разделяться с результатами операций, поэтому копируются
+                container = array("H", container)
+                container.insert(position, low)
+                self._chunks[high] = _to_bits(container) if len(container) > ARRAY_LIMIT else container
+
+    def discard(self, value: int):
+        """Удаляет значение, если оно есть."""
+        high, low = value >> CHUNK_BITS, value & LOW_MASK
+        container = self._chunks.get(high)
+        if container is None:
+            return
+        if isinstance(container, int):
+            container = _from_bits(container & ~(1 << low))
+        else:
+            position = bisect_left(container, low)
+            if position < len(container) and container[position] == low:
+                container = array("H", container)
+                del container[position]
+            container = container or None
+        if container is None:
+            del self._chunks[high]
+        else:
+            self._chunks[high] = container
+
+    def __contains__(self, value: int) -> bool:
+        container = self._chunks.get(value >> CHUNK_BITS)
+        if container is None:
+            return False
+        low = value & LOW_MASK
+        if isinstance(container, int):
+            return bool(container >> low & 1)
+        position = bisect_left(container, low)
+        return position < len(container) and container[position] == low
+
+    def __len__(self) -> int:
+        return sum(container.bit_count() if isinstance(container, int) else len(container)
+                   for container in self._chunks.values())
+
+    def __bool__(self) -> bool:
+        return bool(self._chunks)
+
+    def __iter__(self) -> Iterator[int]:
+        for high in sorted(self._chunks):
+            base = high << CHUNK_BITS
+            container = self._chunks[high]
+            if isinstance(container, int):
+                container = _bit_positions(container)
+            for low in container:
+                yield base | low
+
+    def __and__(self, other: "Bitmap") -> "Bitmap":
+        return Bitmap._from_chunks({high: _and(container, other._chunks[high])
+                                    for high, container in self._chunks.items() if high in other._chunks})
+
+    def __or__(self, other: "Bitmap") -> "Bitmap":
+        chunks = dict(self._chunks)
+        for high, container in other._chunks.items():
+            chunks[high] = _or(chunks[high], container) if high in chunks else container
+        return Bitmap._from_chunks(chunks)
+
+    def __sub__(self, other: "Bitmap") -> "Bitmap":
+        return Bitmap._from_chunks({high: _sub(container, other._chunks[high]) if high in other._chunks
+                                    else container for high, container in self._chunks.items()})
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Bitmap) and list(self) == list(other)
+
+    def __repr__(self) -> str:
+        return f"Bitmap({len(self)} значений, {len(self._chunks)} блоков)"
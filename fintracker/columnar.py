@@ -0,0 +1,274 @@
+"""Модуль колоночного экспорта операций в двоичном формате.
+
+Каждая колонка сохраняется отдельным файлом в формате NumPy ``.npy``
+(версия 1.0, порядок байт little-endian), категории кодируются
+целочисленными индексами словаря, а описание каталога хранится в
+файле ``ledger.json``. Загрузчик отображает файлы в память, поэтому
+открытие даже многолетней истории не требует разбора и копирования
+данных. NumPy для записи не нужен; если он установлен, загрузчик
+возвращает массивы ``numpy.ndarray``, иначе - ``memoryview``.
+"""
+
+import ast
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from datetime import datetime, timedelta
+from typing import Dict, Any
+from .models import Expense, DATE_FORMAT, format_date
+from .storage import iter_expenses, ExpenseQuery
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MANIFEST_FILE = "ledger.json"
+FORMAT_VERSION = 1
+
+# Колонки: имя -> (тип npy, код типа array/memoryview)
+COLUMNS = {
+    "ts": ("<i8", "q"),
+    "amount": ("<f8", "d"),
+    "category": ("<i4", "i"),
+    "description_offsets": ("<i8", "q"),
+    "description_data": ("|u1", "B"),
+}
+
+NPY_MAGIC = b"\x93NUMPY\x01\x00"
+
+# Заголовок фиксированной длины, чтобы дописать размер после записи данных
+NPY_HEADER_SIZE = 128
+
+# Количество значений, накапливаемых в памяти перед записью в файл
+FLUSH_ROWS = 65536
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def _timestamp(value: str) -> int:
+    """Возвращает секунды от 1970-01-01, как колонка ``expenses.ts``."""
+    return int((datetime.fromisoformat(format_date(value)) - EPOCH).total_seconds())
+
+
+def _npy_header(dtype: str, length: int) -> bytes:
+    """Формирует заголовок файла .npy для одномерного массива."""
+    header = f"{{'descr': '{dtype}', 'fortran_order': False, 'shape': ({length},), }}"
+    header = header.ljust(NPY_HEADER_SIZE - len(NPY_MAGIC) - 2 - 1) + "\n"
+    return NPY_MAGIC + struct.pack("<H", len(header)) + header.encode("latin1")
+
+
+class _ColumnFile:
+    """Файл одной колонки, записываемый порциями."""
+
+    def __init__(self, path: str, dtype: str, code: str):
+        self.path = path
+        self.dtype = dtype
+        self.length = 0
+        self.values = array(code)
+        self.file = open(path, "wb")
+        self.file.write(_npy_header(dtype, 0))
+
+    def flush(self):
+        if sys.byteorder == "big":
+            self.values.byteswap()
+        self.values.tofile(self.file)
+        self.length += len(self.values)
+        del self.values[:]
+
+    def close(self):
+        self.flush()
+        self.file.seek(0)
+        self.file.write(_npy_header(self.dtype, self.length))
+        self.file.close()
+
+
+def export_columnar(directory: str, period: str = "all", account: str = None) -> int:
+    """Экспортирует операции за период в колоночные файлы .npy.
+
+    Операции записываются в порядке убывания даты, как их выдает
+    хранилище. Файл ``ledger.json`` со словарем категорий записывается
+    последним, поэтому незавершенный экспорт не открывается загрузчиком.
+
+    Args:
+        directory (str): Каталог для файлов экспорта (создается при необходимости).
+        period (str, optional): Период ('today', 'month', 'all'). По умолчанию 'all'.
+        account (str, optional): Счет. По умолчанию операции всех счетов.
+
+    Returns:
+        int: Количество экспортированных операций.
+    """
+    os.makedirs(directory, exist_ok=True)
+    manifest_path = os.path.join(directory, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    columns = {name: _ColumnFile(os.path.join(directory, f"{name}.npy"), dtype, code)
+               for name, (dtype, code) in COLUMNS.items()}
+    categories = {}
+    count = 0
+    try:
+        columns["description_offsets"].values.append(0)
+        offset = 0
+        for expense in iter_expenses(ExpenseQuery(period, account=account)):
+            code = categories.setdefault(expense.category, len(categories))
+            description = (expense.description or "").encode("utf-8")
+            offset += len(description)
+
+            columns["ts"].values.append(_timestamp(expense.date))
+            columns["amount"].values.append(expense.amount)
+            columns["category"].values.append(code)
+            columns["description_offsets"].values.append(offset)
+            columns["description_data"].values.frombytes(description)
+
+            count += 1
+            if count % FLUSH_ROWS == 0:
+                for column in columns.values():
+                    column.flush()
+    finally:
+        for column in columns.values():
+            column.close()
+
+    manifest = {
+        "version": FORMAT_VERSION,
+        "count": count,
+        "period": period,
+        "account": account,
+        "exported_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "categories": list(categories),
+        "columns": {name: {"file": f"{name}.npy", "dtype": dtype} for name, (dtype, _) in COLUMNS.items()},
+    }
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return count
+
+
+def _map_npy(path: str, code: str):
+    """Отображает файл .npy в память без копирования данных.
+
+    Returns:
+        tuple: (mmap или None, колонка в виде ndarray или memoryview).
+    """
+    if numpy is not None:
+        return None, numpy.load(path, mmap_mode="r")
+
+    with open(path, "rb") as f:
+        prefix = f.read(len(NPY_MAGIC) + 2)
+        if prefix[:6] != NPY_MAGIC[:6]:
+            raise ValueError(f"Файл не является массивом .npy: {path}")
+        header_length = struct.unpack("<H", prefix[-2:])[0]
+        header = ast.literal_eval(f.read(header_length).decode("latin1"))
+        if header["descr"][0] == ">" or sys.byteorder == "big" and header["descr"][0] == "<":
+            raise ValueError(f"Порядок байт файла не совпадает с платформой: {path}")
+
+        data_offset = len(prefix) + header_length
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return mapped, memoryview(mapped)[data_offset:].cast(code)
+
+
+class ColumnarLedger:
+    """Колоночный экспорт операций, отображенный в память.
+
+    Attributes:
+        categories (list): Словарь категорий; колонка ``category`` хранит индексы в нем.
+        ts (Sequence[int]): Время операций в секундах от 1970-01-01.
+        amount (Sequence[float]): Суммы операций.
+        category (Sequence[int]): Коды категорий.
+        manifest (Dict): Содержимое ``ledger.json``.
+    """
+
+    def __init__(self, directory: str):
+        """Открывает экспорт и отображает колонки в память.
+
+        Args:
+            directory (str): Каталог, созданный export_columnar.
+
+        Raises:
+            OSError: Если каталог или файлы экспорта недоступны.
+            ValueError: Если формат файлов не поддерживается.
+        """
+        with open(os.path.join(directory, MANIFEST_FILE), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Неподдерживаемая версия экспорта: {self.manifest.get('version')}")
+
+        self.categories = self.manifest["categories"]
+        self._maps = []
+        self._columns = {}
+        for name, (_, code) in COLUMNS.items():
+            mapped, column = _map_npy(os.path.join(directory, self.manifest["columns"][name]["file"]), code)
+            if mapped is not None:
+                self._maps.append(mapped)
+            self._columns[name] = column
+
+        self.ts = self._columns["ts"]
+        self.amount = self._columns["amount"]
+        self.category = self._columns["category"]
+
+    def __len__(self) -> int:
+        return self.manifest["count"]
+
+    def description(self, index: int) -> str:
+        """Возвращает описание операции по номеру строки."""
+        offsets = self._columns["description_offsets"]
+        return bytes(self._columns["description_data"][offsets[index]:offsets[index + 1]]).decode("utf-8")
+
+    def expense(self, index: int) -> Expense:
+        """Собирает операцию по номеру строки.
+
+        Args:
+            index (int): Номер строки.
+
+        Returns:
+            Expense: Операция.
+        """
+        date = (EPOCH + timedelta(seconds=int(self.ts[index]))).strftime(DATE_FORMAT)
+        return Expense(self.categories[self.category[index]], float(self.amount[index]),
+                       self.description(index), date)
+
+    def category_totals(self) -> Dict[str, Any]:
+        """Считает суммы по категориям, проходя по колонкам без разбора строк.
+
+        Returns:
+            Dict: Категория -> сумма операций.
+        """
+        if numpy is not None:
+            sums = numpy.bincount(self.category, weights=self.amount, minlength=len(self.categories))
+            return dict(zip(self.categories, sums.tolist()))
+
+        sums = [0.0] * len(self.categories)
+        for code, amount in zip(self.category, self.amount):
+            sums[code] += amount
+        return dict(zip(self.categories, sums))
+
+    def close(self):
+        """Освобождает отображенные в память файлы."""
+        for column in self._columns.values():
+            if isinstance(column, memoryview):
+                column.release()
+        self._columns = {}
+        self.ts = self.amount = self.category = None
+        for mapped in self._maps:
+            mapped.close()
+        self._maps = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def load_columnar(directory: str) -> ColumnarLedger:
+    """Открывает колоночный экспорт, отображая файлы в память.
+
+    Args:
+        directory (str): Каталог, созданный export_columnar.
+
+    Returns:
+        ColumnarLedger: Открытый экспорт; закройте его через close() или with.
+    """
+    return ColumnarLedger(directory)
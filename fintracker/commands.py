@@ -1,48 +1,125 @@
 import argparse
-from .storage import add_expense, get_expenses, add_category, get_categories
-from .report import generate_category_report, generate_period_report, print_report
+import json
+import os
+import sys
+from .database import CHANGE_RETENTION_DAYS
+from .models import DEFAULT_ACCOUNT
+from .storage import (
+    add_expense, iter_expenses, iter_changes, add_category, get_categories, import_expenses, ExpenseQuery
+)
+from .report import (
+    generate_category_report,
+    generate_period_report,
+    generate_distribution_report,
+    generate_timeseries_report,
+    generate_pivot_report,
+    generate_anomaly_report,
+    generate_tree_report,
+    generate_tag_report,
+    generate_account_report,
+    generate_merchant_report,
+    generate_stats_report,
+    generate_batch_reports,
+    parse_months,
+    print_report,
+    BATCH_MANIFEST
+)
+from .render import FORMATS, ChunkedOutput, OutputClosed, open_output, render_expenses
 
 
 def handle_add(args):
     """Обработка команды добавления операции"""
     try:
-        success = add_expense(args.category, args.amount, args.description)
+        success = add_expense(args.category, args.amount, args.description, tags=args.tag,
+                              account=args.account)
         if success:
             type_str = "расход" if args.amount < 0 else "доход"
-            print(f"Добавлен {type_str}: {args.category} - {abs(args.amount):.2f} руб.")
+            account = f" (счет {args.account})" if args.account else ""
+            print(f"Добавлен {type_str}: {args.category} - {abs(args.amount):.2f} руб.{account}")
         return success
     except ValueError as e:
         print(f"Ошибка: {e}")
         return False
 
 
+def _query_from_args(args) -> ExpenseQuery:
+    """Собирает запрос из фильтров командной строки"""
+    return ExpenseQuery(
+        period=args.period,
+        start_date=args.start,
+        end_date=args.end,
+        categories=args.category,
+        min_amount=args.min_amount,
+        max_amount=args.max_amount,
+        kind=args.kind,
+        text=args.search,
+        anomalies=args.anomalies,
+        tags=args.tag,
+        exclude_tags=args.without_tag,
+        account=args.account
+    )
+
+
 def handle_list(args):
     """Обработка команды просмотра операций"""
-    expenses = get_expenses(args.period)
+    query = _query_from_args(args)
+    with open_output(args.pager) as out:
+        count = render_expenses(iter_expenses(query), args.format, out,
+                                title=f"Список операций ({query.describe()})")
 
-    if not expenses:
+    if not count and args.format == "table":
         print("Нет операций за указанный период")
-        return
-
-    print(f"\nСписок операций ({args.period}):")
-    print("-" * 50)
-    total = 0
-    for i, expense in enumerate(expenses, 1):
-        sign = "-" if expense.amount < 0 else "+"
-        print(
-            f"{i}. {expense.date} | {expense.category:15} | {sign} {abs(expense.amount):8.2f} руб. | {expense.description}")
-        total += expense.amount
-
-    print("-" * 50)
-    print(f"Итого: {total:+.2f} руб.")
 
 
 def handle_report(args):
     """Обработка команды генерации отчета"""
+    if args.snapshot:
+        from .database import read_snapshot
+        with read_snapshot():
+            args.snapshot = False
+            return handle_report(args)
+
+    if args.period is None:
+        by_month = args.type in ("category", "tree", "distribution") and not (args.start or args.end)
+        args.period = "month" if by_month else "all"
+
+    if args.watch:
+        if args.type != "category":
+            print("Режим --watch поддерживается только для отчета по категориям")
+            return
+        from .watch import watch_category_report
+        watch_category_report(args.period, args.interval, account=args.account)
+        return
+
+    if args.batch:
+        return _handle_batch_report(args)
+
+    if args.bucket is None:
+        args.bucket = "day" if args.type == "period" else "month"
+
     if args.type == "category":
-        report = generate_category_report(args.period, args.output)
+        report = generate_category_report(_query_from_args(args), args.output)
     elif args.type == "period" and args.start and args.end:
-        report = generate_period_report(args.start, args.end, args.output)
+        report = generate_period_report(args.start, args.end, args.output, args.bucket,
+                                        _query_from_args(args))
+    elif args.type == "timeseries":
+        report = generate_timeseries_report(_query_from_args(args), args.bucket, args.output)
+    elif args.type == "pivot":
+        report = generate_pivot_report(_query_from_args(args), args.bucket, args.output)
+    elif args.type == "anomalies":
+        report = generate_anomaly_report(_query_from_args(args), args.output)
+    elif args.type == "tree":
+        report = generate_tree_report(_query_from_args(args), args.output)
+    elif args.type == "accounts":
+        report = generate_account_report(_query_from_args(args), args.output)
+    elif args.type == "tags":
+        report = generate_tag_report(_query_from_args(args), args.output)
+    elif args.type == "merchant":
+        report = generate_merchant_report(_query_from_args(args), args.output)
+    elif args.type == "stats":
+        report = generate_stats_report(_query_from_args(args), args.output)
+    elif args.type == "distribution":
+        report = generate_distribution_report(_query_from_args(args), args.output)
     else:
         print("Для отчета за период укажите --start и --end")
         return
@@ -51,21 +128,320 @@ def handle_report(args):
         print_report(report)
 
 
+def _handle_batch_report(args):
+    """Генерация пакета отчетов по категориям за несколько месяцев"""
+    if args.type != "category":
+        print("Режим --batch поддерживается только для отчета по категориям")
+        return
+    if args.start or args.end:
+        print("Месяцы пакета задаются в --batch, не указывайте --start и --end")
+        return
+    try:
+        months = parse_months(args.batch)
+    except ValueError as e:
+        print(f"Ошибка: {e}")
+        return
+
+    directory = args.output or "reports"
+    manifest = generate_batch_reports(months, directory, _query_from_args(args), args.by_account, args.jobs)
+    print(f"Сгенерировано отчетов: {len(manifest['reports'])}, "
+          f"список в файле {os.path.join(directory, BATCH_MANIFEST)}")
+
+
+def handle_import(args):
+    """Обработка команды импорта операций из CSV"""
+    try:
+        result = import_expenses(args.file, args.mode, args.account)
+    except (OSError, ValueError) as e:
+        print(f"Ошибка: {e}")
+        return False
+
+    skipped = "обновлено" if args.mode == "update" else "пропущено дубликатов"
+    print(f"Импортировано операций: {result['inserted']}, {skipped}: {result['duplicates']}")
+    return True
+
+
+def handle_migrate_json(args):
+    """Обработка команды переноса данных из data.json"""
+    from .migrate import migrate_json
+
+    def progress(done, total, records):
+        percent = done * 100 // total if total else 100
+        print(f"\rОбработано: {percent}% ({records} записей)", end="")
+
+    try:
+        result = migrate_json(args.file, args.batch_size, args.restart, progress)
+    except OSError as e:
+        print(f"Ошибка: {e}")
+        return False
+    if not result:
+        return False
+
+    print()
+    if result["resumed_from"]:
+        print(f"Перенос продолжен с позиции {result['resumed_from']}")
+    for error in result["errors"]:
+        print(f"Пропущена {error}")
+    print(f"Перенесено операций: {result['expenses']}, категорий: {result['categories']}, "
+          f"пропущено существующих: {result['duplicates']}, некорректных: {result['invalid']}")
+    return True
+
+
+def handle_backup(args):
+    """Обработка команды резервного копирования"""
+    from .database import snapshot, restore_database
+
+    def progress(status, remaining, total):
+        if total:
+            print(f"\rСкопировано страниц: {total - remaining}/{total}", end="")
+
+    if args.action == "create":
+        snapshot(args.file, args.pages, progress)
+        print(f"\nРезервная копия сохранена в файл: {args.file}")
+    elif args.action == "restore":
+        if restore_database(args.file, args.pages, progress):
+            print(f"\nБаза данных восстановлена из файла: {args.file}")
+
+
+def handle_export(args):
+    """Обработка команды колоночного экспорта операций"""
+    from .columnar import export_columnar
+    try:
+        count = export_columnar(args.output, args.period, args.account)
+    except OSError as e:
+        print(f"Ошибка: {e}")
+        return False
+
+    print(f"Экспортировано операций: {count} в каталог {args.output}")
+    return True
+
+
+def handle_changes(args):
+    """Обработка команды выгрузки журнала изменений"""
+    from .database import compact_changes, get_change_head
+    if args.compact:
+        result = compact_changes(args.retention_days)
+        print(f"Удалено записей журнала: замещенных {result['superseded']}, устаревших {result['expired']}")
+        return True
+    if args.head:
+        print(get_change_head())
+        return True
+
+    # Изменения выводятся построчно в JSON, чтобы потребитель мог запомнить 'seq' последней строки
+    out = ChunkedOutput(sys.stdout)
+    try:
+        for change in iter_changes(args.since, args.chunk_size):
+            out.write(json.dumps(change, ensure_ascii=False) + "\n")
+        out.flush()
+    except ValueError as e:
+        print(f"Ошибка: {e}")
+        return False
+    except OutputClosed:
+        pass
+    return True
+
+
+def _edit_query(args):
+    """Собирает фильтр операций команд edit и delete"""
+    if args.id and (args.tag or args.without_tag):
+        print("--id нельзя совмещать с --tag и --without-tag")
+        return None
+    query = _query_from_args(args)
+    if args.id:
+        query = query.replace(ids=args.id)
+    if query == ExpenseQuery() and not args.all:
+        print("Укажите --id или фильтр операций (--all - все операции)")
+        return None
+    return query
+
+
+def handle_edit(args):
+    """Обработка команды массового изменения операций"""
+    from .edit import edit_expenses
+    query = _edit_query(args)
+    if query is None:
+        return False
+    changes = {field: value for field, value in (("category", args.set_category), ("amount", args.set_amount),
+                                                 ("description", args.set_description),
+                                                 ("account", args.set_account)) if value is not None}
+    if not changes:
+        print("Укажите хотя бы одно изменение: --set-category, --set-amount, --set-description или --set-account")
+        return False
+
+    result = edit_expenses(query, changes, args.dry_run)
+    if result is None:
+        return False
+    if args.dry_run:
+        print(f"Будет изменено операций: {result['matched']}")
+        return True
+    print(f"Изменено операций: {result['changed']}")
+    if result["skipped"]:
+        print(f"Пропущено операций, совпавших бы с существующими: {result['skipped']}")
+    if result["batch"]:
+        print(f"Отменить изменение: py main.py undo (пакет {result['batch']})")
+    return True
+
+
+def handle_delete(args):
+    """Обработка команды массового удаления операций"""
+    from .edit import delete_expenses
+    query = _edit_query(args)
+    if query is None:
+        return False
+
+    result = delete_expenses(query, args.dry_run)
+    if result is None:
+        return False
+    if args.dry_run:
+        print(f"Будет удалено операций: {result['matched']}")
+        return True
+    print(f"Удалено операций: {result['deleted']}")
+    if result["batch"]:
+        print(f"Отменить удаление: py main.py undo (пакет {result['batch']})")
+    return True
+
+
+def handle_undo(args):
+    """Обработка команды отмены изменений"""
+    from .edit import undo_last, list_batches
+    if args.list:
+        batches = list_batches(args.limit)
+        if not batches:
+            print("Журнал изменений пуст")
+            return True
+        for batch in batches:
+            changes = ", ".join(f"{field}={value}" for field, value in json.loads(batch["changes"] or "{}").items())
+            undone = f"  (отменено {batch['undone_at']})" if batch["undone_at"] else ""
+            print(f"{batch['id']:>5}  {batch['created_at']}  {batch['op']:<6} {batch['count']:>8}  "
+                  f"{batch['filter']}{'  -> ' + changes if changes else ''}{undone}")
+        return True
+
+    result = undo_last()
+    if result is None:
+        return False
+    action = "изменение" if result["op"] == "edit" else "удаление"
+    print(f"Отменено {action} (пакет {result['batch']}), восстановлено операций: {result['restored']}")
+    if result["skipped"]:
+        print(f"Не восстановлено операций, совпавших бы с существующими: {result['skipped']}")
+    return True
+
+
+def handle_attach(args):
+    """Обработка команды прикрепления файла к операции"""
+    from .attachments import add_attachment
+    try:
+        attachment_id = add_attachment(args.expense_id, args.file, args.name)
+    except OSError as e:
+        print(f"Ошибка: {e}")
+        return False
+    if attachment_id is None:
+        return False
+
+    print(f"Файл {args.file} прикреплен к операции {args.expense_id}, номер вложения: {attachment_id}")
+    return True
+
+
+def handle_get_attachment(args):
+    """Обработка команды получения вложения"""
+    from .attachments import get_attachment, list_attachments, save_attachment
+    if args.expense is not None:
+        attachments = list_attachments(args.expense)
+        if not attachments:
+            print(f"У операции {args.expense} нет вложений")
+        for attachment in attachments:
+            place = "файл" if attachment["path"] else "база"
+            print(f"{attachment['id']}. {attachment['name']} | {attachment['size']} байт | {place} | "
+                  f"{attachment['created_at']}")
+        return True
+    if args.id is None or not args.output:
+        print("Укажите номер вложения и --output или --expense")
+        return False
+
+    attachment = get_attachment(args.id)
+    if attachment is None:
+        print(f"Вложение {args.id} не найдено")
+        return False
+    try:
+        with open(args.output, "wb") as target:
+            written = save_attachment(args.id, target)
+    except (OSError, ValueError) as e:
+        print(f"Ошибка: {e}")
+        return False
+    print(f"Вложение {attachment['name']} сохранено в файл: {args.output} ({written} байт)")
+    return True
+
+
+def handle_sync(args):
+    """Обработка команды синхронизации с другой базой"""
+    from .sync import sync_ledgers
+    stats = sync_ledgers(args.remote, dry_run=args.dry_run)
+    if not stats:
+        return False
+
+    print(f"Сравнено диапазонов: {stats['ranges']}, различается: {stats['differing']}")
+    if args.dry_run:
+        print(f"Будет получено операций: {stats['pulled']}, отправлено: {stats['pushed']}")
+    else:
+        print(f"Получено операций: {stats['pulled']}, отправлено: {stats['pushed']}")
+    return True
+
+
+def handle_maintenance(args):
+    """Обработка команды обслуживания базы данных"""
+    from .maintenance import run_maintenance, print_maintenance
+    results = run_maintenance(args.vacuum_pages, args.convert, args.quick, args.compact_changes)
+    print_maintenance(results)
+
+
 def handle_category(args):
     """Обработка команды работы с категориями"""
     if args.action == "add":
-        success = add_category(args.name, args.type)
+        success = add_category(args.name, args.type, args.parent, args.account)
         if success:
-            print(f"Добавлена категория: {args.name} ({args.type})")
+            parent = f" в '{args.parent}'" if args.parent else ""
+            print(f"Добавлена категория: {args.name} ({args.type}){parent}")
     elif args.action == "list":
-        categories = get_categories()
+        categories = get_categories(args.account)
         if not categories:
             print("Нет категорий")
             return
 
-        print("\nСписок категорий:")
+        # Подкатегории выводятся с отступом под своими родителями
+        children = {}
+        names = {category.name for category in categories}
         for category in categories:
-            print(f"  {category.name} ({category.type})")
+            parent = category.parent if category.parent in names else None
+            children.setdefault(parent, []).append(category)
+
+        print("\nСписок категорий:")
+        stack = [(category, 1) for category in reversed(children.get(None, []))]
+        while stack:
+            category, level = stack.pop()
+            account = f", счет {category.account}" if category.account else ""
+            print(f"{'  ' * level}{category.name} ({category.type}{account})")
+            stack.extend((child, level + 1) for child in reversed(children.get(category.name, [])))
+
+
+def _add_account_argument(parser, help_text: str):
+    """Добавляет в парсер параметр счета"""
+    parser.add_argument("--account", "-A", help=help_text)
+
+
+def _add_filter_arguments(parser):
+    """Добавляет в парсер фильтры операций"""
+    _add_account_argument(parser, "Только операции счета (по умолчанию все счета)")
+    parser.add_argument("--category", "-c", action="append",
+                        help="Категория (можно указать несколько раз)")
+    parser.add_argument("--min-amount", type=float, help="Минимальная сумма по модулю")
+    parser.add_argument("--max-amount", type=float, help="Максимальная сумма по модулю")
+    parser.add_argument("--kind", choices=["income", "expense"], help="Только доходы или только расходы")
+    parser.add_argument("--search", "-s", help="Подстрока описания (без учета регистра)")
+    parser.add_argument("--anomalies", action="store_true",
+                        help="Только операции, необычные для своей категории")
+    parser.add_argument("--tag", action="append",
+                        help="Метка, которая должна быть у операции (можно указать несколько раз)")
+    parser.add_argument("--without-tag", action="append",
+                        help="Метка, которой не должно быть у операции (можно указать несколько раз)")
 
 
 def setup_commands():
@@ -77,24 +453,145 @@ def setup_commands():
     add_parser.add_argument("--category", "-c", required=True, help="Категория операции")
     add_parser.add_argument("--amount", "-a", type=float, required=True, help="Сумма (отрицательная для расходов)")
     add_parser.add_argument("--description", "-d", default="", help="Описание операции")
+    add_parser.add_argument("--tag", action="append", help="Метка операции (можно указать несколько раз)")
+    _add_account_argument(add_parser, f"Счет операции (по умолчанию {DEFAULT_ACCOUNT})")
 
     # Команда просмотра
     list_parser = subparsers.add_parser("list", help="Просмотреть операции")
     list_parser.add_argument("--period", "-p", choices=["today", "month", "all"], default="all", help="Период")
+    list_parser.add_argument("--start", help="Начальная дата (YYYY-MM-DD)")
+    list_parser.add_argument("--end", help="Конечная дата (YYYY-MM-DD)")
+    _add_filter_arguments(list_parser)
+    list_parser.add_argument("--format", "-f", choices=FORMATS, default="table", help="Формат вывода")
+    list_parser.add_argument("--pager", action="store_true", help="Выводить через пейджер ($PAGER)")
 
     # Команда отчетов
     report_parser = subparsers.add_parser("report", help="Сгенерировать отчет")
-    report_parser.add_argument("--type", "-t", choices=["category", "period"], required=True, help="Тип отчета")
-    report_parser.add_argument("--period", "-p", choices=["today", "month", "all"], default="month",
-                               help="Период (для category)")
-    report_parser.add_argument("--start", help="Начальная дата (YYYY-MM-DD) для period")
-    report_parser.add_argument("--end", help="Конечная дата (YYYY-MM-DD) для period")
-    report_parser.add_argument("--output", "-o", help="Файл для сохранения отчета (CSV)")
+    report_parser.add_argument("--type", "-t", choices=["category", "period", "timeseries", "pivot", "anomalies", "tree",
+                                                              "tags", "accounts", "merchant", "distribution", "stats"],
+                               required=True, help="Тип отчета")
+    report_parser.add_argument("--period", "-p", choices=["today", "month", "all"],
+                               help="Период (по умолчанию month для category, tree и distribution "
+                                    "без --start/--end, иначе all)")
+    report_parser.add_argument("--start", help="Начальная дата (YYYY-MM-DD)")
+    report_parser.add_argument("--end", help="Конечная дата (YYYY-MM-DD)")
+    _add_filter_arguments(report_parser)
+    report_parser.add_argument("--bucket", "-b", choices=["day", "week", "month", "year"],
+                               help="Интервал для period (по умолчанию day), timeseries и pivot "
+                                    "(по умолчанию month)")
+    report_parser.add_argument("--output", "-o",
+                               help="Файл для сохранения отчета (CSV) или каталог для --batch (по умолчанию reports)")
+    report_parser.add_argument("--batch",
+                               help="Отчеты по категориям за несколько месяцев: 2025, 2025-01..2025-06 "
+                                    "или 2025-01,2025-03")
+    report_parser.add_argument("--by-account", action="store_true",
+                               help="Для --batch: отдельный отчет для каждого счета")
+    report_parser.add_argument("--jobs", "-j", type=int, default=1,
+                               help="Для --batch: количество потоков записи файлов")
+    report_parser.add_argument("--watch", "-w", action="store_true",
+                               help="Обновлять отчет по категориям при появлении новых операций")
+    report_parser.add_argument("--interval", type=float, default=2.0,
+                               help="Интервал опроса в секундах для --watch")
+    report_parser.add_argument("--snapshot", action="store_true",
+                               help="Строить отчет по снимку базы в памяти, не блокируя запись")
+
+    # Команда импорта
+    import_parser = subparsers.add_parser("import", help="Импортировать операции из CSV")
+    import_parser.add_argument("--file", "-f", required=True,
+                               help="CSV-файл с колонками date, amount, category, description, external_id, account")
+    import_parser.add_argument("--mode", "-m", choices=["ignore", "update"], default="ignore",
+                               help="Поведение при дубликатах: пропустить или обновить")
+    _add_account_argument(import_parser, f"Счет для строк без колонки account (по умолчанию {DEFAULT_ACCOUNT})")
+
+    # Команды массового изменения, удаления и их отмены
+    edit_parser = subparsers.add_parser("edit", help="Изменить операции по номерам или фильтру")
+    delete_parser = subparsers.add_parser("delete", help="Удалить операции по номерам или фильтру")
+    for bulk_parser in (edit_parser, delete_parser):
+        bulk_parser.add_argument("--id", type=int, action="append",
+                                 help="Номер операции (можно указать несколько раз)")
+        bulk_parser.add_argument("--period", "-p", choices=["today", "month", "all"], default="all", help="Период")
+        bulk_parser.add_argument("--start", help="Начальная дата (YYYY-MM-DD)")
+        bulk_parser.add_argument("--end", help="Конечная дата (YYYY-MM-DD)")
+        _add_filter_arguments(bulk_parser)
+        bulk_parser.add_argument("--all", action="store_true", help="Разрешить действие над всеми операциями")
+        bulk_parser.add_argument("--dry-run", action="store_true",
+                                 help="Только показать, сколько операций будет затронуто")
+    edit_parser.add_argument("--set-category", help="Новая категория")
+    edit_parser.add_argument("--set-amount", type=float, help="Новая сумма")
+    edit_parser.add_argument("--set-description", help="Новое описание")
+    edit_parser.add_argument("--set-account", help="Новый счет")
+
+    undo_parser = subparsers.add_parser("undo", help="Отменить последнее изменение или удаление операций")
+    undo_parser.add_argument("--list", action="store_true", help="Показать журнал изменений")
+    undo_parser.add_argument("--limit", type=int, default=20, help="Количество записей для --list")
+
+    # Команда переноса из прежнего хранилища
+    migrate_parser = subparsers.add_parser("migrate-json", help="Перенести данные из прежнего файла data.json")
+    migrate_parser.add_argument("--file", "-f", default="data.json", help="Файл data.json (по умолчанию data.json)")
+    migrate_parser.add_argument("--batch-size", type=int, default=5000,
+                                help="Записей в одной транзакции (по умолчанию 5000)")
+    migrate_parser.add_argument("--restart", action="store_true",
+                                help="Начать перенос заново, а не с места прерывания")
+
+    # Команда резервного копирования
+    backup_parser = subparsers.add_parser("backup", help="Резервное копирование базы данных")
+    backup_parser.add_argument("action", choices=["create", "restore"], help="Действие")
+    backup_parser.add_argument("--file", "-f", required=True, help="Файл резервной копии")
+    backup_parser.add_argument("--pages", type=int, default=256,
+                               help="Количество страниц, копируемых за один шаг")
+
+    # Команда колоночного экспорта
+    export_parser = subparsers.add_parser("export", help="Экспорт операций в колоночные файлы .npy")
+    export_parser.add_argument("--output", "-o", required=True, help="Каталог для файлов экспорта")
+    export_parser.add_argument("--period", "-p", choices=["today", "month", "all"], default="all", help="Период")
+    _add_account_argument(export_parser, "Экспортировать только операции счета (по умолчанию все счета)")
+
+    # Команда журнала изменений
+    changes_parser = subparsers.add_parser("changes", help="Выгрузить изменения операций из журнала")
+    changes_parser.add_argument("--since", type=int, default=0,
+                                help="Номер последнего обработанного изменения (по умолчанию 0)")
+    changes_parser.add_argument("--chunk-size", type=int, default=1000,
+                                help="Количество изменений, читаемых из базы за раз")
+    changes_parser.add_argument("--head", action="store_true", help="Вывести номер последнего изменения")
+    changes_parser.add_argument("--compact", action="store_true",
+                                help="Сжать журнал: оставить последнюю запись каждой операции "
+                                     "и удалить устаревшие записи")
+    changes_parser.add_argument("--retention-days", type=int, default=CHANGE_RETENTION_DAYS,
+                                help=f"Срок хранения записей для --compact (по умолчанию {CHANGE_RETENTION_DAYS})")
+
+    # Команды вложений
+    attach_parser = subparsers.add_parser("attach", help="Прикрепить файл (например, скан чека) к операции")
+    attach_parser.add_argument("expense_id", type=int, help="Номер операции (поле id в list --format json)")
+    attach_parser.add_argument("file", help="Прикрепляемый файл")
+    attach_parser.add_argument("--name", "-n", help="Имя вложения (по умолчанию имя файла)")
+
+    get_attachment_parser = subparsers.add_parser("get-attachment", help="Получить вложение операции")
+    get_attachment_parser.add_argument("id", type=int, nargs="?", help="Номер вложения")
+    get_attachment_parser.add_argument("--output", "-o", help="Файл для сохранения содержимого")
+    get_attachment_parser.add_argument("--expense", "-e", type=int, help="Показать вложения операции")
+
+    # Команда синхронизации
+    sync_parser = subparsers.add_parser("sync", help="Синхронизировать операции с другой базой")
+    sync_parser.add_argument("remote", help="Файл второй базы (создается, если его нет)")
+    sync_parser.add_argument("--dry-run", action="store_true",
+                             help="Только показать, сколько операций будет перенесено")
+
+    # Команда обслуживания
+    maint_parser = subparsers.add_parser("maintenance", help="Обслуживание базы данных")
+    maint_parser.add_argument("--vacuum-pages", type=int,
+                              help="Максимум страниц для инкрементальной очистки (по умолчанию все)")
+    maint_parser.add_argument("--convert", action="store_true",
+                              help="Перевести существующую базу в режим auto_vacuum=INCREMENTAL")
+    maint_parser.add_argument("--quick", action="store_true", help="Быстрая проверка целостности")
+    maint_parser.add_argument("--compact-changes", type=int, metavar="DAYS",
+                              help="Сжать журнал изменений со сроком хранения DAYS дней (по умолчанию не сжимается)")
 
     # Команда категорий
     cat_parser = subparsers.add_parser("category", help="Управление категориями")
     cat_parser.add_argument("action", choices=["add", "list"], help="Действие")
     cat_parser.add_argument("--name", "-n", help="Название категории (для add)")
     cat_parser.add_argument("--type", "-t", choices=["expense", "income"], help="Тип категории (для add)")
+    cat_parser.add_argument("--parent", "-p", help="Родительская категория (для add)")
+    _add_account_argument(cat_parser, "Счет категории (для add; по умолчанию общая) или счет для list")
 
     return parser
\ No newline at end of file
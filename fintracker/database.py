@@ -2,26 +2,253 @@
 Модуль для работы с базой данных SQLite.
 """
 
+import calendar
+import hashlib
+import json
+import random
 import sqlite3
-from typing import List, Dict, Any
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from itertools import groupby
+from operator import itemgetter
+from typing import List, Dict, Any, Callable, Optional, Iterator, Iterable, Union
 from datetime import datetime
+from .bitmap import Bitmap
+from .sketch import QuantileSketch
+from .stats import RunningStats, register_sql_functions
+from .models import day_to_date, month_number, month_to_str, DEFAULT_ACCOUNT
+from .query import ExpenseQuery, casefold, DESCRIPTION_SQL
 
 DATABASE_FILE = 'financial_tracker.db'
 
+# Поведение при совпадении хеша содержимого: пропустить, обновить существующую
+# операцию или сохранить повторную (ручное добавление: две одинаковые покупки за день)
+CONFLICT_MODES = ("ignore", "update", "keep")
 
-def get_connection():
-    """Создает и возвращает соединение с базой данных."""
-    conn = sqlite3.connect(DATABASE_FILE)
+# Выполнять PRAGMA optimize при закрытии соединения, которое изменяло данные
+OPTIMIZE_ON_CLOSE = True
+
+# Целочисленные колонки дат: локальное время в секундах от 1970-01-01 без учета
+# часового пояса, номер дня и номер месяца (год * 12 + месяц - 1)
+DATE_COLUMNS = {
+    "ts": "CAST(strftime('%s', date) AS INTEGER)",
+    "day": "CAST(strftime('%s', date) AS INTEGER) / 86400",
+    "month": "CAST(strftime('%Y', date) AS INTEGER) * 12 + CAST(strftime('%m', date) AS INTEGER) - 1"
+}
+
+# Группировка по дням, неделям (с понедельника), месяцам и годам: выражение и подпись
+PERIOD_BUCKETS = {
+    "day": ("day", day_to_date),
+    "week": ("(day - 4) / 7", lambda week: day_to_date(week * 7 + 4)),
+    "month": ("month", month_to_str),
+    "year": ("month / 12", lambda year: f"{year:04d}")
+}
+
+# Операция считается аномальной, если ее сумма отклоняется от среднего по
+# категории не менее чем на ANOMALY_THRESHOLD стандартных отклонений. Оценка
+# выполняется, когда в категории накоплено не меньше ANOMALY_MIN_COUNT операций;
+# стандартное отклонение не меньше ANOMALY_MIN_SPREAD от среднего
+ANOMALY_THRESHOLD = 3.0
+ANOMALY_MIN_COUNT = 5
+ANOMALY_MIN_SPREAD = 0.1
+
+# Журнал упреждающей записи: читатели не блокируют писателя, а писатель - читателей
+JOURNAL_MODE = "WAL"
+
+# Сколько соединение ждет освобождения блокировки другим процессом, мс
+BUSY_TIMEOUT_MS = 5000
+
+# Количество повторов записи после ошибки "database is locked" и начальная пауза, с
+WRITE_RETRIES = 5
+RETRY_BACKOFF = 0.05
+
+# Количество страниц, копируемых за один шаг резервного копирования
+BACKUP_PAGES_PER_STEP = 256
+
+# Записи журнала изменений старше этого срока удаляются при сжатии
+CHANGE_RETENTION_DAYS = 30
+
+# Колонки операции, изменение которых попадает в журнал изменений
+LOGGED_COLUMNS = ("category", "amount", "description", "description_id", "date", "account", "external_id")
+
+# Количество недавних описаний, номера которых в словаре кэшируются в процессе
+DESCRIPTION_CACHE_SIZE = 4096
+
+# Снимок базы в памяти, который используется вместо файла внутри read_snapshot()
+_snapshot_conn = None
+
+# Кэш словаря описаний: (файл базы, текст) -> номер, в порядке последнего использования.
+# Содержит только зафиксированные номера: номера, полученные в открытой транзакции,
+# хранятся в соединении и попадают сюда после commit()
+_description_ids = OrderedDict()
+_description_lock = threading.Lock()
+
+
+class TrackerConnection(sqlite3.Connection):
+    """Соединение с базой данных с оптимизацией статистики при закрытии.
+
+    Attributes:
+        pending_descriptions (Dict): Номера описаний, полученные в открытой
+            транзакции; переносятся в общий кэш только после фиксации.
+    """
+
+    # Закрепленное соединение (снимок) не закрывается вызывающим кодом
+    pinned = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.path = args[0] if args else kwargs.get("database")
+        self.pending_descriptions = {}
+        # Поиск по тексту без учета регистра для кириллицы (LIKE и lower() учитывают только ASCII)
+        self.create_function('casefold', 1, casefold, deterministic=True)
+        # median, percentile, stddev и month_bucket для отчетов, считаемых внутри SQLite
+        register_sql_functions(self)
+
+    def close(self):
+        """Закрывает соединение, предварительно выполнив PRAGMA optimize.
+
+        Оптимизация выполняется только для соединений, которые изменяли
+        данные, и обычно обходится почти бесплатно.
+        """
+        if self.pinned:
+            return
+        self.pending_descriptions.clear()
+        if OPTIMIZE_ON_CLOSE and self.total_changes:
+            try:
+                self.execute('PRAGMA optimize')
+            except sqlite3.Error:
+                pass
+        super().close()
+
+    def commit(self):
+        """Фиксирует транзакцию и переносит ее номера описаний в общий кэш."""
+        super().commit()
+        _remember_descriptions(self.pending_descriptions)
+        self.pending_descriptions.clear()
+
+    def rollback(self):
+        """Откатывает транзакцию, отбрасывая ее номера описаний.
+
+        Описания, добавленные в словарь откатываемой транзакцией, исчезают
+        из базы, и их номера могут быть выданы другим описаниям.
+        """
+        self.pending_descriptions.clear()
+        super().rollback()
+
+    def rollback_to(self, savepoint: str):
+        """Откатывает транзакцию до точки сохранения, отбрасывая номера описаний.
+
+        Номера описаний, полученные до точки сохранения, тоже отбрасываются:
+        при следующем обращении они будут прочитаны из словаря заново.
+        """
+        self.pending_descriptions.clear()
+        self.execute(f'ROLLBACK TO {savepoint}')
+
+
+def get_connection(path: str = None):
+    """Создает и возвращает соединение с базой данных.
+
+    Args:
+        path (str, optional): Файл другой базы. По умолчанию DATABASE_FILE
+            (или снимок внутри read_snapshot()).
+    """
+    if path is not None:
+        conn = sqlite3.connect(path, factory=TrackerConnection,
+                               timeout=BUSY_TIMEOUT_MS / 1000, isolation_level="IMMEDIATE")
+        conn.row_factory = sqlite3.Row
+        return conn
+    if _snapshot_conn is not None:
+        return _snapshot_conn
+    # Неявная транзакция начинается с BEGIN IMMEDIATE только перед первым
+    # изменением; записи, читающие данные до изменения, открывают ее явно (run_write)
+    conn = sqlite3.connect(DATABASE_FILE, factory=TrackerConnection,
+                           timeout=BUSY_TIMEOUT_MS / 1000, isolation_level="IMMEDIATE")
     conn.row_factory = sqlite3.Row  # Для доступа к колонкам по имени
     return conn
 
 
-def init_database():
-    """Инициализирует базу данных и создает таблицы если они не существуют."""
-    conn = get_connection()
+def _is_busy(error: sqlite3.Error) -> bool:
+    """Проверяет, что ошибка вызвана блокировкой базы другим соединением."""
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ("locked" in message or "busy" in message)
+
+
+def _backoff(attempt: int):
+    """Ждет перед повтором записи: экспоненциально растущая пауза со случайным разбросом."""
+    time.sleep(RETRY_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+def run_write(work: Callable[[sqlite3.Cursor], Any], retries: int = None, path: str = None) -> Any:
+    """
+    Выполняет запись одной транзакцией с повторами при блокировке базы.
+
+    Если база занята другим процессом дольше BUSY_TIMEOUT_MS, транзакция
+    откатывается и повторяется с нарастающей паузой. Функция ``work``
+    может быть вызвана несколько раз, поэтому она не должна иметь
+    побочных эффектов вне базы данных.
+
+    Args:
+        work: Функция, выполняющая запись через переданный курсор
+        retries: Количество повторов (по умолчанию WRITE_RETRIES)
+        path: Файл другой базы (по умолчанию DATABASE_FILE)
+
+    Returns:
+        Any: Результат функции ``work``
+
+    Raises:
+        sqlite3.Error: Если запись не удалась или база осталась занятой
+    """
+    retries = WRITE_RETRIES if retries is None else retries
+    for attempt in range(retries + 1):
+        conn = get_connection(path)
+        try:
+            cursor = conn.cursor()
+            # Блокировка записи берется до первого чтения: иначе ``work`` читает
+            # статистику и словари вне транзакции и перезаписывает чужие изменения
+            cursor.execute('BEGIN IMMEDIATE')
+            result = work(cursor)
+            conn.commit()
+            return result
+        except sqlite3.Error as e:
+            conn.rollback()
+            if not _is_busy(e) or attempt == retries:
+                raise
+        finally:
+            conn.close()
+        _backoff(attempt)
+
+
+def _ensure_column(cursor, table: str, column: str, definition: str) -> bool:
+    """Добавляет колонку в существующую таблицу, если ее еще нет.
+
+    Returns:
+        bool: True если колонка была добавлена
+    """
+    cursor.execute(f'PRAGMA table_xinfo({table})')
+    if any(row[1] == column for row in cursor.fetchall()):
+        return False
+    cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    return True
+
+
+def init_database(path: str = None):
+    """Инициализирует базу данных и создает таблицы если они не существуют.
+
+    Args:
+        path (str, optional): Файл другой базы. По умолчанию DATABASE_FILE.
+    """
+    conn = get_connection(path)
     try:
         cursor = conn.cursor()
 
+        # Новая база создается в режиме инкрементальной очистки страниц
+        cursor.execute('SELECT COUNT(*) FROM sqlite_master')
+        if cursor.fetchone()[0] == 0:
+            cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        cursor.execute(f'PRAGMA journal_mode = {JOURNAL_MODE}')
+
         # Создаем таблицу категорий
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS categories (
@@ -32,6 +259,23 @@ def init_database():
             )
         ''')
 
+        # Иерархия категорий: родитель в самой таблице и таблица замыкания
+        # со всеми парами (предок, потомок) для свертки сумм по поддеревьям
+        _ensure_column(cursor, 'categories', 'parent', 'TEXT REFERENCES categories (name)')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS category_tree (
+                ancestor TEXT NOT NULL,
+                descendant TEXT NOT NULL,
+                depth INTEGER NOT NULL,
+                PRIMARY KEY (ancestor, descendant)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_category_tree_descendant ON category_tree (descendant)')
+        cursor.execute(
+            '''INSERT OR IGNORE INTO category_tree (ancestor, descendant, depth)
+               SELECT name, name, 0 FROM categories WHERE parent IS NULL'''
+        )
+
         # Создаем таблицу операций
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS expenses (
@@ -45,6 +289,227 @@ def init_database():
             )
         ''')
 
+        # Счета: операции всех счетов хранятся в одной таблице, категории
+        # без счета общие для всех счетов
+        _ensure_column(cursor, 'expenses', 'account', f"TEXT NOT NULL DEFAULT '{DEFAULT_ACCOUNT}'")
+        _ensure_column(cursor, 'categories', 'account', 'TEXT')
+
+        # Словарь описаний: повторяющиеся названия магазинов и услуг хранятся
+        # один раз, а операция ссылается на них целым номером
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS descriptions (
+                id INTEGER PRIMARY KEY,
+                text TEXT NOT NULL UNIQUE
+            )
+        ''')
+        if _ensure_column(cursor, 'expenses', 'description_id', 'INTEGER REFERENCES descriptions (id)'):
+            _encode_descriptions(cursor)
+        # Отчет по описаниям группирует по номеру, читая только индекс
+        cursor.execute(
+            'CREATE INDEX IF NOT EXISTS idx_expenses_description ON expenses (description_id, description, amount)'
+        )
+
+        # Хеш содержимого для идемпотентного импорта
+        _ensure_column(cursor, 'expenses', 'external_id', 'TEXT')
+        if _ensure_column(cursor, 'expenses', 'content_hash', 'TEXT'):
+            _backfill_content_hashes(cursor)
+        cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_expenses_content_hash
+            ON expenses (content_hash) WHERE content_hash IS NOT NULL
+        ''')
+
+        # Целочисленные даты вычисляются из текстовой даты и индексируются,
+        # чтобы отчеты фильтровали и группировали по числам, а не по тексту
+        for column, expression in DATE_COLUMNS.items():
+            _ensure_column(cursor, 'expenses', column,
+                           f'INTEGER GENERATED ALWAYS AS ({expression}) VIRTUAL')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_expenses_ts ON expenses (ts)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_expenses_day ON expenses (day, category, amount)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_expenses_month ON expenses (month, category, amount)')
+        # Сводки диапазонов дат для синхронизации баз читаются только из этого индекса
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_expenses_sync
+            ON expenses (month, day, content_hash) WHERE content_hash IS NOT NULL
+        ''')
+
+        # Индексы с ведущей колонкой account дают отчету по счету только его диапазон строк
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_expenses_account_ts ON expenses (account, ts)')
+        cursor.execute(
+            'CREATE INDEX IF NOT EXISTS idx_expenses_account_day ON expenses (account, day, category, amount)'
+        )
+        cursor.execute(
+            'CREATE INDEX IF NOT EXISTS idx_expenses_account_month ON expenses (account, month, category, amount)'
+        )
+
+        # Создаем таблицу квантильных скетчей по категориям, месяцам и счетам.
+        # Скетчи прежнего формата без счета удаляются и строятся заново ниже
+        cursor.execute('PRAGMA table_info(expense_sketches)')
+        columns = [row[1] for row in cursor.fetchall()]
+        if columns and 'account' not in columns:
+            cursor.execute('DROP TABLE expense_sketches')
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS expense_sketches (
+                category TEXT NOT NULL,
+                month TEXT NOT NULL,
+                account TEXT NOT NULL DEFAULT '{DEFAULT_ACCOUNT}',
+                total REAL NOT NULL DEFAULT 0,
+                sketch TEXT NOT NULL,
+                PRIMARY KEY (category, month, account)
+            )
+        ''')
+
+        # Текущая статистика сумм по категориям для поиска аномалий
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS category_stats (
+                category TEXT PRIMARY KEY,
+                count INTEGER NOT NULL,
+                mean REAL NOT NULL,
+                m2 REAL NOT NULL
+            )
+        ''')
+        _ensure_column(cursor, 'expenses', 'anomaly', 'REAL')
+        cursor.execute(
+            'CREATE INDEX IF NOT EXISTS idx_expenses_anomaly ON expenses (ts) WHERE anomaly IS NOT NULL'
+        )
+
+        # Метки операций: связь многие-ко-многим и счетчик изменений, по
+        # которому процесс узнает, что его битовый индекс меток устарел
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS tags (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT UNIQUE NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS expense_tags (
+                tag_id INTEGER NOT NULL REFERENCES tags (id),
+                expense_id INTEGER NOT NULL REFERENCES expenses (id),
+                PRIMARY KEY (tag_id, expense_id)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_expense_tags_expense ON expense_tags (expense_id)')
+        cursor.execute('CREATE TABLE IF NOT EXISTS tag_state (token TEXT NOT NULL, version INTEGER NOT NULL)')
+        cursor.execute(
+            '''INSERT INTO tag_state (token, version)
+               SELECT lower(hex(randomblob(8))), 0 WHERE NOT EXISTS (SELECT 1 FROM tag_state)'''
+        )
+        for event in ("INSERT", "DELETE"):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS expense_tags_{event.lower()} AFTER {event} ON expense_tags
+                BEGIN UPDATE tag_state SET version = version + 1; END
+            ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS expenses_delete_tags AFTER DELETE ON expenses
+            BEGIN DELETE FROM expense_tags WHERE expense_id = old.id; END
+        ''')
+
+        # Журнал изменений операций для инкрементальной выгрузки: триггеры
+        # записывают каждую вставку, изменение и удаление с возрастающим номером
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS change_log (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                op TEXT NOT NULL CHECK(op IN ('insert', 'update', 'delete')),
+                expense_id INTEGER NOT NULL,
+                changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_change_log_expense ON change_log (expense_id, seq)')
+        cursor.execute('CREATE TABLE IF NOT EXISTS change_log_state (truncated INTEGER NOT NULL)')
+        cursor.execute(
+            'INSERT INTO change_log_state (truncated) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM change_log_state)'
+        )
+        changed = " OR ".join(f"old.{column} IS NOT new.{column}" for column in LOGGED_COLUMNS)
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS expenses_log_insert AFTER INSERT ON expenses
+            BEGIN INSERT INTO change_log (op, expense_id) VALUES ('insert', new.id); END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS expenses_log_update AFTER UPDATE ON expenses WHEN {changed}
+            BEGIN INSERT INTO change_log (op, expense_id) VALUES ('update', new.id); END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS expenses_log_delete AFTER DELETE ON expenses
+            BEGIN INSERT INTO change_log (op, expense_id) VALUES ('delete', old.id); END
+        ''')
+
+        # Журнал массовых изменений и удалений для отмены: прежние значения
+        # каждой затронутой операции (для удаленных - вместе с метками)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS edit_batches (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                op TEXT NOT NULL CHECK(op IN ('edit', 'delete')),
+                filter TEXT NOT NULL,
+                changes TEXT,
+                count INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                undone_at TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS expense_journal (
+                batch INTEGER NOT NULL REFERENCES edit_batches (id),
+                expense_id INTEGER NOT NULL,
+                category TEXT NOT NULL,
+                amount REAL NOT NULL,
+                description TEXT,
+                description_id INTEGER,
+                date TIMESTAMP,
+                created_at TIMESTAMP,
+                external_id TEXT,
+                content_hash TEXT,
+                anomaly REAL,
+                account TEXT NOT NULL,
+                tags TEXT,
+                PRIMARY KEY (batch, expense_id)
+            ) WITHOUT ROWID
+        ''')
+
+        # Вложения (сканы чеков): небольшие файлы хранятся в колонке data,
+        # большие - отдельными файлами рядом с базой, путь к которым в колонке path.
+        # Колонка data последняя, чтобы чтение описания вложения не проходило
+        # по страницам переполнения с содержимым файла
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS attachments (
+                id INTEGER PRIMARY KEY,
+                expense_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                sha256 TEXT NOT NULL,
+                path TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                data BLOB,
+                CHECK ((data IS NULL) != (path IS NULL))
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_attachments_expense ON attachments (expense_id)')
+
+        # Состояние переноса из файлов data.json: позиция в файле после последней
+        # записанной порции, чтобы прерванный перенос продолжался с нее
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS legacy_migrations (
+                source TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                layout TEXT NOT NULL,
+                section TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                records INTEGER NOT NULL,
+                done INTEGER NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # Для базы, созданной до появления скетчей и статистики, строим их по таблице операций
+        cursor.execute('SELECT EXISTS (SELECT 1 FROM expense_sketches)')
+        has_sketches = cursor.fetchone()[0]
+        cursor.execute('SELECT EXISTS (SELECT 1 FROM category_stats)')
+        has_stats = cursor.fetchone()[0]
+        cursor.execute('SELECT EXISTS (SELECT 1 FROM expenses)')
+        if cursor.fetchone()[0]:
+            if not has_sketches:
+                _rebuild_sketches(cursor)
+            if not has_stats:
+                _rebuild_category_stats(cursor)
+
         conn.commit()
         print("База данных инициализирована успешно")
 
@@ -55,25 +520,53 @@ def init_database():
         conn.close()
 
 
-def add_category_to_db(name: str, category_type: str) -> bool:
+def _insert_category(cursor, name: str, category_type: str, parent: str = None, account: str = None) -> bool:
+    """Вставляет категорию и ее пары в таблицу замыкания category_tree.
+
+    Returns:
+        bool: False, если родительской категории нет
+
+    Raises:
+        sqlite3.IntegrityError: Если категория уже существует
+    """
+    if parent is not None:
+        cursor.execute('SELECT EXISTS (SELECT 1 FROM categories WHERE name = ?)', (parent,))
+        if not cursor.fetchone()[0]:
+            return False
+    cursor.execute(
+        'INSERT INTO categories (name, type, parent, account) VALUES (?, ?, ?, ?)',
+        (name, category_type, parent, account)
+    )
+    cursor.execute(
+        '''INSERT INTO category_tree (ancestor, descendant, depth)
+           SELECT ancestor, ?, depth + 1 FROM category_tree WHERE descendant = ?
+           UNION ALL SELECT ?, ?, 0''',
+        (name, parent, name, name)
+    )
+    return True
+
+
+def add_category_to_db(name: str, category_type: str, parent: str = None, account: str = None) -> bool:
     """
     Добавляет новую категорию в базу данных.
 
+    Вместе с категорией в таблицу замыкания category_tree записываются
+    пары (предок, потомок) для всех ее предков, поэтому поддеревья
+    выбираются одним соединением без рекурсии.
+
     Args:
         name: Название категории
         category_type: Тип категории ('expense' или 'income')
+        parent: Название родительской категории (по умолчанию корневая)
+        account: Счет категории (по умолчанию общая для всех счетов)
 
     Returns:
         bool: True если успешно, False если ошибка или дубликат
     """
-    conn = get_connection()
     try:
-        cursor = conn.cursor()
-        cursor.execute(
-            'INSERT INTO categories (name, type) VALUES (?, ?)',
-            (name, category_type)
-        )
-        conn.commit()
+        if not run_write(lambda cursor: _insert_category(cursor, name, category_type, parent, account)):
+            print(f"Родительская категория '{parent}' не найдена")
+            return False
         return True
     except sqlite3.IntegrityError:
         print(f"Категория '{name}' уже существует")
@@ -81,13 +574,14 @@ def add_category_to_db(name: str, category_type: str) -> bool:
     except sqlite3.Error as e:
         print(f"Ошибка добавления категории: {e}")
         return False
-    finally:
-        conn.close()
 
 
-def get_categories_from_db() -> List[Dict[str, Any]]:
+def get_categories_from_db(account: str = None) -> List[Dict[str, Any]]:
     """
-    Получает все категории из базы данных.
+    Получает категории из базы данных.
+
+    Args:
+        account: Счет; если указан, возвращаются общие категории и категории этого счета
 
     Returns:
         List[Dict]: Список категорий
@@ -95,7 +589,14 @@ def get_categories_from_db() -> List[Dict[str, Any]]:
     conn = get_connection()
     try:
         cursor = conn.cursor()
-        cursor.execute('SELECT name, type FROM categories ORDER BY name')
+        if account:
+            cursor.execute(
+                '''SELECT name, type, parent, account FROM categories
+                   WHERE account IS NULL OR account = ? ORDER BY name''',
+                (account,)
+            )
+        else:
+            cursor.execute('SELECT name, type, parent, account FROM categories ORDER BY name')
         categories = [dict(row) for row in cursor.fetchall()]
         return categories
     except sqlite3.Error as e:
@@ -105,194 +606,849 @@ def get_categories_from_db() -> List[Dict[str, Any]]:
         conn.close()
 
 
-def add_expense_to_db(category: str, amount: float, description: str = "") -> bool:
+def _update_sketch(cursor, category: str, month: str, account: str, amounts: List[float]):
+    """Добавляет суммы операций в скетч категории за месяц по счету.
+
+    Вызывается в той же транзакции, что и вставка операций.
     """
-    Добавляет новую операцию в базу данных.
+    cursor.execute(
+        'SELECT sketch FROM expense_sketches WHERE category = ? AND month = ? AND account = ?',
+        (category, month, account)
+    )
+    row = cursor.fetchone()
+    sketch = QuantileSketch.from_json(row[0]) if row else QuantileSketch()
+    for amount in amounts:
+        sketch.add(abs(amount))
+    cursor.execute(
+        '''INSERT INTO expense_sketches (category, month, account, total, sketch) VALUES (?, ?, ?, ?, ?)
+           ON CONFLICT (category, month, account) DO UPDATE
+           SET total = total + excluded.total, sketch = excluded.sketch''',
+        (category, month, account, sum(amounts), sketch.to_json())
+    )
+
+
+def _rebuild_sketch(cursor, category: str, month: str, account: str):
+    """Строит заново скетч категории за месяц по счету по текущим операциям.
+
+    Скетч не поддерживает удаление значений, поэтому после изменения или
+    удаления операций затронутый скетч перестраивается по покрывающему
+    индексу (account, month, category, amount).
+    """
+    cursor.execute('SELECT amount FROM expenses WHERE account = ? AND month = ? AND category = ?',
+                   (account, month_number(f"{month}-01"), category))
+    amounts = [row[0] for row in cursor.fetchall()]
+    if not amounts:
+        cursor.execute('DELETE FROM expense_sketches WHERE category = ? AND month = ? AND account = ?',
+                       (category, month, account))
+        return
+    sketch = QuantileSketch()
+    for amount in amounts:
+        sketch.add(abs(amount))
+    cursor.execute(
+        '''INSERT INTO expense_sketches (category, month, account, total, sketch) VALUES (?, ?, ?, ?, ?)
+           ON CONFLICT (category, month, account) DO UPDATE
+           SET total = excluded.total, sketch = excluded.sketch''',
+        (category, month, account, sum(amounts), sketch.to_json())
+    )
+
+
+def _rebuild_sketches(cursor):
+    """Перестраивает все скетчи по таблице операций за один проход."""
+    cursor.execute('DELETE FROM expense_sketches')
+    rows = cursor.execute(
+        '''SELECT category, substr(date, 1, 7) AS month, account, amount
+           FROM expenses ORDER BY category, month, account, amount'''
+    )
+
+    key, sketch, total = None, None, 0
+    pending = []
+    for category, month, account, amount in rows:
+        if (category, month, account) != key:
+            if key is not None:
+                pending.append((*key, total, sketch.to_json()))
+            key, sketch, total = (category, month, account), QuantileSketch(), 0
+        sketch.add(abs(amount))
+        total += amount
+    if key is not None:
+        pending.append((*key, total, sketch.to_json()))
+
+    cursor.executemany(
+        'INSERT INTO expense_sketches (category, month, account, total, sketch) VALUES (?, ?, ?, ?, ?)',
+        pending
+    )
+
+
+def _load_category_stats(cursor, category: str) -> RunningStats:
+    """Читает статистику сумм категории."""
+    cursor.execute('SELECT count, mean, m2 FROM category_stats WHERE category = ?', (category,))
+    row = cursor.fetchone()
+    return RunningStats(*row) if row else RunningStats()
+
+
+def _save_category_stats(cursor, category: str, stats: RunningStats):
+    """Сохраняет статистику сумм категории."""
+    cursor.execute(
+        '''INSERT INTO category_stats (category, count, mean, m2) VALUES (?, ?, ?, ?)
+           ON CONFLICT (category) DO UPDATE
+           SET count = excluded.count, mean = excluded.mean, m2 = excluded.m2''',
+        (category, stats.count, stats.mean, stats.m2)
+    )
+
+
+def anomaly_score(stats: RunningStats, amount: float) -> Optional[float]:
+    """
+    Оценивает, насколько сумма необычна для категории.
 
     Args:
-        category: Категория операции
+        stats: Статистика сумм категории до этой операции
         amount: Сумма операции
-        description: Описание операции
+
+    Returns:
+        Optional[float]: Отклонение в стандартных отклонениях, если оно не меньше
+            ANOMALY_THRESHOLD, иначе None
+    """
+    if stats.count < ANOMALY_MIN_COUNT:
+        return None
+    score = stats.zscore(abs(amount), ANOMALY_MIN_SPREAD * stats.mean)
+    if score is None or abs(score) < ANOMALY_THRESHOLD:
+        return None
+    return score
+
+
+def _rebuild_category_stats(cursor):
+    """Пересчитывает статистику сумм по всем операциям за один проход."""
+    cursor.execute('DELETE FROM category_stats')
+    stats = {}
+    for category, amount in cursor.execute('SELECT category, amount FROM expenses ORDER BY id'):
+        stats.setdefault(category, RunningStats()).add(abs(amount))
+    for category, category_stats in stats.items():
+        _save_category_stats(cursor, category, category_stats)
+
+
+def rebuild_sketches_in_db() -> bool:
+    """
+    Перестраивает квантильные скетчи по всем операциям.
 
     Returns:
         bool: True если успешно, False если ошибка
     """
-    conn = get_connection()
     try:
-        cursor = conn.cursor()
-        cursor.execute(
-            'INSERT INTO expenses (category, amount, description, date) VALUES (?, ?, ?, ?)',
-            (category, amount, description, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-        )
-        conn.commit()
+        run_write(_rebuild_sketches)
         return True
     except sqlite3.Error as e:
-        print(f"Ошибка добавления операции: {e}")
+        print(f"Ошибка перестроения скетчей: {e}")
         return False
-    finally:
-        conn.close()
 
 
-def get_expenses_from_db(period: str = "all") -> List[Dict[str, Any]]:
+def rebuild_category_stats_in_db() -> bool:
     """
-    Получает операции из базы данных за указанный период.
-
-    Args:
-        period: Период для фильтрации ('today', 'month', 'all')
+    Пересчитывает статистику сумм по категориям по всем операциям.
 
     Returns:
-        List[Dict]: Список операций
+        bool: True если успешно, False если ошибка
     """
-    conn = get_connection()
     try:
-        cursor = conn.cursor()
-
-        if period == "today":
-            today = datetime.now().strftime('%Y-%m-%d')
-            cursor.execute(
-                'SELECT category, amount, description, date FROM expenses WHERE date LIKE ? ORDER BY date DESC',
-                (f'{today}%',)
-            )
-        elif period == "month":
-            current_month = datetime.now().strftime('%Y-%m')
-            cursor.execute(
-                'SELECT category, amount, description, date FROM expenses WHERE date LIKE ? ORDER BY date DESC',
-                (f'{current_month}%',)
-            )
-        else:  # all
-            cursor.execute(
-                'SELECT category, amount, description, date FROM expenses ORDER BY date DESC'
-            )
-
-        expenses = [dict(row) for row in cursor.fetchall()]
-        return expenses
-
+        run_write(_rebuild_category_stats)
+        return True
     except sqlite3.Error as e:
-        print(f"Ошибка получения операций: {e}")
-        return []
-    finally:
-        conn.close()
+        print(f"Ошибка пересчета статистики категорий: {e}")
+        return False
 
 
-def get_category_report_from_db(period: str = "month") -> Dict[str, Any]:
+def compute_content_hash(date: str, amount: float, category: str,
+                         description: str = "", external_id: str = None, account: str = None) -> str:
     """
-    Генерирует отчет по категориям из базы данных.
+    Вычисляет нормализованный хеш содержимого операции для дедупликации.
+
+    Если у операции есть внешний идентификатор (например, из выгрузки банка),
+    хеш строится только по нему, чтобы повторный импорт с исправленной
+    суммой или описанием обновлял ту же запись. Счет, отличный от
+    основного, входит в хеш, поэтому одинаковые операции разных счетов
+    не считаются дубликатами, а хеши операций основного счета не меняются.
 
     Args:
-        period: Период для отчета
+        date: Дата операции
+        amount: Сумма операции
+        category: Категория операции
+        description: Описание операции
+        external_id: Внешний идентификатор операции
+        account: Счет операции
 
     Returns:
-        Dict: Данные отчета
+        str: Шестнадцатеричный хеш SHA-1
     """
-    conn = get_connection()
-    try:
-        cursor = conn.cursor()
+    if external_id:
+        key = f"id\x1f{str(external_id).strip()}"
+    else:
+        key = "\x1f".join((
+            str(date).strip(),
+            f"{round(float(amount), 2):.2f}",
+            str(category).strip().casefold(),
+            " ".join(str(description or "").split()).casefold()
+        ))
+    if account and account != DEFAULT_ACCOUNT:
+        key += f"\x1faccount\x1f{account}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
 
-        if period == "today":
-            today = datetime.now().strftime('%Y-%m-%d')
-            cursor.execute(
-                'SELECT category, SUM(amount) as total FROM expenses WHERE date LIKE ? GROUP BY category ORDER BY total DESC',
-                (f'{today}%',)
-            )
-        elif period == "month":
-            current_month = datetime.now().strftime('%Y-%m')
-            cursor.execute(
-                'SELECT category, SUM(amount) as total FROM expenses WHERE date LIKE ? GROUP BY category ORDER BY total DESC',
-                (f'{current_month}%',)
-            )
-        else:  # all
-            cursor.execute(
-                'SELECT category, SUM(amount) as total FROM expenses GROUP BY category ORDER BY total DESC'
-            )
 
-        categories_data = cursor.fetchall()
+def _encode_descriptions(cursor):
+    """Переносит описания существующих операций в словарь описаний.
 
-        # Получаем общее количество операций и сумму
-        if period == "today":
-            cursor.execute(
-                'SELECT COUNT(*), SUM(amount) FROM expenses WHERE date LIKE ?',
-                (f'{today}%',)
-            )
-        elif period == "month":
-            cursor.execute(
-                'SELECT COUNT(*), SUM(amount) FROM expenses WHERE date LIKE ?',
-                (f'{current_month}%',)
-            )
-        else:
-            cursor.execute('SELECT COUNT(*), SUM(amount) FROM expenses')
+    Текст описания заменяется номером в словаре. Для базы, созданной до
+    появления словаря, триггер журнала изменений пересоздается с новой
+    колонкой, поэтому перенос не записывается в журнал как изменение операций.
+    """
+    cursor.execute('DROP TRIGGER IF EXISTS expenses_log_update')
+    cursor.execute('''
+        INSERT INTO descriptions (text)
+        SELECT DISTINCT description FROM expenses WHERE description IS NOT NULL
+        ON CONFLICT (text) DO NOTHING
+    ''')
+    cursor.execute('''
+        UPDATE expenses SET description_id = (SELECT id FROM descriptions WHERE text = expenses.description),
+                            description = NULL
+        WHERE description IS NOT NULL
+    ''')
 
-        count_result = cursor.fetchone()
-        total_expenses = count_result[0] if count_result[0] else 0
-        total_amount = count_result[1] if count_result[1] else 0
 
-        report = {
-            "period": period,
-            "total_expenses": total_expenses,
-            "total_amount": total_amount,
-            "categories": [(row[0], row[1]) for row in categories_data],
-            "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
+def _forget_descriptions():
+    """Очищает кэш номеров описаний."""
+    with _description_lock:
+        _description_ids.clear()
 
-        return report
 
-    except sqlite3.Error as e:
-        print(f"Ошибка генерации отчета: {e}")
-        return {
-            "period": period,
-            "total_expenses": 0,
-            "total_amount": 0,
-            "categories": [],
-            "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
-    finally:
-        conn.close()
+def _remember_descriptions(entries: Dict[tuple, int]):
+    """Добавляет зафиксированные номера описаний в кэш процесса."""
+    if not entries:
+        return
+    with _description_lock:
+        for key, description_id in entries.items():
+            _description_ids[key] = description_id
+            _description_ids.move_to_end(key)
+        while len(_description_ids) > DESCRIPTION_CACHE_SIZE:
+            _description_ids.popitem(last=False)
 
 
-def get_period_report_from_db(start_date: str, end_date: str) -> Dict[str, Any]:
-    """
-    Генерирует отчет за период из базы данных.
+def _description_id(cursor, text: Optional[str]) -> Optional[int]:
+    """Возвращает номер описания в словаре, добавляя новое описание.
+
+    Номера недавних описаний берутся из кэша в процессе, поэтому
+    повторяющееся описание не требует обращения к словарю. Номер нового
+    описания запоминается в соединении и попадает в общий кэш только
+    после фиксации транзакции.
 
     Args:
-        start_date: Начальная дата (YYYY-MM-DD)
-        end_date: Конечная дата (YYYY-MM-DD)
+        cursor: Курсор транзакции записи
+        text: Текст описания
 
     Returns:
-        Dict: Данные отчета
+        Optional[int]: Номер описания или None для операции без описания
+    """
+    if text is None:
+        return None
+    key = (getattr(cursor.connection, "path", None), text)
+    pending = getattr(cursor.connection, "pending_descriptions", None)
+    if pending is not None and key in pending:
+        return pending[key]
+    with _description_lock:
+        description_id = _description_ids.get(key)
+        if description_id is not None:
+            _description_ids.move_to_end(key)
+            return description_id
+
+    # Вставка без ошибки при совпадении: описание могла только что добавить
+    # другая транзакция, и проверка перед вставкой этого не исключает
+    cursor.execute('INSERT INTO descriptions (text) VALUES (?) ON CONFLICT (text) DO NOTHING', (text,))
+    cursor.execute('SELECT id FROM descriptions WHERE text = ?', (text,))
+    description_id = cursor.fetchone()[0]
+
+    if key[0] is not None and pending is not None:
+        pending[key] = description_id
+    return description_id
+
+
+def _backfill_content_hashes(cursor):
+    """Заполняет хеши существующих операций за один проход.
+
+    Уже существующие дубликаты не удаляются: хеш получает только первая
+    из одинаковых операций, у остальных он остается пустым.
+    """
+    seen = set()
+    updates = []
+    rows = cursor.execute(
+        f'SELECT id, date, amount, category, {DESCRIPTION_SQL}, external_id, account FROM expenses ORDER BY id'
+    )
+    for expense_id, date, amount, category, description, external_id, account in rows:
+        content_hash = compute_content_hash(date, amount, category, description, external_id, account)
+        if content_hash not in seen:
+            seen.add(content_hash)
+            updates.append((content_hash, expense_id))
+    cursor.executemany('UPDATE expenses SET content_hash = ? WHERE id = ?', updates)
+
+
+# Битовый индекс меток текущего процесса: метка -> номера операций
+_tag_index = {"key": None, "index": {}}
+
+
+def normalize_tags(tags: Iterable[str]) -> List[str]:
+    """Убирает пробелы по краям, пустые метки и повторы, сохраняя порядок."""
+    return list(dict.fromkeys(tag.strip() for tag in tags or () if tag and tag.strip()))
+
+
+def _tag_expense(cursor, expense_id: int, tags: List[str]):
+    """Привязывает метки к операции, создавая недостающие метки."""
+    cursor.executemany('INSERT OR IGNORE INTO tags (name) VALUES (?)', [(tag,) for tag in tags])
+    cursor.execute(
+        '''INSERT OR IGNORE INTO expense_tags (tag_id, expense_id)
+           SELECT id, ? FROM tags WHERE name IN (SELECT value FROM json_each(?))''',
+        (expense_id, json.dumps(tags, ensure_ascii=False))
+    )
+
+
+def load_tag_index(cursor) -> Dict[str, Bitmap]:
+    """
+    Возвращает битовый индекс меток, перестраивая его при изменении меток в базе.
+
+    Индекс строится одним проходом по первичному ключу expense_tags и
+    кэшируется в процессе. Триггеры увеличивают счетчик tag_state при
+    каждом изменении меток, поэтому изменения из других процессов
+    также приводят к перестроению.
+
+    Args:
+        cursor: Курсор открытого соединения
+
+    Returns:
+        Dict[str, Bitmap]: Метка -> множество номеров операций
+    """
+    cursor.execute('SELECT token, version FROM tag_state')
+    key = (DATABASE_FILE,) + tuple(cursor.fetchone())
+    if _tag_index["key"] != key:
+        cursor.execute(
+            '''SELECT t.name, e.expense_id FROM expense_tags e JOIN tags t ON t.id = e.tag_id
+               ORDER BY e.tag_id, e.expense_id'''
+        )
+        index = {name: Bitmap(expense_id for _, expense_id in rows)
+                 for name, rows in groupby(cursor, key=itemgetter(0))}
+        _tag_index.update(key=key, index=index)
+    return _tag_index["index"]
+
+
+def rebuild_tag_index() -> int:
+    """
+    Перестраивает битовый индекс меток по таблице expense_tags.
+
+    Returns:
+        int: Количество меток в индексе
+    """
+    _tag_index["key"] = None
+    conn = get_connection()
+    try:
+        return len(load_tag_index(conn.cursor()))
+    finally:
+        conn.close()
+
+
+def apply_tag_index(query: ExpenseQuery, index: Dict[str, Bitmap]) -> ExpenseQuery:
+    """
+    Разрешает фильтр по меткам в номера операций пересечением битовых множеств.
+
+    Args:
+        query: Запрос с метками
+        index: Битовый индекс меток
+
+    Returns:
+        ExpenseQuery: Запрос с заполненными полями ids или exclude_ids
+    """
+    if not query.needs_tag_ids:
+        return query
+
+    excluded = Bitmap()
+    for tag in query.exclude_tags:
+        excluded = excluded | index.get(tag, Bitmap())
+    if not query.tags:
+        return query.replace(exclude_ids=excluded)
+
+    # Пересечение начинается с самой редкой метки, чтобы промежуточные множества были меньше
+    bitmaps = sorted((index.get(tag, Bitmap()) for tag in query.tags), key=len)
+    ids = bitmaps[0]
+    for bitmap in bitmaps[1:]:
+        ids = ids & bitmap
+    return query.replace(ids=ids - excluded)
+
+
+def _compile(cursor, query: ExpenseQuery, **kwargs) -> tuple:
+    """Компилирует запрос, разрешая фильтр по меткам через битовый индекс."""
+    if query.needs_tag_ids:
+        query = apply_tag_index(query, load_tag_index(cursor))
+    return query.compile(**kwargs)
+
+
+def _insert_expenses(cursor, rows: List[tuple], on_conflict: str = "ignore") -> List[bool]:
+    """Вставляет пакет операций, обновляя каждый затронутый скетч один раз.
+
+    Статистика категорий читается и перезаписывается, поэтому вставка идет
+    под блокировкой записи: без открытой транзакции она начинается здесь
+    с BEGIN IMMEDIATE.
+
+    Args:
+        cursor: Курсор транзакции записи
+        rows: Кортежи (category, amount, description, date[, external_id[, account]]);
+            без счета операция относится к основному счету
+        on_conflict: Поведение при дубликате: 'ignore' пропускает операцию,
+            'update' обновляет существующую запись, 'keep' сохраняет повторную
+            операцию без хеша (как старые дубликаты при заполнении хешей)
+
+    Returns:
+        List[bool]: Для каждой строки True, если добавлена новая операция
+    """
+    if on_conflict not in CONFLICT_MODES:
+        raise ValueError(f"Неизвестный режим обработки дубликатов: '{on_conflict}'")
+    if not cursor.connection.in_transaction:
+        cursor.execute('BEGIN IMMEDIATE')
+
+    grouped = {}
+    stats = {}
+    changed = set()
+    inserted = []
+    batch_hashes = set()
+    for row in rows:
+        category, amount, description, date, external_id, account = (tuple(row) + (None, None))[:6]
+        account = account or DEFAULT_ACCOUNT
+        content_hash = compute_content_hash(date, amount, category, description, external_id, account)
+        mode = _row_conflict_mode(on_conflict, external_id, content_hash, batch_hashes)
+
+        # Оценка по статистике до этой операции: O(1) на вставку
+        if category not in stats:
+            stats[category] = _load_category_stats(cursor, category)
+        # Текст описания хранится в словаре, колонка description остается пустой
+        values = (category, amount, _description_id(cursor, description), date, external_id, content_hash,
+                  anomaly_score(stats[category], amount), account)
+
+        if mode == "update":
+            cursor.execute('SELECT category, amount, date, account FROM expenses WHERE content_hash = ?',
+                           (content_hash,))
+            old = cursor.fetchone()
+            is_new = old is None
+            cursor.execute(
+                '''INSERT INTO expenses (category, amount, description_id, date, external_id, content_hash, anomaly,
+                                       account)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (content_hash) WHERE content_hash IS NOT NULL DO UPDATE
+                   SET category = excluded.category, amount = excluded.amount,
+                       description_id = excluded.description_id, description = NULL, date = excluded.date,
+                       anomaly = excluded.anomaly''',
+                values
+            )
+            # Обновленная запись переносится в статистике и скетчах из прежней
+            # пары (категория, месяц) в новую; счет при обновлении не меняется
+            if old is not None and tuple(old)[:3] != (category, amount, date):
+                old_category, old_amount, old_date, old_account = old
+                if old_category not in stats:
+                    stats[old_category] = _load_category_stats(cursor, old_category)
+                stats[old_category].remove(RunningStats(1, abs(old_amount)))
+                stats[category].add(abs(amount))
+                changed.update({(old_category, old_date[:7], old_account), (category, date[:7], old_account)})
+        else:
+            cursor.execute(
+                '''INSERT INTO expenses (category, amount, description_id, date, external_id, content_hash, anomaly,
+                                       account)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (content_hash) WHERE content_hash IS NOT NULL DO NOTHING''',
+                values
+            )
+            is_new = cursor.rowcount == 1
+            if not is_new and mode == "keep":
+                # Хеш уже занят такой же операцией: повтор сохраняется без хеша
+                cursor.execute(
+                    '''INSERT INTO expenses (category, amount, description_id, date, external_id, content_hash,
+                                           anomaly, account)
+                       VALUES (?, ?, ?, ?, ?, NULL, ?, ?)''',
+                    values[:5] + values[6:]
+                )
+                is_new = True
+
+        if is_new:
+            batch_hashes.add(content_hash)
+            grouped.setdefault((category, date[:7], account), []).append(amount)
+            stats[category].add(abs(amount))
+        inserted.append(is_new)
+
+    for key, amounts in grouped.items():
+        if key not in changed:
+            _update_sketch(cursor, *key, amounts)
+    for key in changed:
+        _rebuild_sketch(cursor, *key)
+    for category in {key[0] for key in grouped.keys() | changed}:
+        _save_category_stats(cursor, category, stats[category])
+
+    return inserted
+
+
+def _row_conflict_mode(on_conflict: str, external_id: Optional[str], content_hash: str, batch_hashes: set) -> str:
+    """Возвращает режим дубликатов для строки пакета.
+
+    Повтор строки без внешнего идентификатора внутри одного пакета - это
+    отдельная операция (две одинаковые покупки в одной выгрузке), а не
+    дубликат; с уже сохраненными операциями строки сравниваются как обычно.
+    """
+    if external_id is None and content_hash in batch_hashes:
+        return "keep"
+    return on_conflict
+
+
+def _insert_expense(cursor, category: str, amount: float, description: str, date: str,
+                    external_id: str = None, on_conflict: str = "ignore", account: str = None) -> bool:
+    """Вставляет операцию и обновляет связанные с ней агрегаты."""
+    row = (category, amount, description, date, external_id, account)
+    return _insert_expenses(cursor, [row], on_conflict)[0]
+
+
+def add_expense_to_db(category: str, amount: float, description: str = "", date: str = None,
+                      external_id: str = None, on_conflict: str = None, tags: List[str] = None,
+                      account: str = None) -> bool:
+    """
+    Добавляет новую операцию в базу данных.
+
+    Операция без внешнего идентификатора по умолчанию сохраняется, даже
+    если такая же уже есть: две одинаковые покупки за день - разные
+    операции. Операция с внешним идентификатором по умолчанию не
+    добавляется повторно.
+
+    Args:
+        category: Категория операции
+        amount: Сумма операции
+        description: Описание операции
+        date: Дата операции (по умолчанию текущее время)
+        external_id: Внешний идентификатор операции
+        on_conflict: Поведение при дубликате ('keep', 'ignore' или 'update'; по умолчанию
+            'keep', а для операции с внешним идентификатором 'ignore')
+        tags: Метки операции
+        account: Счет операции (по умолчанию основной)
+
+    Returns:
+        bool: True если успешно, False если ошибка или пропущенный дубликат
+    """
+    date = date or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    tags = normalize_tags(tags)
+    if on_conflict is None:
+        on_conflict = "keep" if external_id is None else "ignore"
+
+    def work(cursor):
+        inserted = _insert_expense(cursor, category, amount, description, date, external_id, on_conflict,
+                                   account)
+        if on_conflict == "keep":
+            # Повтор сохраняется без хеша; запись идет под блокировкой,
+            # поэтому добавленная операция - последняя
+            cursor.execute('SELECT id, anomaly FROM expenses ORDER BY id DESC LIMIT 1')
+        else:
+            cursor.execute(
+                'SELECT id, anomaly FROM expenses WHERE content_hash = ?',
+                (compute_content_hash(date, amount, category, description, external_id, account),)
+            )
+        row = cursor.fetchone()
+        if row and tags and (inserted or on_conflict == "update"):
+            _tag_expense(cursor, row[0], tags)
+        return inserted, row[1] if inserted and row else None
+
+    try:
+        inserted, anomaly = run_write(work)
+    except sqlite3.Error as e:
+        print(f"Ошибка добавления операции: {e}")
+        return False
+
+    if not inserted and on_conflict == "ignore":
+        print("Такая операция уже существует")
+        return False
+    if anomaly is not None:
+        print(f"Внимание: необычная сумма для категории '{category}' "
+              f"(отклонение от среднего {anomaly:+.1f} σ)")
+    return True
+
+
+def import_expenses_to_db(rows: List[tuple], on_conflict: str = "ignore") -> Dict[str, int]:
+    """
+    Импортирует пакет операций одной транзакцией с дедупликацией по хешу.
+
+    Операции сравниваются с уже сохраненными; одинаковые строки без
+    внешнего идентификатора внутри пакета сохраняются все.
+
+    Args:
+        rows: Кортежи (category, amount, description, date[, external_id[, account]])
+        on_conflict: Поведение при дубликате ('ignore', 'update' или 'keep')
+
+    Returns:
+        Dict: Количество добавленных ('inserted') и повторных ('duplicates') операций
+    """
+    try:
+        inserted = run_write(lambda cursor: _insert_expenses(cursor, rows, on_conflict))
+    except sqlite3.Error as e:
+        print(f"Ошибка импорта операций: {e}")
+        return {"inserted": 0, "duplicates": 0}
+
+    added = sum(inserted)
+    return {"inserted": added, "duplicates": len(inserted) - added}
+
+
+def get_change_head() -> int:
+    """
+    Возвращает номер последней записи журнала изменений.
+
+    Потребитель, выгрузивший все операции целиком, продолжает с этого
+    номера через iter_changes_from_db.
+
+    Returns:
+        int: Номер последнего изменения (0, если изменений не было)
     """
     conn = get_connection()
     try:
         cursor = conn.cursor()
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'")
+        row = cursor.fetchone()
+        return row[0] if row else 0
+    except sqlite3.Error as e:
+        print(f"Ошибка чтения журнала изменений: {e}")
+        return 0
+    finally:
+        conn.close()
 
-        # Операции за период
-        cursor.execute(
-            '''SELECT category, amount, description, date 
-               FROM expenses 
-               WHERE date BETWEEN ? AND ? 
-               ORDER BY date''',
-            (f"{start_date} 00:00:00", f"{end_date} 23:59:59")
-        )
 
-        expenses_data = [dict(row) for row in cursor.fetchall()]
+def iter_changes_from_db(since: int = 0, chunk_size: int = 1000) -> Iterator[Dict[str, Any]]:
+    """
+    Выдает изменения операций с номером больше since в порядке номеров.
+
+    Журнал читается порциями по первичному ключу (каждая порция - отдельный
+    короткий запрос), поэтому время зависит от числа изменений, а не от
+    размера таблицы операций, и чтение не удерживает снимок базы. Для
+    вставок и изменений выдается текущее состояние операции; если
+    операция уже удалена, ее поля равны None.
 
-        # Суммы по дням
+    Args:
+        since: Номер последнего обработанного изменения
+        chunk_size: Количество изменений в одной порции
+
+    Yields:
+        Dict: Изменение с ключами 'seq', 'op', 'expense_id', 'changed_at',
+            'category', 'amount', 'description', 'date', 'account'
+
+    Raises:
+        ValueError: Если изменения после since уже удалены сжатием журнала
+    """
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT truncated FROM change_log_state')
+        truncated = cursor.fetchone()[0]
+        if since < truncated:
+            raise ValueError(f"Журнал изменений сжат до номера {truncated}; "
+                             f"выполните полную выгрузку и продолжите с get_change_head()")
+
+        while True:
+            cursor.execute(
+                f'''SELECT c.seq, c.op, c.expense_id, c.changed_at,
+                          e.category, e.amount, {DESCRIPTION_SQL} AS description, e.date, e.account
+                   FROM change_log c LEFT JOIN expenses e ON e.id = c.expense_id AND c.op != 'delete'
+                   WHERE c.seq > ? ORDER BY c.seq LIMIT ?''',
+                (since, chunk_size)
+            )
+            rows = cursor.fetchall()
+            for row in rows:
+                yield dict(row)
+            if len(rows) < chunk_size:
+                break
+            since = rows[-1]["seq"]
+    except sqlite3.Error as e:
+        print(f"Ошибка чтения журнала изменений: {e}")
+    finally:
+        conn.close()
+
+
+def compact_changes(retention_days: Optional[int] = CHANGE_RETENTION_DAYS) -> Dict[str, int]:
+    """
+    Сжимает журнал изменений.
+
+    Для каждой операции остается только последняя запись: потребитель
+    все равно получает текущее состояние операции, поэтому более ранние
+    записи ничего не добавляют. Записи старше срока хранения удаляются;
+    потребители, отставшие дальше удаленных номеров, получают ошибку и
+    должны выполнить полную выгрузку.
+
+    Args:
+        retention_days: Срок хранения записей в днях (None - без ограничения)
+
+    Returns:
+        Dict: Количество удаленных замещенных ('superseded') и устаревших ('expired') записей
+    """
+    def work(cursor):
         cursor.execute(
-            '''SELECT DATE(date) as day, SUM(amount) as daily_total 
-               FROM expenses 
-               WHERE date BETWEEN ? AND ? 
-               GROUP BY DATE(date) 
-               ORDER BY day''',
-            (f"{start_date} 00:00:00", f"{end_date} 23:59:59")
+            '''DELETE FROM change_log WHERE EXISTS (
+                   SELECT 1 FROM change_log later
+                   WHERE later.expense_id = change_log.expense_id AND later.seq > change_log.seq
+               )'''
         )
+        superseded = cursor.rowcount
+        expired = 0
+        if retention_days is not None:
+            cursor.execute(
+                "SELECT MAX(seq) FROM change_log WHERE changed_at < datetime('now', ?)",
+                (f"-{int(retention_days)} days",)
+            )
+            limit = cursor.fetchone()[0]
+            if limit:
+                cursor.execute('DELETE FROM change_log WHERE seq <= ?', (limit,))
+                expired = cursor.rowcount
+                cursor.execute('UPDATE change_log_state SET truncated = MAX(truncated, ?)', (limit,))
+        return {"superseded": superseded, "expired": expired}
+
+    try:
+        return run_write(work)
+    except sqlite3.Error as e:
+        print(f"Ошибка сжатия журнала изменений: {e}")
+        return {"superseded": 0, "expired": 0}
+
 
-        daily_totals = {row[0]: row[1] for row in cursor.fetchall()}
+def get_expenses_from_db(period: Union[str, ExpenseQuery] = "all") -> List[Dict[str, Any]]:
+    """
+    Получает операции из базы данных за указанный период.
 
-        # Общая сумма всех операций за период
-        total_amount = sum(expense['amount'] for expense in expenses_data)
+    Args:
+        period: Период для фильтрации ('today', 'month', 'all') или запрос ExpenseQuery
+
+    Returns:
+        List[Dict]: Список операций
+    """
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(*_compile(cursor, ExpenseQuery.coerce(period)))
+
+        expenses = [dict(row) for row in cursor.fetchall()]
+        return expenses
+
+    except sqlite3.Error as e:
+        print(f"Ошибка получения операций: {e}")
+        return []
+    finally:
+        conn.close()
+
+
+def iter_expenses_from_db(period: Union[str, ExpenseQuery] = "all", chunk_size: int = 1000) -> Iterator[Dict[str, Any]]:
+    """
+    Построчно выдает операции за период, читая их из базы порциями.
+
+    Если потребитель прекращает перебор (например, закрыт пейджер),
+    оставшиеся строки не читаются, а соединение закрывается.
+
+    Args:
+        period: Период для фильтрации ('today', 'month', 'all') или запрос ExpenseQuery
+        chunk_size: Количество строк, читаемых за один раз
+
+    Yields:
+        Dict: Данные операции
+    """
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(*_compile(cursor, ExpenseQuery.coerce(period)))
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(row)
+    except sqlite3.Error as e:
+        print(f"Ошибка получения операций: {e}")
+    finally:
+        conn.close()
+
+
+def get_category_report_from_db(period: Union[str, ExpenseQuery] = "month") -> Dict[str, Any]:
+    """
+    Генерирует отчет по категориям из базы данных.
+
+    Args:
+        period: Период для отчета ('today', 'month', 'all') или запрос ExpenseQuery
+
+    Returns:
+        Dict: Данные отчета
+    """
+    query = ExpenseQuery.coerce(period)
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+
+        cursor.execute(*_compile(cursor, query,
+            select='category, SUM(amount) AS total', group_by='category', order_by='total DESC'
+        ))
+        categories_data = cursor.fetchall()
+
+        # Получаем общее количество операций и сумму
+        cursor.execute(*_compile(cursor, query, select='COUNT(*), SUM(amount)', order_by=None))
+
+        count_result = cursor.fetchone()
+        total_expenses = count_result[0] if count_result[0] else 0
+        total_amount = count_result[1] if count_result[1] else 0
 
         report = {
-            "period": f"{start_date} - {end_date}",
-            "total_expenses": len(expenses_data),
+            "period": query.describe(),
+            "total_expenses": total_expenses,
             "total_amount": total_amount,
+            "categories": [(row[0], row[1]) for row in categories_data],
+            "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+        return report
+
+    except sqlite3.Error as e:
+        print(f"Ошибка генерации отчета: {e}")
+        return {
+            "period": query.describe(),
+            "total_expenses": 0,
+            "total_amount": 0,
+            "categories": [],
+            "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+    finally:
+        conn.close()
+
+
+def get_period_report_from_db(start_date: str, end_date: str, bucket: str = "day",
+                              query: ExpenseQuery = None) -> Dict[str, Any]:
+    """
+    Генерирует отчет за период из базы данных.
+
+    Фильтрация и группировка выполняются по индексированным целочисленным
+    колонкам day и month, без разбора текстовых дат в каждой строке.
+
+    Args:
+        start_date: Начальная дата (YYYY-MM-DD)
+        end_date: Конечная дата (YYYY-MM-DD)
+        bucket: Группировка сумм ('day', 'week' или 'month')
+        query: Дополнительные фильтры (категории, суммы, тип, текст)
+
+    Returns:
+        Dict: Данные отчета
+    """
+    expression, label = PERIOD_BUCKETS[bucket]
+    query = ExpenseQuery.coerce(query).replace(period="all", start_date=start_date, end_date=end_date)
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+
+        # Количество и сумма операций за период
+        cursor.execute(*_compile(cursor, query, select='COUNT(*), SUM(amount)', order_by=None))
+        total_expenses, total_amount = cursor.fetchone()
+
+        # Суммы по дням, неделям или месяцам
+        cursor.execute(*_compile(cursor, query,
+            select=f'{expression} AS bucket, SUM(amount) AS bucket_total', group_by='bucket', order_by='bucket'
+        ))
+
+        daily_totals = {label(row[0]): row[1] for row in cursor.fetchall()}
+
+        report = {
+            "period": query.describe(),
+            "total_expenses": total_expenses,
+            "total_amount": total_amount or 0,
             "daily_totals": daily_totals,
             "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
@@ -302,11 +1458,675 @@ def get_period_report_from_db(start_date: str, end_date: str) -> Dict[str, Any]:
     except sqlite3.Error as e:
         print(f"Ошибка генерации отчета за период: {e}")
         return {
-            "period": f"{start_date} - {end_date}",
+            "period": query.describe(),
             "total_expenses": 0,
             "total_amount": 0,
             "daily_totals": {},
             "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
     finally:
-        conn.close()
\ No newline at end of file
+        conn.close()
+
+
+def get_timeseries_report_from_db(period: Union[str, ExpenseQuery] = "all",
+                                  bucket: str = "month") -> Dict[str, Any]:
+    """
+    Генерирует временной ряд доходов и расходов одним агрегирующим запросом.
+
+    Args:
+        period: Период ('today', 'month', 'all') или запрос ExpenseQuery
+        bucket: Шаг ряда ('day', 'week', 'month' или 'year')
+
+    Returns:
+        Dict: Данные отчета; ключ 'timeseries' содержит кортежи
+            (интервал, операций, доходы, расходы, итог)
+    """
+    expression, label = PERIOD_BUCKETS[bucket]
+    query = ExpenseQuery.coerce(period)
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(*_compile(cursor, query,
+            select=f'''{expression} AS bucket, COUNT(*),
+                       TOTAL(CASE WHEN amount > 0 THEN amount END),
+                       TOTAL(CASE WHEN amount < 0 THEN amount END),
+                       SUM(amount)''',
+            group_by='bucket', order_by='bucket'
+        ))
+        timeseries = [(label(row[0]), row[1], row[2], row[3], row[4]) for row in cursor.fetchall()]
+
+        return {
+            "period": query.describe(),
+            "total_expenses": sum(row[1] for row in timeseries),
+            "total_amount": sum(row[4] for row in timeseries),
+            "timeseries": timeseries,
+            "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+    except sqlite3.Error as e:
+        print(f"Ошибка генерации временного ряда: {e}")
+        return {
+            "period": query.describe(),
+            "total_expenses": 0,
+            "total_amount": 0,
+            "timeseries": [],
+            "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+    finally:
+        conn.close()
+
+
+def get_anomaly_report_from_db(period: Union[str, ExpenseQuery] = "all") -> Dict[str, Any]:
+    """
+    Возвращает операции, отмеченные при добавлении как необычные для категории.
+
+    Отметки хранятся в колонке anomaly и читаются по частичному индексу,
+    без пересчета статистики по истории операций.
+
+    Args:
+        period: Период ('today', 'month', 'all') или запрос ExpenseQuery
+
+    Returns:
+        Dict: Данные отчета; ключ 'anomalies' содержит кортежи
+            (дата, категория, сумма, описание, отклонение)
+    """
+    query = ExpenseQuery.coerce(period).replace(anomalies=True)
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(*_compile(cursor, query, select=f'date, category, amount, {DESCRIPTION_SQL}, anomaly'))
+        anomalies = [tuple(row) for row in cursor.fetchall()]
+
+    except sqlite3.Error as e:
+        print(f"Ошибка получения аномалий: {e}")
+        anomalies = []
+    finally:
+        conn.close()
+
+    return {
+        "period": query.describe(),
+        "total_expenses": len(anomalies),
+        "total_amount": sum(row[2] for row in anomalies),
+        "anomalies": anomalies,
+        "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+
+def get_account_report_from_db(period: Union[str, ExpenseQuery] = "all") -> Dict[str, Any]:
+    """
+    Генерирует сводный отчет по всем счетам одним агрегирующим запросом.
+
+    Args:
+        period: Период ('today', 'month', 'all') или запрос ExpenseQuery
+
+    Returns:
+        Dict: Данные отчета; ключ 'accounts' содержит кортежи
+            (счет, операций, доходы, расходы, итого)
+    """
+    query = ExpenseQuery.coerce(period)
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(*_compile(cursor, query,
+            select='''account, COUNT(*), TOTAL(CASE WHEN amount > 0 THEN amount END),
+                      TOTAL(CASE WHEN amount < 0 THEN amount END), TOTAL(amount)''',
+            group_by='account', order_by='account'
+        ))
+        accounts = [tuple(row) for row in cursor.fetchall()]
+
+    except sqlite3.Error as e:
+        print(f"Ошибка генерации отчета по счетам: {e}")
+        accounts = []
+    finally:
+        conn.close()
+
+    return {
+        "period": query.describe(),
+        "total_expenses": sum(row[1] for row in accounts),
+        "total_amount": sum(row[4] for row in accounts),
+        "accounts": accounts,
+        "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+
+def get_merchant_report_from_db(period: Union[str, ExpenseQuery] = "all") -> Dict[str, Any]:
+    """
+    Генерирует отчет с количеством и суммой операций по каждому описанию (магазину, услуге).
+
+    Операции группируются по целому номеру описания в словаре, тексты
+    читаются только для итоговых групп.
+
+    Args:
+        period: Период ('today', 'month', 'all') или запрос ExpenseQuery
+
+    Returns:
+        Dict: Данные отчета; ключ 'merchants' содержит кортежи (описание, операций, сумма)
+            по убыванию суммы по модулю
+    """
+    query = ExpenseQuery.coerce(period)
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(*_compile(cursor, query, select='description_id, description, COUNT(*), TOTAL(amount)',
+                                 group_by='description_id, description', order_by=None))
+        groups = cursor.fetchall()
+        cursor.execute(
+            'SELECT id, text FROM descriptions WHERE id IN (SELECT value FROM json_each(?))',
+            (json.dumps([row[0] for row in groups if row[0] is not None]),)
+        )
+        texts = dict(cursor.fetchall())
+
+        # Строки, записанные в обход словаря, сливаются с группой того же текста
+        totals = {}
+        for description_id, description, count, amount in groups:
+            text = description if description is not None else texts.get(description_id, "")
+            total = totals.setdefault(text, [0, 0.0])
+            total[0] += count
+            total[1] += amount
+        merchants = sorted(((text, count, amount) for text, (count, amount) in totals.items()),
+                           key=lambda row: (-abs(row[2]), row[0]))
+
+    except sqlite3.Error as e:
+        print(f"Ошибка генерации отчета по описаниям: {e}")
+        merchants = []
+    finally:
+        conn.close()
+
+    return {
+        "period": query.describe(),
+        "total_expenses": sum(row[1] for row in merchants),
+        "total_amount": sum(row[2] for row in merchants),
+        "merchants": merchants,
+        "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+
+def get_monthly_category_totals_from_db(query: ExpenseQuery) -> List[tuple]:
+    """
+    Считает количество и сумму операций по месяцам, счетам и категориям за один проход.
+
+    Args:
+        query: Запрос ExpenseQuery; обычно ограничен диапазоном дат пакета отчетов
+
+    Returns:
+        List[tuple]: Кортежи (номер месяца, счет, категория, операций, сумма)
+    """
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(*_compile(cursor, query, select='month, account, category, COUNT(*), TOTAL(amount)',
+                                 group_by='month, account, category', order_by=None))
+        return [tuple(row) for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        print(f"Ошибка генерации пакета отчетов: {e}")
+        return []
+    finally:
+        conn.close()
+
+
+def get_stats_report_from_db(period: Union[str, ExpenseQuery] = "all") -> Dict[str, Any]:
+    """
+    Генерирует отчет со статистикой сумм операций по категориям.
+
+    Все показатели считаются одним запросом с группировкой агрегатными
+    функциями median, percentile и stddev, зарегистрированными на
+    соединении, поэтому суммы не выгружаются из базы. Медиана, p90 и
+    стандартное отклонение считаются по модулю суммы.
+
+    Args:
+        period: Период ('today', 'month', 'all') или запрос ExpenseQuery
+
+    Returns:
+        Dict: Данные отчета; ключ 'stats' содержит кортежи (категория, операций,
+            сумма, среднее, медиана, p90, стандартное отклонение)
+    """
+    query = ExpenseQuery.coerce(period)
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(*_compile(
+            cursor, query,
+            select='category, COUNT(*), TOTAL(amount), AVG(ABS(amount)), median(ABS(amount)), '
+                   'percentile(ABS(amount), 90), stddev(ABS(amount))',
+            group_by='category', order_by='category'
+        ))
+        stats = [tuple(row) for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        print(f"Ошибка генерации статистики по категориям: {e}")
+        stats = []
+    finally:
+        conn.close()
+
+    return {
+        "period": query.describe(),
+        "total_expenses": sum(row[1] for row in stats),
+        "total_amount": sum(row[2] for row in stats),
+        "stats": stats,
+        "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+
+def get_tag_report_from_db(period: Union[str, ExpenseQuery] = "all") -> Dict[str, Any]:
+    """
+    Генерирует отчет с количеством и суммой операций по каждой метке.
+
+    Номера отобранных запросом операций собираются в битовое множество,
+    и итоги каждой метки считаются по его пересечению с битовым индексом
+    метки, без соединения с таблицей связей.
+
+    Args:
+        period: Период ('today', 'month', 'all') или запрос ExpenseQuery
+
+    Returns:
+        Dict: Данные отчета; ключ 'tags' содержит кортежи (метка, операций, сумма)
+    """
+    query = ExpenseQuery.coerce(period)
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        index = load_tag_index(cursor)
+        cursor.execute(*apply_tag_index(query, index).compile(select='id, amount', order_by=None))
+        amounts = dict(cursor.fetchall())
+
+    except sqlite3.Error as e:
+        print(f"Ошибка генерации отчета по меткам: {e}")
+        index, amounts = {}, {}
+    finally:
+        conn.close()
+
+    return {
+        "period": query.describe(),
+        "total_expenses": len(amounts),
+        "total_amount": sum(amounts.values()),
+        "tags": build_tag_totals(index, amounts),
+        "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+
+def build_tag_totals(index: Dict[str, Bitmap], amounts: Dict[int, float]) -> List[tuple]:
+    """
+    Считает итоги меток пересечением их битовых множеств с отобранными операциями.
+
+    Args:
+        index: Битовый индекс меток
+        amounts: Номер отобранной операции -> сумма
+
+    Returns:
+        List[tuple]: Кортежи (метка, операций, сумма) по убыванию числа операций
+    """
+    selected = Bitmap(amounts)
+    totals = []
+    for tag, bitmap in index.items():
+        common = bitmap & selected
+        if common:
+            totals.append((tag, len(common), sum(amounts[expense_id] for expense_id in common)))
+    return sorted(totals, key=lambda row: (-row[1], row[0]))
+
+
+def build_tree(parents: Dict[str, Optional[str]], totals: Dict[str, tuple]) -> List[tuple]:
+    """
+    Раскладывает суммы по поддеревьям в порядке обхода дерева категорий.
+
+    Args:
+        parents: Категория -> родительская категория (None для корневых)
+        totals: Категория -> (сумма поддерева, собственная сумма, операций поддерева)
+
+    Returns:
+        List[tuple]: Кортежи (категория, уровень, сумма поддерева, собственная
+            сумма, операций) для категорий с операциями; потомки следуют за родителем
+    """
+    children = {}
+    for name in totals:
+        parent = parents.get(name)
+        children.setdefault(parent if parent in totals else None, []).append(name)
+
+    rows = []
+    stack = [(name, 0) for name in sorted(children.get(None, []), reverse=True)]
+    while stack:
+        name, level = stack.pop()
+        rows.append((name, level, *totals[name]))
+        stack.extend((child, level + 1) for child in sorted(children.get(name, []), reverse=True))
+    return rows
+
+
+def get_category_tree_report_from_db(period: Union[str, ExpenseQuery] = "month") -> Dict[str, Any]:
+    """
+    Генерирует отчет с суммами по каждому поддереву категорий.
+
+    Суммы операций по категориям соединяются с таблицей замыкания и
+    агрегируются по предкам одним запросом, поэтому итог каждого
+    поддерева получается без повторных проходов по операциям.
+    Категории операций, не зарегистрированные в дереве, считаются
+    корневыми.
+
+    Args:
+        period: Период ('today', 'month', 'all') или запрос ExpenseQuery
+
+    Returns:
+        Dict: Данные отчета; ключ 'tree' содержит кортежи
+            (категория, уровень, сумма поддерева, собственная сумма, операций)
+    """
+    query = ExpenseQuery.coerce(period)
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        totals_sql, params = _compile(
+            cursor, query,
+            select='category, SUM(amount) AS total, COUNT(*) AS operations', group_by='category', order_by=None
+        )
+        cursor.execute(
+            f'''WITH totals AS ({totals_sql})
+                SELECT COALESCE(t.ancestor, totals.category) AS node,
+                       SUM(totals.total),
+                       TOTAL(CASE WHEN t.depth IS NULL OR t.depth = 0 THEN totals.total END),
+                       SUM(totals.operations)
+                FROM totals LEFT JOIN category_tree t ON t.descendant = totals.category
+                GROUP BY node''',
+            params
+        )
+        totals = {row[0]: (row[1], row[2], row[3]) for row in cursor.fetchall()}
+        cursor.execute('SELECT name, parent FROM categories')
+        tree = build_tree(dict(cursor.fetchall()), totals)
+
+    except sqlite3.Error as e:
+        print(f"Ошибка генерации отчета по дереву категорий: {e}")
+        tree = []
+    finally:
+        conn.close()
+
+    roots = [row for row in tree if row[1] == 0]
+    return {
+        "period": query.describe(),
+        "total_expenses": sum(row[4] for row in roots),
+        "total_amount": sum(row[2] for row in roots),
+        "tree": tree,
+        "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+
+def build_pivot(cells: List[tuple]) -> Dict[str, Any]:
+    """
+    Собирает сводную таблицу из ячеек (категория, интервал, сумма, операций).
+
+    Args:
+        cells: Агрегаты по парам категория-интервал
+
+    Returns:
+        Dict: 'columns' - интервалы по возрастанию, 'rows' - кортежи
+            (категория, суммы по интервалам, итог по категории), 'count' -
+            количество операций
+    """
+    columns = sorted({cell[1] for cell in cells})
+    position = {column: index for index, column in enumerate(columns)}
+    rows = {}
+    for category, column, amount, _ in cells:
+        rows.setdefault(category, [0] * len(columns))[position[column]] += amount
+
+    return {
+        "columns": columns,
+        "rows": [(category, values, sum(values)) for category, values in sorted(rows.items())],
+        "count": sum(cell[3] for cell in cells)
+    }
+
+
+def get_pivot_report_from_db(period: Union[str, ExpenseQuery] = "all",
+                             bucket: str = "month") -> Dict[str, Any]:
+    """
+    Генерирует сводную таблицу категория x интервал одним агрегирующим запросом.
+
+    Args:
+        period: Период ('today', 'month', 'all') или запрос ExpenseQuery
+        bucket: Интервал колонок ('day', 'week', 'month' или 'year')
+
+    Returns:
+        Dict: Данные отчета; ключ 'pivot' содержит колонки и строки таблицы
+    """
+    expression, label = PERIOD_BUCKETS[bucket]
+    query = ExpenseQuery.coerce(period)
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(*_compile(cursor, query,
+            select=f'category, {expression} AS bucket, SUM(amount), COUNT(*)',
+            group_by='category, bucket', order_by=None
+        ))
+        pivot = build_pivot([(row[0], label(row[1]), row[2], row[3]) for row in cursor.fetchall()])
+
+    except sqlite3.Error as e:
+        print(f"Ошибка генерации сводной таблицы: {e}")
+        pivot = build_pivot([])
+    finally:
+        conn.close()
+
+    return {
+        "period": query.describe(),
+        "total_expenses": pivot.pop("count"),
+        "total_amount": sum(row[2] for row in pivot["rows"]),
+        "pivot": pivot,
+        "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+
+def _month_bounds(query: ExpenseQuery) -> ExpenseQuery:
+    """Заменяет границы вида 'YYYY-MM' первым и последним днем месяца."""
+    changes = {}
+    if query.start_date and len(query.start_date) == 7:
+        changes["start_date"] = f"{query.start_date}-01"
+    if query.end_date and len(query.end_date) == 7:
+        year, month = int(query.end_date[:4]), int(query.end_date[5:7])
+        changes["end_date"] = f"{query.end_date}-{calendar.monthrange(year, month)[1]:02d}"
+    return query.replace(**changes) if changes else query
+
+
+def _sketch_plan(query: ExpenseQuery) -> Optional[tuple]:
+    """Разбивает запрос на целые месяцы для скетчей и неполные крайние месяцы.
+
+    Скетчи хранятся по категориям, месяцам и счетам, поэтому по ним
+    считается запрос с периодом 'month' или 'all', счетом и категориями.
+    Месяц, который граница дат захватывает не целиком, считается точно
+    по операциям.
+
+    Returns:
+        Optional[tuple]: (первый месяц, последний месяц, запросы для крайних
+        месяцев) или None, если фильтры не позволяют использовать скетчи.
+    """
+    if query.period == "today" or query.min_amount is not None or query.max_amount is not None \
+            or query.kind or query.text or query.anomalies or query.tags or query.exclude_tags \
+            or query.ids is not None or query.exclude_ids is not None:
+        return None
+    start, end = query.start_date, query.end_date
+    if query.period == "month":
+        if start or end:
+            return None
+        current_month = datetime.now().strftime('%Y-%m')
+        return current_month, current_month, []
+
+    first, last = (start or "")[:7], (end or "9999-99")[:7]
+    edges = []
+    if start and start[8:10] != "01":
+        month_end = f"{first}-{calendar.monthrange(int(first[:4]), int(first[5:7]))[1]:02d}"
+        edges.append(query.replace(start_date=start, end_date=min(end, month_end) if end else month_end))
+        first = month_to_str(month_number(start) + 1)
+    if end and first <= last:
+        year, month = int(last[:4]), int(last[5:7])
+        if end[8:10] != f"{calendar.monthrange(year, month)[1]:02d}":
+            edges.append(query.replace(start_date=f"{last}-01", end_date=end))
+            last = month_to_str(month_number(end) - 1)
+    return first, last, edges
+
+
+def get_distribution_report_from_db(period: Union[str, ExpenseQuery] = "month") -> Dict[str, Any]:
+    """
+    Генерирует отчет о распределении сумм операций по категориям.
+
+    Месячные скетчи (по категориям и счетам) объединяются за выбранный
+    период, поэтому время и память не зависят от количества операций.
+    Неполные крайние месяцы диапазона дат и запросы с фильтрами, которых
+    нет в ключе скетча (период 'today', суммы, текст, метки), считаются
+    по отобранным операциям.
+
+    Args:
+        period: Период ('today', 'month', 'all') или запрос ExpenseQuery;
+            границы дат задаются днями (YYYY-MM-DD) или месяцами (YYYY-MM)
+
+    Returns:
+        Dict: Данные отчета с медианой, p90 и p99 по категориям
+    """
+    query = _month_bounds(ExpenseQuery.coerce(period))
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        sketches = {}
+        totals = {}
+
+        plan = _sketch_plan(query)
+        first, last, row_queries = plan if plan is not None else (None, None, [query])
+        for row_query in row_queries:
+            cursor.execute(*_compile(cursor, row_query, select='category, amount', order_by=None))
+            for category, amount in cursor:
+                sketches.setdefault(category, QuantileSketch()).add(abs(amount))
+                totals[category] = totals.get(category, 0) + amount
+        if plan is not None and first <= last:
+            sql = 'SELECT category, total, sketch FROM expense_sketches WHERE month BETWEEN ? AND ?'
+            params = [first, last]
+            if query.account:
+                sql += ' AND account = ?'
+                params.append(query.account)
+            if query.categories:
+                sql += ' AND category IN (SELECT value FROM json_each(?))'
+                params.append(json.dumps(query.categories, ensure_ascii=False))
+            cursor.execute(sql, params)
+            for category, total, data in cursor:
+                sketch = QuantileSketch.from_json(data)
+                if category in sketches:
+                    sketches[category].merge(sketch)
+                else:
+                    sketches[category] = sketch
+                totals[category] = totals.get(category, 0) + total
+
+        distribution = [
+            (category, sketch.count, sketch.quantile(0.5),
+             sketch.quantile(0.9), sketch.quantile(0.99))
+            for category, sketch in sorted(sketches.items())
+        ]
+
+    except sqlite3.Error as e:
+        print(f"Ошибка генерации отчета о распределении: {e}")
+        sketches, totals, distribution = {}, {}, []
+    finally:
+        conn.close()
+
+    return {
+        "period": query.describe(),
+        "total_expenses": sum(sketch.count for sketch in sketches.values()),
+        "total_amount": sum(totals.values()),
+        "distribution": distribution,
+        "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+
+def snapshot(target: str = None, pages: int = BACKUP_PAGES_PER_STEP,
+             progress: Callable[[int, int, int], None] = None) -> Optional[sqlite3.Connection]:
+    """
+    Создает онлайн-копию базы данных через sqlite3.Connection.backup.
+
+    Копирование идет шагами по ``pages`` страниц, и между шагами
+    блокировка базы освобождается, поэтому запись в базу не блокируется
+    на время всего копирования.
+
+    Args:
+        target: Путь к файлу копии; None - копия в памяти
+        pages: Количество страниц за один шаг
+        progress: Функция progress(status, remaining, total), вызываемая после шага
+
+    Returns:
+        Optional[sqlite3.Connection]: Соединение с копией в памяти (если target
+            не указан, закрывает вызывающий код) или None для копии в файл
+    """
+    source = sqlite3.connect(DATABASE_FILE, timeout=BUSY_TIMEOUT_MS / 1000)
+    try:
+        if target is None:
+            copy = sqlite3.connect(':memory:', factory=TrackerConnection, check_same_thread=False)
+            copy.row_factory = sqlite3.Row
+        else:
+            copy = sqlite3.connect(target)
+
+        try:
+            source.backup(copy, pages=pages, progress=progress)
+        except sqlite3.Error:
+            copy.close()
+            raise
+
+        if target is None:
+            return copy
+        copy.close()
+        return None
+    finally:
+        source.close()
+
+
+def restore_database(source_file: str, pages: int = BACKUP_PAGES_PER_STEP,
+                     progress: Callable[[int, int, int], None] = None) -> bool:
+    """
+    Восстанавливает базу данных из резервной копии.
+
+    Args:
+        source_file: Путь к файлу резервной копии
+        pages: Количество страниц за один шаг
+        progress: Функция progress(status, remaining, total), вызываемая после шага
+
+    Returns:
+        bool: True если успешно, False если ошибка
+    """
+    try:
+        source = sqlite3.connect(f'file:{source_file}?mode=ro', uri=True)
+    except sqlite3.Error as e:
+        print(f"Ошибка открытия резервной копии: {e}")
+        return False
+
+    try:
+        check = source.execute('PRAGMA quick_check').fetchone()[0]
+        if check != 'ok':
+            print(f"Резервная копия повреждена: {check}")
+            return False
+
+        target = sqlite3.connect(DATABASE_FILE, timeout=BUSY_TIMEOUT_MS / 1000)
+        try:
+            source.backup(target, pages=pages, progress=progress)
+        finally:
+            target.close()
+            # Номера описаний и счетчик меток восстановленной базы могут совпасть
+            # с кэшированными, хотя данные другие
+            _forget_descriptions()
+            _tag_index["key"] = None
+        return True
+    except sqlite3.Error as e:
+        print(f"Ошибка восстановления базы данных: {e}")
+        return False
+    finally:
+        source.close()
+
+
+@contextmanager
+def read_snapshot():
+    """
+    Выполняет чтение из снимка базы данных в памяти.
+
+    Внутри блока ``with`` все функции модуля читают данные из снимка,
+    поэтому тяжелые отчеты не удерживают блокировки рабочей базы.
+    Снимок доступен только для чтения.
+
+    Yields:
+        sqlite3.Connection: Соединение со снимком
+    """
+    global _snapshot_conn
+    conn = snapshot()
+    conn.execute('PRAGMA query_only = ON')
+    conn.pinned = True
+    previous, _snapshot_conn = _snapshot_conn, conn
+    try:
+        yield conn
+    finally:
+        _snapshot_conn = previous
+        conn.pinned = False
+        conn.close()
@@ -0,0 +1,323 @@
+"""Модуль массового изменения и удаления операций с возможностью отмены.
+
+Изменение или удаление выполняется одной транзакцией из нескольких
+запросов над множеством строк: прежние значения всех подходящих под
+фильтр операций копируются в журнал ``expense_journal`` одним
+``INSERT ... SELECT``, затем один ``UPDATE`` или ``DELETE`` затрагивает
+ровно записанные в журнал операции. Команда ``undo`` восстанавливает
+операции из журнала так же одним запросом. Журнал изменений для
+выгрузки (``change_log``) заполняется триггерами автоматически.
+
+Статистика категорий пересчитывается по агрегатам затронутых строк,
+а скетчи квантилей - только для затронутых сочетаний категории, месяца
+и счета.
+Вложения удаленных операций не удаляются, поэтому после отмены
+удаления они снова относятся к восстановленной операции.
+"""
+
+import json
+import sqlite3
+from typing import Dict, Any, List, Optional
+from .database import (
+    get_connection, run_write, compute_content_hash, _compile, _description_id,
+    _load_category_stats, _save_category_stats, _rebuild_sketch, anomaly_score
+)
+from .query import ExpenseQuery, DESCRIPTION_SQL
+from .stats import RunningStats
+
+# Колонки операции, сохраняемые в журнале
+JOURNAL_COLUMNS = ("category, amount, description, description_id, date, created_at, external_id, "
+                   "content_hash, anomaly, account")
+
+# Колонки, которые восстанавливает отмена изменения
+RESTORED_COLUMNS = "category, amount, description, description_id, account, content_hash, anomaly"
+
+# Изменяемые командой edit поля операции
+EDITABLE_FIELDS = ("category", "amount", "description", "account")
+
+# Операции, записанные в журнал пакета
+_BATCH_ROWS = "SELECT expense_id FROM expense_journal WHERE batch = ?"
+
+
+def _batch_groups(cursor, batch: int) -> Dict[tuple, RunningStats]:
+    """Возвращает статистику сумм текущих строк операций пакета по ключам скетчей (категория, месяц, счет)."""
+    # Суммы накапливаются по алгоритму Уэлфорда: формула через сумму квадратов
+    # теряет точность на больших суммах с малым разбросом
+    groups = {}
+    cursor.execute(
+        f'SELECT category, substr(date, 1, 7), account, amount FROM expenses WHERE id IN ({_BATCH_ROWS})',
+        (batch,)
+    )
+    for category, month, account, amount in cursor:
+        groups.setdefault((category, month, account), RunningStats()).add(abs(amount))
+    return groups
+
+
+def _refresh_aggregates(cursor, before: Dict[tuple, RunningStats], after: Dict[tuple, RunningStats]):
+    """Обновляет статистику категорий и скетчи после изменения строк пакета.
+
+    Args:
+        before: Статистика затронутых строк до изменения (_batch_groups)
+        after: Статистика тех же строк после изменения
+    """
+    keys = before.keys() | after.keys()
+    for category in {key[0] for key in keys}:
+        stats = _load_category_stats(cursor, category)
+        for key, group in before.items():
+            if key[0] == category:
+                stats.remove(group)
+        for key, group in after.items():
+            if key[0] == category:
+                stats.merge(group)
+        _save_category_stats(cursor, category, stats)
+
+    for key in keys:
+        _rebuild_sketch(cursor, *key)
+
+
+def _anomaly_function(cursor, categories, before: Dict[tuple, RunningStats]):
+    """Возвращает функцию оценки аномальности измененной суммы.
+
+    Суммы сравниваются со статистикой категории без строк пакета, как
+    при добавлении операции сравниваются со статистикой до нее.
+
+    Args:
+        categories: Категории строк пакета после изменения
+        before: Статистика строк пакета до изменения (_batch_groups)
+    """
+    stats = {}
+    for category in categories:
+        stats[category] = _load_category_stats(cursor, category)
+        for key, group in before.items():
+            if key[0] == category:
+                stats[category].remove(group)
+    return lambda category, amount: anomaly_score(stats[category], amount)
+
+
+def _start_batch(cursor, op: str, query: ExpenseQuery, changes: Dict[str, Any] = None) -> int:
+    """Создает запись пакета в журнале и возвращает его номер."""
+    cursor.execute(
+        'INSERT INTO edit_batches (op, filter, changes) VALUES (?, ?, ?)',
+        (op, query.describe(), json.dumps(changes, ensure_ascii=False) if changes else None)
+    )
+    return cursor.lastrowid
+
+
+def _count(cursor, select: str, params: tuple) -> int:
+    """Считает операции, подходящие под фильтр."""
+    cursor.execute(f'SELECT COUNT(*) FROM ({select})', params)
+    return cursor.fetchone()[0]
+
+
+def edit_expenses(query: ExpenseQuery, changes: Dict[str, Any], dry_run: bool = False) -> Optional[Dict[str, int]]:
+    """Изменяет поля всех операций, подходящих под фильтр.
+
+    Хеш содержимого пересчитывается в том же запросе. Операция, которая
+    после изменения совпала бы с уже существующей, не изменяется.
+
+    Args:
+        query (ExpenseQuery): Фильтр операций (в том числе по номерам ids).
+        changes (Dict[str, Any]): Новые значения полей из EDITABLE_FIELDS.
+        dry_run (bool, optional): Только посчитать подходящие операции. По умолчанию False.
+
+    Returns:
+        Optional[Dict[str, int]]: Подходит под фильтр ('matched'), изменено
+        ('changed'), пропущено из-за совпадения с существующими ('skipped'),
+        номер пакета для отмены ('batch', None если ничего не изменено).
+        None при ошибке.
+
+    Raises:
+        ValueError: Если изменения не заданы или поле не поддерживается.
+    """
+    unknown = set(changes) - set(EDITABLE_FIELDS)
+    if unknown:
+        raise ValueError(f"Неизменяемые поля: {', '.join(sorted(unknown))}")
+    if not changes:
+        raise ValueError("Не указано ни одного изменения")
+
+    def work(cursor):
+        select, params = _compile(cursor, query, select='id', order_by=None)
+        if dry_run:
+            return {"matched": _count(cursor, select, params), "changed": 0, "skipped": 0, "batch": None}
+
+        cursor.connection.create_function('content_hash', 6, compute_content_hash, deterministic=True)
+        batch = _start_batch(cursor, "edit", query, changes)
+        cursor.execute(
+            f'''INSERT INTO expense_journal (batch, expense_id, {JOURNAL_COLUMNS})
+                SELECT ?, id, {JOURNAL_COLUMNS} FROM expenses WHERE id IN ({select})''',
+            (batch,) + params
+        )
+        matched = cursor.rowcount
+        before = _batch_groups(cursor, batch)
+
+        # Выражения новых значений: параметр для изменяемого поля, колонка для остальных
+        new = {field: ("?", [changes[field]]) if field in changes else (field, []) for field in EDITABLE_FIELDS}
+        if "description" not in changes:
+            new["description"] = (DESCRIPTION_SQL, [])
+        assignments = [f"{field} = ?" for field in ("category", "amount", "account") if field in changes]
+        values = [changes[field] for field in ("category", "amount", "account") if field in changes]
+        if "description" in changes:
+            assignments += ["description_id = ?", "description = NULL"]
+            values.append(_description_id(cursor, changes["description"]))
+        hash_fields = ("amount", "category", "description", "account")
+        assignments.append(
+            "content_hash = CASE WHEN content_hash IS NULL THEN NULL ELSE content_hash(date, {}, {}, {}, "
+            "external_id, {}) END".format(*(new[field][0] for field in hash_fields))
+        )
+        for field in hash_fields:
+            values += new[field][1]
+        if "amount" in changes or "category" in changes:
+            # Отметка аномалии пересчитывается для новой суммы и категории
+            categories = {changes["category"]} if "category" in changes else {key[0] for key in before}
+            cursor.connection.create_function('anomaly_score', 2, _anomaly_function(cursor, categories, before))
+            assignments.append("anomaly = anomaly_score({}, {})".format(new["category"][0], new["amount"][0]))
+            values += new["category"][1] + new["amount"][1]
+
+        # Операции, совпавшие бы с существующими, пропускаются вместо ошибки всего пакета
+        cursor.execute(f'UPDATE OR IGNORE expenses SET {", ".join(assignments)} WHERE id IN ({_BATCH_ROWS})',
+                       values + [batch])
+        skipped = matched - cursor.rowcount
+        _refresh_aggregates(cursor, before, _batch_groups(cursor, batch))
+
+        # В журнале остаются только действительно измененные операции
+        cursor.execute(
+            '''DELETE FROM expense_journal WHERE batch = ? AND expense_id IN (
+                   SELECT e.id FROM expenses e JOIN expense_journal j ON j.batch = ? AND j.expense_id = e.id
+                   WHERE e.category IS j.category AND e.amount IS j.amount AND e.description IS j.description
+                     AND e.description_id IS j.description_id AND e.account IS j.account)''',
+            (batch, batch)
+        )
+        changed = matched - cursor.rowcount
+        if changed:
+            cursor.execute('UPDATE edit_batches SET count = ? WHERE id = ?', (changed, batch))
+        else:
+            cursor.execute('DELETE FROM edit_batches WHERE id = ?', (batch,))
+        return {"matched": matched, "changed": changed, "skipped": skipped, "batch": batch if changed else None}
+
+    try:
+        return run_write(work)
+    except sqlite3.Error as e:
+        print(f"Ошибка изменения операций: {e}")
+        return None
+
+
+def delete_expenses(query: ExpenseQuery, dry_run: bool = False) -> Optional[Dict[str, int]]:
+    """Удаляет все операции, подходящие под фильтр.
+
+    Прежние значения и метки операций сохраняются в журнале, вложения
+    остаются на месте до отмены удаления.
+
+    Args:
+        query (ExpenseQuery): Фильтр операций (в том числе по номерам ids).
+        dry_run (bool, optional): Только посчитать подходящие операции. По умолчанию False.
+
+    Returns:
+        Optional[Dict[str, int]]: Подходит под фильтр ('matched'), удалено
+        ('deleted'), номер пакета для отмены ('batch'). None при ошибке.
+    """
+    def work(cursor):
+        select, params = _compile(cursor, query, select='id', order_by=None)
+        if dry_run:
+            return {"matched": _count(cursor, select, params), "deleted": 0, "batch": None}
+
+        batch = _start_batch(cursor, "delete", query)
+        cursor.execute(
+            f'''INSERT INTO expense_journal (batch, expense_id, {JOURNAL_COLUMNS}, tags)
+                SELECT ?, id, {JOURNAL_COLUMNS},
+                       (SELECT json_group_array(tag_id) FROM expense_tags WHERE expense_id = expenses.id)
+                FROM expenses WHERE id IN ({select})''',
+            (batch,) + params
+        )
+        matched = cursor.rowcount
+        before = _batch_groups(cursor, batch)
+        cursor.execute(f'DELETE FROM expenses WHERE id IN ({_BATCH_ROWS})', (batch,))
+        deleted = cursor.rowcount
+        _refresh_aggregates(cursor, before, {})
+        if deleted:
+            cursor.execute('UPDATE edit_batches SET count = ? WHERE id = ?', (deleted, batch))
+        else:
+            cursor.execute('DELETE FROM edit_batches WHERE id = ?', (batch,))
+        return {"matched": matched, "deleted": deleted, "batch": batch if deleted else None}
+
+    try:
+        return run_write(work)
+    except sqlite3.Error as e:
+        print(f"Ошибка удаления операций: {e}")
+        return None
+
+
+def undo_last() -> Optional[Dict[str, Any]]:
+    """Отменяет последний еще не отмененный пакет изменения или удаления.
+
+    Пакеты отменяются в обратном порядке, поэтому каждая отмена
+    восстанавливает состояние, которое было перед пакетом.
+
+    Returns:
+        Optional[Dict[str, Any]]: Номер пакета ('batch'), его тип ('op'),
+        восстановлено операций ('restored') и пропущено из-за совпадения
+        с существующими ('skipped'). None, если отменять нечего или при ошибке.
+    """
+    def work(cursor):
+        cursor.execute('SELECT id, op, count FROM edit_batches WHERE undone_at IS NULL ORDER BY id DESC LIMIT 1')
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        batch, op, count = row
+
+        before = _batch_groups(cursor, batch)
+        if op == "edit":
+            cursor.execute(
+                f'''UPDATE OR IGNORE expenses SET ({RESTORED_COLUMNS}) = (
+                        SELECT {RESTORED_COLUMNS} FROM expense_journal
+                        WHERE batch = ? AND expense_id = expenses.id)
+                    WHERE id IN ({_BATCH_ROWS})''',
+                (batch, batch)
+            )
+            restored = cursor.rowcount
+        else:
+            cursor.execute(
+                f'''INSERT OR IGNORE INTO expenses (id, {JOURNAL_COLUMNS})
+                    SELECT expense_id, {JOURNAL_COLUMNS} FROM expense_journal WHERE batch = ?''',
+                (batch,)
+            )
+            restored = cursor.rowcount
+            cursor.execute(
+                '''INSERT OR IGNORE INTO expense_tags (tag_id, expense_id)
+                   SELECT t.value, j.expense_id FROM expense_journal j, json_each(j.tags) t
+                   WHERE j.batch = ? AND j.expense_id IN (SELECT id FROM expenses)''',
+                (batch,)
+            )
+        _refresh_aggregates(cursor, before, _batch_groups(cursor, batch))
+        cursor.execute('UPDATE edit_batches SET undone_at = CURRENT_TIMESTAMP WHERE id = ?', (batch,))
+        return {"batch": batch, "op": op, "restored": restored, "skipped": count - restored}
+
+    try:
+        result = run_write(work)
+    except sqlite3.Error as e:
+        print(f"Ошибка отмены изменений: {e}")
+        return None
+    if result is None:
+        print("Нет изменений для отмены")
+    return result
+
+
+def list_batches(limit: int = 20) -> List[Dict[str, Any]]:
+    """Возвращает последние пакеты изменений, начиная с новых.
+
+    Returns:
+        List[Dict]: Пакеты с ключами id, op, filter, changes, count,
+        created_at, undone_at.
+    """
+    conn = get_connection()
+    try:
+        cursor = conn.execute(
+            '''SELECT id, op, filter, changes, count, created_at, undone_at
+               FROM edit_batches ORDER BY id DESC LIMIT ?''',
+            (limit,)
+        )
+        return [dict(row) for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        print(f"Ошибка получения журнала изменений: {e}")
+        return []
+    finally:
+        conn.close()
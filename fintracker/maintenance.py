@@ -0,0 +1,201 @@
+"""Модуль обслуживания базы данных.
+
+Предоставляет сбор статистики планировщика (ANALYZE, PRAGMA optimize),
+инкрементальную очистку свободных страниц, проверку целостности и
+отчет о размере и фрагментации базы данных.
+"""
+
+import os
+import sqlite3
+import time
+from typing import List, Dict, Any
+from . import database
+
+AUTO_VACUUM_MODES = {0: "none", 1: "full", 2: "incremental"}
+
+
+def database_stats() -> Dict[str, Any]:
+    """Собирает сведения о страницах, фрагментации и размерах индексов.
+
+    Returns:
+        Dict: Размер страницы, количество страниц, свободных страниц,
+            доля фрагментации, режим auto_vacuum, размер файла и размеры
+            таблиц и индексов в байтах (если доступна таблица dbstat).
+    """
+    conn = database.get_connection()
+    try:
+        page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+        freelist_count = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        auto_vacuum = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+
+        try:
+            sizes = conn.execute(
+                '''SELECT s.name, m.type, SUM(s.pgsize) FROM dbstat s
+                   LEFT JOIN sqlite_master m ON m.name = s.name
+                   GROUP BY s.name ORDER BY SUM(s.pgsize) DESC'''
+            ).fetchall()
+        except sqlite3.OperationalError:
+            # SQLite собран без виртуальной таблицы dbstat
+            sizes = []
+
+        return {
+            "page_size": page_size,
+            "page_count": page_count,
+            "freelist_count": freelist_count,
+            "fragmentation": freelist_count / page_count if page_count else 0.0,
+            "auto_vacuum": AUTO_VACUUM_MODES.get(auto_vacuum, str(auto_vacuum)),
+            "file_size": os.path.getsize(database.DATABASE_FILE),
+            "indexes": {name: size for name, kind, size in sizes if kind == "index"},
+            "tables": {name: size for name, kind, size in sizes if kind != "index"}
+        }
+    finally:
+        conn.close()
+
+
+def analyze():
+    """Собирает статистику для планировщика запросов (ANALYZE)."""
+    conn = database.get_connection()
+    try:
+        conn.execute('ANALYZE')
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def optimize():
+    """Выполняет PRAGMA optimize, обновляя устаревшую статистику."""
+    conn = database.get_connection()
+    try:
+        conn.execute('PRAGMA optimize')
+    finally:
+        conn.close()
+
+
+def incremental_vacuum(pages: int = None, convert: bool = False) -> int:
+    """Освобождает свободные страницы базы данных.
+
+    Инкрементальная очистка доступна только в режиме
+    ``auto_vacuum=INCREMENTAL``. Новые базы создаются в этом режиме;
+    существующую базу можно перевести в него параметром ``convert``,
+    что требует одного полного VACUUM.
+
+    Args:
+        pages (int, optional): Максимальное количество освобождаемых страниц.
+            По умолчанию все свободные страницы.
+        convert (bool, optional): Перевести базу в режим INCREMENTAL
+            полным VACUUM. По умолчанию False.
+
+    Returns:
+        int: Количество освобожденных страниц.
+    """
+    conn = database.get_connection()
+    try:
+        before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        mode = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+
+        if mode != 2:
+            if not convert:
+                return 0
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM')
+        else:
+            # Каждый шаг прагмы освобождает одну страницу, поэтому она
+            # выполняется через executescript, который доводит ее до конца
+            conn.executescript(f'PRAGMA incremental_vacuum({int(pages or 0)})')
+
+        after = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        return before - after
+    finally:
+        conn.close()
+
+
+def integrity_check(quick: bool = False) -> List[str]:
+    """Проверяет целостность базы данных.
+
+    Args:
+        quick (bool, optional): Использовать быструю проверку quick_check.
+            По умолчанию False.
+
+    Returns:
+        List[str]: Сообщения проверки; ['ok'] если ошибок нет.
+    """
+    pragma = 'quick_check' if quick else 'integrity_check'
+    conn = database.get_connection()
+    try:
+        return [row[0] for row in conn.execute(f'PRAGMA {pragma}')]
+    finally:
+        conn.close()
+
+
+def run_maintenance(vacuum_pages: int = None, convert: bool = False,
+                    quick: bool = False, compact_days: int = None) -> List[Dict[str, Any]]:
+    """Выполняет все шаги обслуживания и замеряет время каждого.
+
+    Журнал изменений по умолчанию не сжимается: потребители журнала
+    (sync, отчет --watch) находят по нему изменения и удаления операций.
+
+    Args:
+        vacuum_pages (int, optional): Ограничение для инкрементальной очистки.
+        convert (bool, optional): Перевести базу в режим auto_vacuum=INCREMENTAL.
+        quick (bool, optional): Использовать быструю проверку целостности.
+        compact_days (int, optional): Сжать журнал изменений с этим сроком
+            хранения записей в днях. По умолчанию журнал не сжимается.
+
+    Returns:
+        List[Dict]: Шаги с ключами 'step', 'seconds' и 'result'.
+    """
+    steps = [
+        ("stats_before", database_stats),
+        ("analyze", analyze),
+        ("incremental_vacuum", lambda: incremental_vacuum(vacuum_pages, convert)),
+        ("optimize", optimize),
+        ("tag_index", lambda: f"Меток в индексе: {database.rebuild_tag_index()}"),
+    ]
+    if compact_days is not None:
+        steps.append(("compact_changes", lambda: "Удалено записей журнала изменений: замещенных {superseded}, "
+                      "устаревших {expired}".format(**database.compact_changes(compact_days))))
+    steps += [
+        ("integrity_check", lambda: integrity_check(quick)),
+        ("stats_after", database_stats),
+    ]
+
+    results = []
+    for name, step in steps:
+        start = time.perf_counter()
+        try:
+            result = step()
+        except sqlite3.Error as e:
+            result = f"ошибка: {e}"
+        results.append({
+            "step": name,
+            "seconds": time.perf_counter() - start,
+            "result": result
+        })
+    return results
+
+
+def print_maintenance(results: List[Dict[str, Any]]):
+    """Выводит результаты обслуживания в консоль.
+
+    Args:
+        results (List[Dict]): Результаты run_maintenance.
+    """
+    print("\n=== ОБСЛУЖИВАНИЕ БАЗЫ ДАННЫХ ===")
+    for item in results:
+        result = item["result"]
+        print(f"\n[{item['step']}] {item['seconds'] * 1000:.1f} мс")
+
+        if isinstance(result, dict):
+            print(f"  Страниц: {result['page_count']} по {result['page_size']} байт, "
+                  f"свободных: {result['freelist_count']} ({result['fragmentation']:.1%})")
+            print(f"  Размер файла: {result['file_size']} байт, auto_vacuum: {result['auto_vacuum']}")
+            for name, size in result["indexes"].items():
+                print(f"  Индекс {name}: {size} байт")
+        elif isinstance(result, list):
+            for message in result:
+                print(f"  {message}")
+        elif isinstance(result, int):
+            print(f"  Освобождено страниц: {result}")
+        elif result is not None:
+            print(f"  {result}")
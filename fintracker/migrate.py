@@ -0,0 +1,348 @@
+"""Модуль переноса данных из прежнего хранилища data.json в базу.
+
+Файл разбирается потоково: из него последовательно читаются отдельные
+записи массивов ``expenses`` и ``categories``, так что в памяти никогда
+не находится весь документ. Поддерживаются оба прежних формата: объект
+``{"expenses": [...], "categories": [...]}`` и массив операций.
+
+Записи проверяются через ``Expense.from_dict`` и ``Category.from_dict``
+и записываются порциями, каждая в своей транзакции. В той же транзакции
+в таблице ``legacy_migrations`` сохраняется позиция в файле после
+последней записанной записи, поэтому прерванный перенос продолжается с
+нее и ни одна запись не переносится дважды.
+"""
+
+import codecs
+import json
+import os
+import re
+import sqlite3
+from typing import BinaryIO, Callable, Dict, Any, Iterator, Optional, Tuple
+from .database import get_connection, run_write, _insert_expenses, _insert_category
+from .models import Expense, Category
+
+# Количество записей, записываемых одной транзакцией
+MIGRATE_BATCH = 5000
+
+# Размер порции чтения файла, байт
+READ_CHUNK = 64 * 1024
+
+# Наибольший размер одной записи, байт: защищает от чтения всего
+# оставшегося файла при синтаксической ошибке
+MAX_RECORD_SIZE = 16 * 1024 * 1024
+
+# Количество ошибок в записях, возвращаемых для показа
+MAX_REPORTED_ERRORS = 10
+
+# Переносимые массивы прежнего формата
+SECTIONS = ("expenses", "categories")
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class _JsonStream:
+    """Потоковое чтение значений JSON из двоичного файла.
+
+    Attributes:
+        offset (int): Позиция в файле (байт) сразу после прочитанных данных.
+    """
+
+    def __init__(self, source: BinaryIO, offset: int = 0):
+        source.seek(offset)
+        self.offset = offset
+        self._source = source
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        """Дочитывает порцию файла в буфер, отбрасывая разобранное начало.
+
+        Returns:
+            bool: False, если файл закончился.
+        """
+        if self._eof:
+            return False
+        data = self._source.read(READ_CHUNK)
+        self._eof = not data
+        self._buffer = self._buffer[self._pos:] + self._decoder.decode(data, final=self._eof)
+        self._pos = 0
+        return not self._eof
+
+    def _advance(self, end: int):
+        """Сдвигает позицию разбора, пересчитывая смещение в байтах."""
+        self.offset += len(self._buffer[self._pos:end].encode("utf-8"))
+        self._pos = end
+
+    def peek(self) -> str:
+        """Пропускает пробелы и возвращает следующий символ ('' в конце файла)."""
+        while True:
+            end = _WHITESPACE.match(self._buffer, self._pos).end()
+            self.offset += end - self._pos
+            self._pos = end
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, chars: str) -> str:
+        """Читает один из ожидаемых разделителей.
+
+        Raises:
+            ValueError: Если следующий символ не из ``chars``.
+        """
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f"Ожидался один из символов {chars!r} на позиции {self.offset}")
+        self._advance(self._pos + 1)
+        return char
+
+    def value(self) -> Any:
+        """Читает одно значение JSON целиком.
+
+        Raises:
+            ValueError: Если значение не разбирается.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError as e:
+                if len(self._buffer) - self._pos > MAX_RECORD_SIZE or not self._fill():
+                    raise ValueError(f"Ошибка разбора JSON на позиции {self.offset}: {e.msg}") from e
+                continue
+            # Число в конце буфера может продолжаться в следующей порции
+            if end == len(self._buffer) and self._fill():
+                continue
+            self._advance(end)
+            return value
+
+
+def _iter_array(stream: _JsonStream, section: str, layout: str,
+                resumed: bool = False) -> Iterator[Tuple[str, Any, Dict[str, Any]]]:
+    """Перебирает элементы массива, открывающая скобка которого уже прочитана.
+
+    Args:
+        resumed (bool, optional): Разбор продолжается после элемента массива.
+    """
+    if resumed:
+        if stream.expect(",]") == "]":
+            return
+    elif stream.peek() == "]":
+        stream.expect("]")
+        return
+    while True:
+        record = stream.value()
+        yield section, record, {"layout": layout, "section": section, "offset": stream.offset}
+        if stream.expect(",]") == "]":
+            return
+
+
+def _iter_object(stream: _JsonStream, section: str = None) -> Iterator[Tuple[str, Any, Dict[str, Any]]]:
+    """Перебирает записи переносимых массивов объекта верхнего уровня.
+
+    Args:
+        section (str, optional): Массив, разбор которого продолжается после элемента.
+    """
+    if section is not None:
+        yield from _iter_array(stream, section, "object", resumed=True)
+        if stream.expect(",}") == "}":
+            return
+    elif stream.peek() == "}":
+        stream.expect("}")
+        return
+    while True:
+        key = stream.value()
+        stream.expect(":")
+        if key in SECTIONS and stream.peek() == "[":
+            stream.expect("[")
+            yield from _iter_array(stream, key, "object")
+        else:
+            # Прочие ключи прежнего формата не переносятся
+            stream.value()
+        if stream.expect(",}") == "}":
+            return
+
+
+def iter_legacy_records(source: BinaryIO, resume: Dict[str, Any] = None) -> Iterator[Tuple[str, Any, Dict[str, Any]]]:
+    """Потоково перебирает записи файла data.json.
+
+    Args:
+        source (BinaryIO): Файл, открытый в двоичном режиме.
+        resume (Dict, optional): Позиция, с которой продолжить разбор
+            (третий элемент ранее выданной записи).
+
+    Yields:
+        tuple: (массив 'expenses' или 'categories', запись, позиция после записи).
+
+    Raises:
+        ValueError: Если файл не является документом прежнего формата.
+    """
+    if resume is not None:
+        stream = _JsonStream(source, resume["offset"])
+        if resume["layout"] == "list":
+            yield from _iter_array(stream, "expenses", "list", resumed=True)
+        else:
+            yield from _iter_object(stream, resume["section"])
+    else:
+        stream = _JsonStream(source)
+        if stream.expect("[{") == "[":
+            yield from _iter_array(stream, "expenses", "list")
+        else:
+            yield from _iter_object(stream)
+    if stream.peek():
+        raise ValueError(f"Лишние данные после документа на позиции {stream.offset}")
+
+
+def _expense_row(record: Any) -> tuple:
+    """Проверяет запись операции и возвращает строку для _insert_expenses.
+
+    Raises:
+        KeyError, TypeError, ValueError: Если запись некорректна.
+    """
+    if not isinstance(record, dict):
+        raise TypeError("запись не является объектом")
+    # Без даты from_dict подставил бы текущее время
+    if not record.get("date"):
+        raise KeyError("date")
+    expense = Expense.from_dict(record)
+    if not isinstance(expense.category, str) or not expense.category:
+        raise ValueError("пустая категория")
+    return (expense.category, float(expense.amount), expense.description or "", expense.date, None,
+            expense.account)
+
+
+def _category(record: Any) -> Category:
+    """Проверяет запись категории.
+
+    Raises:
+        KeyError, TypeError, ValueError: Если запись некорректна.
+    """
+    if not isinstance(record, dict):
+        raise TypeError("запись не является объектом")
+    category = Category.from_dict(record)
+    if category.type not in ("income", "expense"):
+        raise ValueError(f"неизвестный тип категории {category.type!r}")
+    return category
+
+
+def _load_state(source: str) -> Optional[Dict[str, Any]]:
+    """Возвращает сохраненное состояние переноса файла."""
+    conn = get_connection()
+    try:
+        cursor = conn.execute('SELECT * FROM legacy_migrations WHERE source = ?', (source,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+    finally:
+        conn.close()
+
+
+def migrate_json(filename: str, batch_size: int = MIGRATE_BATCH, restart: bool = False,
+                 progress: Callable[[int, int, int], None] = None) -> Dict[str, Any]:
+    """Переносит операции и категории из файла data.json в базу.
+
+    Если предыдущий перенос этого файла был прерван, он продолжается
+    с последней записанной порции. Если файл с тех пор изменил размер,
+    перенос начинается заново; уже перенесенные операции при этом не
+    дублируются благодаря хэшу содержимого.
+
+    Args:
+        filename (str): Файл прежнего хранилища.
+        batch_size (int, optional): Количество записей в одной транзакции.
+            По умолчанию MIGRATE_BATCH.
+        restart (bool, optional): Начать перенос с начала файла. По умолчанию False.
+        progress (Callable, optional): Вызывается после каждой порции с
+            аргументами (прочитано байт, размер файла, обработано записей).
+
+    Returns:
+        Dict[str, Any]: Добавлено операций ('expenses') и категорий
+        ('categories'), пропущено уже существующих ('duplicates') и
+        некорректных записей ('invalid'), позиция начала ('resumed_from'),
+        первые сообщения об ошибках ('errors'). Пустой словарь при ошибке
+        или если файл уже перенесен.
+
+    Raises:
+        OSError: Если файл не удалось прочитать.
+    """
+    source = os.path.abspath(filename)
+    size = os.path.getsize(filename)
+    result = {"expenses": 0, "categories": 0, "duplicates": 0, "invalid": 0, "resumed_from": 0, "errors": []}
+
+    try:
+        state = None if restart else _load_state(source)
+    except sqlite3.Error as e:
+        print(f"Ошибка чтения состояния переноса: {e}")
+        return {}
+    if state is not None and state["size"] != size:
+        print("Файл изменился после прерванного переноса, перенос начинается заново")
+        state = None
+    if state is not None and state["done"]:
+        print("Файл уже перенесен, используйте --restart для повторного переноса")
+        return {}
+
+    resume = None
+    records = 0
+    if state is not None:
+        resume = {"layout": state["layout"], "section": state["section"], "offset": state["offset"]}
+        records = state["records"]
+        result["resumed_from"] = state["offset"]
+
+    def flush(expenses, categories, position, done):
+        def work(cursor):
+            added = orphans = 0
+            for category in categories:
+                cursor.execute('SELECT EXISTS (SELECT 1 FROM categories WHERE name = ?)', (category.name,))
+                if cursor.fetchone()[0]:
+                    continue
+                if _insert_category(cursor, category.name, category.type, category.parent, category.account):
+                    added += 1
+                else:
+                    orphans += 1
+            inserted = sum(_insert_expenses(cursor, expenses))
+            cursor.execute(
+                '''INSERT INTO legacy_migrations (source, size, layout, section, offset, records, done)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(source) DO UPDATE SET size = excluded.size, layout = excluded.layout,
+                       section = excluded.section, offset = excluded.offset, records = excluded.records,
+                       done = excluded.done, updated_at = CURRENT_TIMESTAMP''',
+                (source, size, position["layout"], position["section"], position["offset"], records, done)
+            )
+            return added, orphans, inserted
+
+        added, orphans, inserted = run_write(work)
+        result["categories"] += added
+        result["expenses"] += inserted
+        # Категория с неизвестной родительской считается некорректной записью
+        result["invalid"] += orphans
+        result["duplicates"] += len(expenses) - inserted + len(categories) - added - orphans
+        if progress is not None:
+            progress(size if done else position["offset"], size, records)
+
+    expenses, categories = [], []
+    position = resume or {"layout": "object", "section": "expenses", "offset": 0}
+    try:
+        with open(filename, "rb") as f:
+            for section, record, position in iter_legacy_records(f, resume):
+                records += 1
+                try:
+                    if section == "expenses":
+                        expenses.append(_expense_row(record))
+                    else:
+                        categories.append(_category(record))
+                except (KeyError, TypeError, ValueError) as e:
+                    result["invalid"] += 1
+                    if len(result["errors"]) < MAX_REPORTED_ERRORS:
+                        result["errors"].append(f"запись {records} ({section}): {e!r}")
+                if len(expenses) + len(categories) >= batch_size:
+                    flush(expenses, categories, position, False)
+                    expenses, categories = [], []
+        flush(expenses, categories, position, True)
+    except ValueError as e:
+        print(f"Ошибка разбора файла: {e}")
+        return {}
+    except sqlite3.Error as e:
+        print(f"Ошибка переноса данных: {e}")
+        return {}
+    return result
@@ -1,9 +1,91 @@
 """Модуль с моделями данных для финансового трекера.
 
-Содержит классы для представления категорий и финансовых операций.
+Содержит классы для представления категорий и финансовых операций,
+а также функции преобразования дат операций в целочисленные номера
+дней и месяцев, по которым база данных группирует операции.
 """
 
-from datetime import datetime
+from datetime import datetime, date as date_type, timedelta
+from typing import Union
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Счет, к которому относятся операции, добавленные без явного указания счета
+DEFAULT_ACCOUNT = "main"
+EPOCH_DATE = date_type(1970, 1, 1)
+
+
+def format_date(value: Union[str, datetime]) -> str:
+    """Приводит дату операции к строке в локальном времени.
+
+    Даты с часовым поясом переводятся в локальный часовой пояс, даты
+    без часового пояса считаются локальными. Строки возвращаются как есть.
+
+    Args:
+        value (Union[str, datetime]): Дата операции.
+
+    Returns:
+        str: Дата в формате 'YYYY-MM-DD HH:MM:SS'.
+    """
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone().replace(tzinfo=None)
+        return value.strftime(DATE_FORMAT)
+    return value
+
+
+def day_number(value: Union[str, datetime]) -> int:
+    """Возвращает номер локального календарного дня от 1970-01-01.
+
+    Совпадает со значением колонки ``expenses.day`` в базе данных.
+
+    Args:
+        value (Union[str, datetime]): Дата операции.
+
+    Returns:
+        int: Номер дня.
+    """
+    day = datetime.strptime(format_date(value)[:10], '%Y-%m-%d').date()
+    return (day - EPOCH_DATE).days
+
+
+def day_to_date(day: int) -> str:
+    """Преобразует номер дня обратно в дату.
+
+    Args:
+        day (int): Номер дня от 1970-01-01.
+
+    Returns:
+        str: Дата в формате 'YYYY-MM-DD'.
+    """
+    return (EPOCH_DATE + timedelta(days=day)).isoformat()
+
+
+def month_number(value: Union[str, datetime]) -> int:
+    """Возвращает номер месяца (год * 12 + месяц - 1).
+
+    Совпадает со значением колонки ``expenses.month`` в базе данных.
+
+    Args:
+        value (Union[str, datetime]): Дата операции.
+
+    Returns:
+        int: Номер месяца.
+    """
+    text = format_date(value)
+    return int(text[:4]) * 12 + int(text[5:7]) - 1
+
+
+def month_to_str(month: int) -> str:
+    """Преобразует номер месяца обратно в строку.
+
+    Args:
+        month (int): Номер месяца.
+
+    Returns:
+        str: Месяц в формате 'YYYY-MM'.
+    """
+    return f"{month // 12:04d}-{month % 12 + 1:02d}"
 
 
 class Category:
@@ -12,17 +94,23 @@ class Category:
     Attributes:
         name (str): Название категории.
         type (str): Тип категории ('expense' или 'income').
+        parent (str): Родительская категория (None для корневой).
+        account (str): Счет, к которому относится категория (None - общая для всех счетов).
     """
 
-    def __init__(self, name: str, category_type: str):
+    def __init__(self, name: str, category_type: str, parent: str = None, account: str = None):
         """Инициализирует категорию.
 
         Args:
             name (str): Название категории.
             category_type (str): Тип категории ('expense' или 'income').
+            parent (str, optional): Родительская категория. По умолчанию None.
+            account (str, optional): Счет категории. По умолчанию общая для всех счетов.
         """
         self.name = name
         self.type = category_type
+        self.parent = parent
+        self.account = account
 
     def to_dict(self) -> dict:
         """Преобразует объект категории в словарь.
@@ -30,7 +118,7 @@ class Category:
         Returns:
             dict: Словарь с данными категории.
         """
-        return {"name": self.name, "type": self.type}
+        return {"name": self.name, "type": self.type, "parent": self.parent, "account": self.account}
 
     @classmethod
     def from_dict(cls, data: dict) -> 'Category':
@@ -42,7 +130,7 @@ class Category:
         Returns:
             Category: Новый объект категории.
         """
-        return cls(data["name"], data["type"])
+        return cls(data["name"], data["type"], data.get("parent"), data.get("account"))
 
 
 class Expense:
@@ -53,34 +141,53 @@ class Expense:
         amount (float): Сумма операции.
         description (str): Описание операции.
         date (str): Дата и время операции.
+        account (str): Счет операции (None, если не известен).
+        id (int): Номер операции в хранилище (None для еще не сохраненной).
     """
 
-    def __init__(self, category: str, amount: float, description: str = "", date: str = None):
+    def __init__(self, category: str, amount: float, description: str = "",
+                 date: Union[str, datetime] = None, account: str = None, id: int = None):
         """Инициализирует финансовую операцию.
 
         Args:
             category (str): Категория операции.
             amount (float): Сумма операции.
             description (str, optional): Описание операции. По умолчанию "".
-            date (str, optional): Дата операции. По умолчанию текущее время.
+            date (Union[str, datetime], optional): Дата операции. Дата с
+                часовым поясом переводится в локальное время. По умолчанию
+                текущее время.
+            account (str, optional): Счет операции. По умолчанию None.
+            id (int, optional): Номер операции в хранилище. По умолчанию None.
         """
         self.category = category
         self.amount = amount
         self.description = description
-        self.date = date or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.date = format_date(date) if date else datetime.now().strftime(DATE_FORMAT)
+        self.account = account
+        self.id = id
+
+    @property
+    def day(self) -> int:
+        """int: Номер локального календарного дня операции от 1970-01-01."""
+        return day_number(self.date)
 
     def to_dict(self) -> dict:
         """Преобразует объект операции в словарь.
 
         Returns:
-            dict: Словарь с данными операции.
+            dict: Словарь с данными операции; счет и номер включаются, только если известны.
         """
-        return {
+        data = {
             "category": self.category,
             "amount": self.amount,
             "description": self.description,
             "date": self.date
         }
+        if self.account is not None:
+            data["account"] = self.account
+        if self.id is not None:
+            data["id"] = self.id
+        return data
 
     @classmethod
     def from_dict(cls, data: dict) -> 'Expense':
@@ -96,5 +203,7 @@ class Expense:
             data['category'],
             data['amount'],
             data.get("description", ""),
-            data.get("date")
+            data.get("date"),
+            data.get("account"),
+            data.get("id")
         )
\ No newline at end of file
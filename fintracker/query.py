@@ -0,0 +1,321 @@
+"""Модуль с объектом запроса операций.
+
+Запрос объединяет фильтры по счету, периоду, датам, категориям, суммам,
+типу операции, тексту описания и меткам и компилируется в один параметризованный
+SQL-запрос по индексированным целочисленным колонкам дат. Текст SQL
+зависит только от набора заданных фильтров, поэтому кэшируется и
+переиспользуется для любых значений параметров.
+"""
+
+import json
+from datetime import datetime
+from functools import lru_cache
+from typing import Union, Iterable, Tuple, Dict, Any
+from .models import day_number, month_number, DEFAULT_ACCOUNT
+
+PERIODS = ("today", "month", "all")
+KINDS = ("income", "expense")
+
+# Описание операции хранится номером в словаре descriptions; собственная
+# колонка description заполнена только у строк, записанных в обход словаря
+DESCRIPTION_SQL = "COALESCE(description, (SELECT text FROM descriptions WHERE id = description_id))"
+
+# Колонки, которые возвращает выборка операций
+EXPENSE_COLUMNS = f"id, category, amount, {DESCRIPTION_SQL} AS description, date, account"
+
+SECONDS_PER_DAY = 86400
+
+
+def casefold(value: str) -> str:
+    """Приводит текст к нижнему регистру с учетом Юникода (функция SQL ``casefold``)."""
+    return value.casefold() if value is not None else None
+
+
+class ExpenseQuery:
+    """Набор фильтров для выборки операций.
+
+    Все фильтры необязательны и объединяются через И.
+
+    Attributes:
+        period (str): Период: 'today', 'month' или 'all'.
+        start_date (str): Начальная дата (YYYY-MM-DD) включительно.
+        end_date (str): Конечная дата (YYYY-MM-DD) включительно.
+        categories (tuple): Допустимые категории.
+        min_amount (float): Минимальная сумма по модулю.
+        max_amount (float): Максимальная сумма по модулю.
+        kind (str): Тип операции: 'income' (доход) или 'expense' (расход).
+        text (str): Подстрока описания без учета регистра.
+        anomalies (bool): Только операции, отмеченные как необычные для категории.
+        tags (tuple): Метки, которые должны быть у операции (все сразу).
+        exclude_tags (tuple): Метки, которых не должно быть у операции.
+        ids (Bitmap): Допустимые номера операций. Хранилище заполняет это поле
+            по индексу меток перед компиляцией запроса с метками.
+        exclude_ids (Bitmap): Исключаемые номера операций (заполняется так же).
+        account (str): Счет; без счета запрос охватывает все счета.
+    """
+
+    FIELDS = ("period", "start_date", "end_date", "categories", "min_amount", "max_amount", "kind", "text",
+              "anomalies", "tags", "exclude_tags", "ids", "exclude_ids", "account")
+
+    def __init__(self, period: str = "all", start_date: str = None, end_date: str = None,
+                 categories: Iterable[str] = None, min_amount: float = None, max_amount: float = None,
+                 kind: str = None, text: str = None, anomalies: bool = False,
+                 tags: Iterable[str] = None, exclude_tags: Iterable[str] = None,
+                 ids: Iterable[int] = None, exclude_ids: Iterable[int] = None, account: str = None):
+        """Создает запрос.
+
+        Raises:
+            ValueError: Если период или тип операции не поддерживаются.
+        """
+        if period not in PERIODS:
+            raise ValueError(f"Неизвестный период: '{period}'")
+        if kind is not None and kind not in KINDS:
+            raise ValueError(f"Неизвестный тип операции: '{kind}'")
+
+        self.period = period
+        self.start_date = start_date
+        self.end_date = end_date
+        self.categories = tuple(categories) if categories else ()
+        self.min_amount = min_amount
+        self.max_amount = max_amount
+        self.kind = kind
+        self.text = text or None
+        self.anomalies = bool(anomalies)
+        self.tags = tuple(tags) if tags else ()
+        self.exclude_tags = tuple(exclude_tags) if exclude_tags else ()
+        self.ids = ids
+        self.exclude_ids = exclude_ids
+        self.account = account or None
+
+    @property
+    def needs_tag_ids(self) -> bool:
+        """bool: Фильтр по меткам еще не разрешен в номера операций."""
+        return bool(self.tags or self.exclude_tags) and self.ids is None and self.exclude_ids is None
+
+    @classmethod
+    def coerce(cls, value: Union[str, "ExpenseQuery", None]) -> "ExpenseQuery":
+        """Преобразует период или запрос в запрос.
+
+        Args:
+            value (Union[str, ExpenseQuery, None]): Период ('today', 'month', 'all') или запрос.
+
+        Returns:
+            ExpenseQuery: Запрос.
+        """
+        if isinstance(value, cls):
+            return value
+        return cls(value or "all")
+
+    def replace(self, **changes) -> "ExpenseQuery":
+        """Возвращает копию запроса с измененными фильтрами."""
+        values = {field: getattr(self, field) for field in self.FIELDS}
+        values.update(changes)
+        return ExpenseQuery(**values)
+
+    def describe(self) -> str:
+        """Возвращает подпись запроса для отчетов.
+
+        Для запроса только по периоду возвращает сам период.
+        """
+        parts = [] if self.period == "all" and (self.start_date or self.end_date) else [self.period]
+        if self.start_date or self.end_date:
+            parts.append(f"{self.start_date or '...'} - {self.end_date or '...'}")
+        if self.categories:
+            parts.append("категории: " + ", ".join(self.categories))
+        if self.min_amount is not None or self.max_amount is not None:
+            parts.append(f"сумма: {self.min_amount if self.min_amount is not None else 0}"
+                         f" - {self.max_amount if self.max_amount is not None else '...'}")
+        if self.kind:
+            parts.append("доходы" if self.kind == "income" else "расходы")
+        if self.text:
+            parts.append(f"текст: '{self.text}'")
+        if self.anomalies:
+            parts.append("только аномалии")
+        if self.tags:
+            parts.append("метки: " + ", ".join(self.tags))
+        if self.exclude_tags:
+            parts.append("без меток: " + ", ".join(self.exclude_tags))
+        if self.account:
+            parts.append(f"счет: {self.account}")
+        return ", ".join(parts)
+
+    def _shape(self) -> Tuple[str, ...]:
+        """Возвращает набор заданных фильтров, от которого зависит текст SQL."""
+        shape = []
+        if self.account:
+            shape.append("account")
+        if self.period != "all":
+            shape.append(self.period)
+        if self.start_date:
+            shape.append("start")
+        if self.end_date:
+            shape.append("end")
+        if self.categories:
+            shape.append("categories")
+        if self.kind:
+            shape.append(self.kind)
+        if self.min_amount is not None:
+            shape.append("min")
+        if self.max_amount is not None:
+            shape.append("max")
+        if self.text:
+            shape.append("text")
+        if self.anomalies:
+            shape.append("anomalies")
+        if self.ids is not None:
+            shape.append("ids")
+        if self.exclude_ids is not None:
+            shape.append("exclude_ids")
+        return tuple(shape)
+
+    def _params(self) -> tuple:
+        """Возвращает параметры SQL в порядке условий _compile_where."""
+        params = [self.account] if self.account else []
+        if self.period == "today":
+            params.append(day_number(datetime.now()))
+        elif self.period == "month":
+            params.append(month_number(datetime.now()))
+        # Границы дат задаются по колонке ts, чтобы один индекс давал и диапазон, и сортировку
+        if self.start_date:
+            params.append(day_number(self.start_date) * SECONDS_PER_DAY)
+        if self.end_date:
+            params.append((day_number(self.end_date) + 1) * SECONDS_PER_DAY)
+        if self.categories:
+            params.append(json.dumps(self.categories, ensure_ascii=False))
+        # Расходы хранятся отрицательными суммами, поэтому границы берутся со знаком минус
+        sign = -1 if self.kind == "expense" else 1
+        params.extend(sign * value for value in (self.min_amount, self.max_amount) if value is not None)
+        if self.text:
+            params.append(self.text.casefold())
+        params.extend(json.dumps(list(ids)) for ids in (self.ids, self.exclude_ids) if ids is not None)
+        return tuple(params)
+
+    def compile(self, select: str = EXPENSE_COLUMNS, group_by: str = None,
+                order_by: str = "ts DESC") -> Tuple[str, tuple]:
+        """Компилирует запрос в SQL и параметры.
+
+        Args:
+            select (str, optional): Список выбираемых выражений. По умолчанию колонки операции.
+            group_by (str, optional): Выражение группировки. По умолчанию без группировки.
+            order_by (str, optional): Порядок сортировки. По умолчанию по убыванию даты.
+
+        Returns:
+            Tuple[str, tuple]: Текст SQL и параметры.
+
+        Raises:
+            ValueError: Если фильтр по меткам не разрешен в номера операций.
+        """
+        if self.needs_tag_ids:
+            raise ValueError("Фильтр по меткам требует разрешения через индекс меток")
+        return _compile_sql(self._shape(), select, group_by, order_by), self._params()
+
+    def matches(self, expense: Dict[str, Any]) -> bool:
+        """Проверяет операцию на соответствие запросу без обращения к базе.
+
+        Фильтр по меткам проверяется по полям ids и exclude_ids и ключу 'id'
+        операции.
+
+        Args:
+            expense (Dict): Операция с ключами 'category', 'amount', 'description', 'date'.
+
+        Returns:
+            bool: True если операция удовлетворяет всем фильтрам.
+        """
+        if self.account and expense.get("account", DEFAULT_ACCOUNT) != self.account:
+            return False
+        date = expense["date"]
+        now = datetime.now()
+        if self.period == "today" and day_number(date) != day_number(now):
+            return False
+        if self.period == "month" and month_number(date) != month_number(now):
+            return False
+        if self.start_date and day_number(date) < day_number(self.start_date):
+            return False
+        if self.end_date and day_number(date) > day_number(self.end_date):
+            return False
+        if self.categories and expense["category"] not in self.categories:
+            return False
+
+        amount = expense["amount"]
+        if self.kind == "income" and amount <= 0 or self.kind == "expense" and amount >= 0:
+            return False
+        if self.min_amount is not None and abs(amount) < self.min_amount:
+            return False
+        if self.max_amount is not None and abs(amount) > self.max_amount:
+            return False
+        if self.text and self.text.casefold() not in (expense.get("description") or "").casefold():
+            return False
+        if self.anomalies and expense.get("anomaly") is None:
+            return False
+        if self.ids is not None and expense.get("id") not in self.ids:
+            return False
+        if self.exclude_ids is not None and expense.get("id") in self.exclude_ids:
+            return False
+        return True
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, ExpenseQuery) and all(
+            getattr(self, field) == getattr(other, field) for field in self.FIELDS
+        )
+
+    def __repr__(self) -> str:
+        filters = ", ".join(f"{field}={getattr(self, field)!r}" for field in self.FIELDS
+                            if getattr(self, field) not in (None, (), False))
+        return f"ExpenseQuery({filters})"
+
+
+def _compile_where(shape: Tuple[str, ...]) -> str:
+    """Строит условие WHERE для набора фильтров."""
+    # Счет идет первым: индексы с ведущей колонкой account ограничивают
+    # чтение диапазоном одного счета
+    conditions = ["account = ?"] if "account" in shape else []
+    if "today" in shape:
+        conditions.append("day = ?")
+    if "month" in shape:
+        conditions.append("month = ?")
+    if "start" in shape:
+        conditions.append("ts >= ?")
+    if "end" in shape:
+        conditions.append("ts < ?")
+    if "categories" in shape:
+        conditions.append("category IN (SELECT value FROM json_each(?))")
+
+    if "income" in shape:
+        conditions.append("amount > 0")
+    elif "expense" in shape:
+        conditions.append("amount < 0")
+    if "income" in shape or "expense" in shape:
+        # Знак суммы известен, поэтому границы сравниваются с amount напрямую
+        if "min" in shape:
+            conditions.append("amount <= ?" if "expense" in shape else "amount >= ?")
+        if "max" in shape:
+            conditions.append("amount >= ?" if "expense" in shape else "amount <= ?")
+    else:
+        if "min" in shape:
+            conditions.append("ABS(amount) >= ?")
+        if "max" in shape:
+            conditions.append("ABS(amount) <= ?")
+
+    if "text" in shape:
+        conditions.append(f"instr(casefold({DESCRIPTION_SQL}), ?) > 0")
+    if "anomalies" in shape:
+        conditions.append("anomaly IS NOT NULL")
+    if "ids" in shape:
+        conditions.append("id IN (SELECT value FROM json_each(?))")
+    if "exclude_ids" in shape:
+        conditions.append("id NOT IN (SELECT value FROM json_each(?))")
+    return " AND ".join(conditions)
+
+
+@lru_cache(maxsize=128)
+def _compile_sql(shape: Tuple[str, ...], select: str, group_by: str, order_by: str) -> str:
+    """Собирает текст SQL; результат кэшируется по набору фильтров."""
+    sql = f"SELECT {select} FROM expenses"
+    where = _compile_where(shape)
+    if where:
+        sql += f" WHERE {where}"
+    if group_by:
+        sql += f" GROUP BY {group_by}"
+    if order_by:
+        sql += f" ORDER BY {order_by}"
+    return sql
@@ -0,0 +1,180 @@
+"""Модуль буферизованного вывода списков операций в консоль.
+
+Строки формируются большими блоками и записываются за один вызов,
+ширина колонок вычисляется по первым строкам выборки, а вывод может
+передаваться пейджеру. Если пейджер закрыт, чтение операций из базы
+прекращается.
+"""
+
+import io
+import json
+import os
+import shlex
+import subprocess
+import sys
+from contextlib import contextmanager
+from itertools import chain, islice
+from typing import Iterable, Iterator, TextIO
+from .models import Expense
+
+FORMATS = ("table", "tsv", "json")
+
+# Размер блока вывода в символах
+CHUNK_SIZE = 64 * 1024
+
+# Количество строк, по которым вычисляется ширина колонок
+SAMPLE_ROWS = 200
+
+# Ширина колонки категории: минимальная (как в исходном выводе) и максимальная
+MIN_CATEGORY_WIDTH = 15
+MAX_CATEGORY_WIDTH = 40
+
+
+class OutputClosed(Exception):
+    """Вывод закрыт получателем (например, пользователь вышел из пейджера)."""
+
+
+class ChunkedOutput:
+    """Накапливает текст и записывает его в поток блоками по CHUNK_SIZE символов."""
+
+    def __init__(self, stream: TextIO, chunk_size: int = CHUNK_SIZE):
+        """Инициализирует буфер вывода.
+
+        Args:
+            stream (TextIO): Поток для записи.
+            chunk_size (int, optional): Размер блока. По умолчанию CHUNK_SIZE.
+        """
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self._parts = []
+        self._size = 0
+
+    def write(self, text: str):
+        """Добавляет текст в буфер, записывая его при заполнении блока.
+
+        Raises:
+            OutputClosed: Если получатель закрыл поток.
+        """
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Записывает накопленный текст в поток.
+
+        Raises:
+            OutputClosed: Если получатель закрыл поток.
+        """
+        if not self._parts:
+            return
+        try:
+            self.stream.write("".join(self._parts))
+            self.stream.flush()
+        except BrokenPipeError:
+            raise OutputClosed()
+        finally:
+            self._parts = []
+            self._size = 0
+
+
+@contextmanager
+def open_output(pager: bool = False) -> Iterator[TextIO]:
+    """Открывает поток вывода: пейджер или стандартный вывод.
+
+    Пейджер берется из переменной окружения PAGER (по умолчанию
+    ``less -FRX``) и запускается, только если вывод идет в терминал.
+
+    Args:
+        pager (bool, optional): Использовать пейджер. По умолчанию False.
+
+    Yields:
+        TextIO: Поток для записи.
+    """
+    if not pager or not sys.stdout.isatty():
+        yield sys.stdout
+        return
+
+    command = shlex.split(os.environ.get("PAGER", "less -FRX"))
+    try:
+        process = subprocess.Popen(command, stdin=subprocess.PIPE)
+    except OSError:
+        yield sys.stdout
+        return
+
+    stream = io.TextIOWrapper(process.stdin, encoding=sys.stdout.encoding or "utf-8")
+    try:
+        yield stream
+    finally:
+        try:
+            stream.close()
+        except BrokenPipeError:
+            pass
+        process.wait()
+
+
+def _tsv_field(value) -> str:
+    """Экранирует значение для формата TSV."""
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+
+
+def render_expenses(expenses: Iterable[Expense], fmt: str = "table", stream: TextIO = None,
+                    title: str = "") -> int:
+    """Выводит операции в выбранном формате большими блоками.
+
+    Операции перебираются лениво: при закрытии получателя перебор
+    прекращается, и оставшиеся строки не запрашиваются из базы.
+
+    Args:
+        expenses (Iterable[Expense]): Операции для вывода.
+        fmt (str, optional): Формат: 'table', 'tsv' или 'json'. По умолчанию 'table'.
+        stream (TextIO, optional): Поток вывода. По умолчанию sys.stdout.
+        title (str, optional): Заголовок таблицы. По умолчанию "".
+
+    Returns:
+        int: Количество выведенных операций.
+
+    Raises:
+        ValueError: Если формат не поддерживается.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат вывода: '{fmt}'")
+
+    out = ChunkedOutput(stream or sys.stdout)
+    expenses = iter(expenses)
+    sample = list(islice(expenses, SAMPLE_ROWS))
+    if not sample and fmt == "table":
+        return 0
+
+    count = 0
+    try:
+        if fmt == "table":
+            width = max(len(expense.category) for expense in sample)
+            width = min(max(width, MIN_CATEGORY_WIDTH), MAX_CATEGORY_WIDTH)
+            out.write(f"\n{title}:\n" + "-" * 50 + "\n")
+            total = 0
+            for count, expense in enumerate(chain(sample, expenses), 1):
+                sign = "-" if expense.amount < 0 else "+"
+                out.write(f"{count}. {expense.date} | {expense.category:{width}} | "
+                          f"{sign} {abs(expense.amount):8.2f} руб. | {expense.description}\n")
+                total += expense.amount
+            out.write("-" * 50 + "\n" + f"Итого: {total:+.2f} руб.\n")
+        elif fmt == "tsv":
+            out.write("date\tcategory\tamount\tdescription\n")
+            for count, expense in enumerate(chain(sample, expenses), 1):
+                out.write("\t".join(_tsv_field(value) for value in (
+                    expense.date, expense.category, expense.amount, expense.description
+                )) + "\n")
+        else:  # json
+            out.write("[")
+            for count, expense in enumerate(chain(sample, expenses), 1):
+                out.write(("," if count > 1 else "") + "\n  " + json.dumps(expense.to_dict(), ensure_ascii=False))
+            out.write("\n]\n")
+        out.flush()
+    except OutputClosed:
+        pass
+    finally:
+        # Закрываем генератор, чтобы освободить курсор и соединение с базой
+        if hasattr(expenses, "close"):
+            expenses.close()
+    return count
@@ -3,25 +3,36 @@
 Предоставляет функции для создания отчетов по категориям и периодам.
 """
 
+import calendar
 import csv
-from typing import Dict
-from .database import get_category_report_from_db, get_period_report_from_db
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Tuple, Union
+from .models import month_to_str
+from .storage import get_backend
+from .query import ExpenseQuery
 
+# Файл описания пакета отчетов в каталоге пакета
+BATCH_MANIFEST = "manifest.json"
 
-def generate_category_report(period: str = "month", output_file: str = None) -> Dict:
+
+def generate_category_report(period: Union[str, ExpenseQuery] = "month", output_file: str = None) -> Dict:
     """Генерирует отчет по категориям за указанный период.
 
     Args:
-        period (str, optional): Период для отчета.
-            Допустимые значения: 'today', 'month', 'all'. По умолчанию 'month'.
+        period (Union[str, ExpenseQuery], optional): Период для отчета
+            ('today', 'month', 'all') или запрос с фильтрами. По умолчанию 'month'.
         output_file (str, optional): Путь для сохранения отчета в CSV.
             По умолчанию None.
 
     Returns:
         Dict: Словарь с данными отчета.
     """
-    # Используем функцию из database.py для эффективной работы с БД
-    report = get_category_report_from_db(period)
+    # Агрегация выполняется текущим движком хранения
+    report = get_backend().category_report(period)
 
     if output_file:
         save_report_to_csv(report, output_file)
@@ -29,7 +40,8 @@ def generate_category_report(period: str = "month", output_file: str = None) ->
     return report
 
 
-def generate_period_report(start_date: str, end_date: str, output_file: str = None) -> Dict:
+def generate_period_report(start_date: str, end_date: str, output_file: str = None,
+                           bucket: str = "day", query: ExpenseQuery = None) -> Dict:
     """Генерирует отчет за указанный период времени.
 
     Args:
@@ -37,12 +49,154 @@ def generate_period_report(start_date: str, end_date: str, output_file: str = No
         end_date (str): Конечная дата в формате YYYY-MM-DD.
         output_file (str, optional): Путь для сохранения отчета в CSV.
             По умолчанию None.
+        bucket (str, optional): Группировка сумм: 'day', 'week' или 'month'.
+            По умолчанию 'day'.
+        query (ExpenseQuery, optional): Дополнительные фильтры по категориям,
+            суммам, типу и тексту. По умолчанию None.
+
+    Returns:
+        Dict: Словарь с данными отчета.
+    """
+    # Агрегация выполняется текущим движком хранения
+    report = get_backend().period_report(start_date, end_date, bucket, query)
+
+    if output_file:
+        save_report_to_csv(report, output_file)
+
+    return report
+
+
+def generate_timeseries_report(period: Union[str, ExpenseQuery] = "all", bucket: str = "month",
+                               output_file: str = None) -> Dict:
+    """Генерирует временной ряд доходов и расходов.
+
+    Ряд строится одним агрегирующим запросом с группировкой по
+    целочисленным колонкам дат.
+
+    Args:
+        period (Union[str, ExpenseQuery], optional): Период для отчета
+            ('today', 'month', 'all') или запрос с фильтрами. По умолчанию 'all'.
+        bucket (str, optional): Шаг ряда: 'day', 'week', 'month' или 'year'.
+            По умолчанию 'month'.
+        output_file (str, optional): Путь для сохранения отчета в CSV.
+            По умолчанию None.
+
+    Returns:
+        Dict: Словарь с данными отчета.
+    """
+    report = get_backend().timeseries_report(period, bucket)
+
+    if output_file:
+        save_report_to_csv(report, output_file)
+
+    return report
+
+
+def generate_pivot_report(period: Union[str, ExpenseQuery] = "all", bucket: str = "month",
+                          output_file: str = None) -> Dict:
+    """Генерирует сводную таблицу сумм: категории по строкам, интервалы по колонкам.
+
+    Вся таблица строится одним агрегирующим запросом вместо отдельного
+    отчета по категориям для каждого месяца.
+
+    Args:
+        period (Union[str, ExpenseQuery], optional): Период для отчета
+            ('today', 'month', 'all') или запрос с фильтрами. По умолчанию 'all'.
+        bucket (str, optional): Интервал колонок: 'day', 'week', 'month' или 'year'.
+            По умолчанию 'month'.
+        output_file (str, optional): Путь для сохранения отчета в CSV.
+            По умолчанию None.
+
+    Returns:
+        Dict: Словарь с данными отчета.
+    """
+    report = get_backend().pivot_report(period, bucket)
+
+    if output_file:
+        save_report_to_csv(report, output_file)
+
+    return report
+
+
+def generate_anomaly_report(period: Union[str, ExpenseQuery] = "all", output_file: str = None) -> Dict:
+    """Генерирует отчет об операциях, необычных для своей категории.
+
+    Операции отмечаются при добавлении по текущей статистике категории,
+    поэтому отчет читает сохраненные отметки и не пересматривает историю.
+
+    Args:
+        period (Union[str, ExpenseQuery], optional): Период для отчета
+            ('today', 'month', 'all') или запрос с фильтрами. По умолчанию 'all'.
+        output_file (str, optional): Путь для сохранения отчета в CSV.
+            По умолчанию None.
+
+    Returns:
+        Dict: Словарь с данными отчета.
+    """
+    report = get_backend().anomaly_report(period)
+
+    if output_file:
+        save_report_to_csv(report, output_file)
+
+    return report
+
+
+def generate_tree_report(period: Union[str, ExpenseQuery] = "month", output_file: str = None) -> Dict:
+    """Генерирует отчет с суммами по поддеревьям вложенных категорий.
+
+    Сумма каждой категории включает операции всех ее подкатегорий;
+    собственная сумма - только операции самой категории.
+
+    Args:
+        period (Union[str, ExpenseQuery], optional): Период для отчета
+            ('today', 'month', 'all') или запрос с фильтрами. По умолчанию 'month'.
+        output_file (str, optional): Путь для сохранения отчета в CSV.
+            По умолчанию None.
+
+    Returns:
+        Dict: Словарь с данными отчета.
+    """
+    report = get_backend().tree_report(period)
+
+    if output_file:
+        save_report_to_csv(report, output_file)
+
+    return report
+
+
+def generate_account_report(period: Union[str, ExpenseQuery] = "all", output_file: str = None) -> Dict:
+    """Генерирует сводный отчет по всем счетам.
+
+    Args:
+        period (Union[str, ExpenseQuery], optional): Период для отчета
+            ('today', 'month', 'all') или запрос с фильтрами. По умолчанию 'all'.
+        output_file (str, optional): Путь для сохранения отчета в CSV.
+            По умолчанию None.
+
+    Returns:
+        Dict: Словарь с данными отчета.
+    """
+    report = get_backend().account_report(period)
+
+    if output_file:
+        save_report_to_csv(report, output_file)
+
+    return report
+
+
+def generate_merchant_report(period: Union[str, ExpenseQuery] = "all", output_file: str = None) -> Dict:
+    """Генерирует отчет с количеством и суммой операций по каждому описанию (магазину, услуге).
+
+    Args:
+        period (Union[str, ExpenseQuery], optional): Период для отчета
+            ('today', 'month', 'all') или запрос с фильтрами. По умолчанию 'all'.
+        output_file (str, optional): Путь для сохранения отчета в CSV.
+            По умолчанию None.
 
     Returns:
         Dict: Словарь с данными отчета.
     """
-    # Используем функцию из database.py для эффективной работы с БД
-    report = get_period_report_from_db(start_date, end_date)
+    report = get_backend().merchant_report(period)
 
     if output_file:
         save_report_to_csv(report, output_file)
@@ -50,6 +204,191 @@ def generate_period_report(start_date: str, end_date: str, output_file: str = No
     return report
 
 
+def generate_stats_report(period: Union[str, ExpenseQuery] = "all", output_file: str = None) -> Dict:
+    """Генерирует отчет со статистикой сумм операций по категориям.
+
+    Среднее, медиана, p90 и стандартное отклонение считаются внутри
+    SQLite агрегатными функциями, зарегистрированными на соединении.
+
+    Args:
+        period (Union[str, ExpenseQuery], optional): Период для отчета
+            ('today', 'month', 'all') или запрос с фильтрами. По умолчанию 'all'.
+        output_file (str, optional): Путь для сохранения отчета в CSV.
+            По умолчанию None.
+
+    Returns:
+        Dict: Словарь с данными отчета.
+    """
+    report = get_backend().stats_report(period)
+
+    if output_file:
+        save_report_to_csv(report, output_file)
+
+    return report
+
+
+def generate_tag_report(period: Union[str, ExpenseQuery] = "all", output_file: str = None) -> Dict:
+    """Генерирует отчет с количеством и суммой операций по каждой метке.
+
+    Args:
+        period (Union[str, ExpenseQuery], optional): Период для отчета
+            ('today', 'month', 'all') или запрос с фильтрами. По умолчанию 'all'.
+        output_file (str, optional): Путь для сохранения отчета в CSV.
+            По умолчанию None.
+
+    Returns:
+        Dict: Словарь с данными отчета.
+    """
+    report = get_backend().tag_report(period)
+
+    if output_file:
+        save_report_to_csv(report, output_file)
+
+    return report
+
+
+def generate_distribution_report(period: Union[str, ExpenseQuery] = "month", output_file: str = None) -> Dict:
+    """Генерирует отчет о распределении сумм операций по категориям.
+
+    Для каждой категории вычисляются медиана, p90 и p99 сумм операций
+    по объединенным месячным скетчам.
+
+    Args:
+        period (Union[str, ExpenseQuery], optional): Период для отчета
+            ('today', 'month', 'all') или запрос с фильтрами. По умолчанию 'month'.
+        output_file (str, optional): Путь для сохранения отчета в CSV.
+            По умолчанию None.
+
+    Returns:
+        Dict: Словарь с данными отчета.
+    """
+    report = get_backend().distribution_report(period)
+
+    if output_file:
+        save_report_to_csv(report, output_file)
+
+    return report
+
+
+def _month_range(text: str) -> Tuple[int, int]:
+    """Возвращает первый и последний номер месяца для 'YYYY' или 'YYYY-MM'."""
+    if re.fullmatch(r"\d{4}", text):
+        return int(text) * 12, int(text) * 12 + 11
+    if re.fullmatch(r"\d{4}-\d{2}", text) and 1 <= int(text[5:]) <= 12:
+        month = int(text[:4]) * 12 + int(text[5:]) - 1
+        return month, month
+    raise ValueError(f"Неверный период: '{text}' (ожидается YYYY или YYYY-MM)")
+
+
+def parse_months(spec: str) -> List[int]:
+    """Разбирает список месяцев для пакета отчетов.
+
+    Args:
+        spec (str): Месяцы через запятую; каждый элемент - месяц ('2025-03'),
+            год ('2025') или диапазон ('2025-01..2025-06').
+
+    Returns:
+        List[int]: Номера месяцев по возрастанию.
+
+    Raises:
+        ValueError: Если список не разбирается или диапазон пуст.
+    """
+    months = set()
+    for part in spec.split(","):
+        first, _, last = part.strip().partition("..")
+        start, end = _month_range(first)[0], _month_range(last or first)[1]
+        if start > end:
+            raise ValueError(f"Пустой диапазон периодов: '{part.strip()}'")
+        months.update(range(start, end + 1))
+    return sorted(months)
+
+
+def _month_dates(month: int) -> Tuple[str, str]:
+    """Возвращает первый и последний день месяца в формате YYYY-MM-DD."""
+    text = month_to_str(month)
+    return f"{text}-01", f"{text}-{calendar.monthrange(month // 12, month % 12 + 1)[1]:02d}"
+
+
+def generate_batch_reports(months: List[int], directory: str, query: ExpenseQuery = None,
+                           by_account: bool = False, workers: int = 1) -> Dict:
+    """Генерирует отчеты по категориям за несколько месяцев за один проход по данным.
+
+    Итоги всех месяцев (и счетов) считаются одним сгруппированным запросом,
+    после чего каждый отчет записывается в свой CSV-файл, а в каталог
+    добавляется файл manifest.json со списком отчетов.
+
+    Args:
+        months (List[int]): Номера месяцев по возрастанию (см. parse_months).
+        directory (str): Каталог для файлов отчетов (создается при необходимости).
+        query (ExpenseQuery, optional): Дополнительные фильтры. Период и даты
+            запроса заменяются месяцами пакета. По умолчанию None.
+        by_account (bool, optional): Отдельный отчет для каждого счета. По умолчанию False.
+        workers (int, optional): Количество потоков записи файлов. По умолчанию 1.
+
+    Returns:
+        Dict: Описание пакета (содержимое manifest.json).
+    """
+    query = ExpenseQuery.coerce(query).replace(period="all")
+    rows = get_backend().monthly_category_totals(
+        query.replace(start_date=_month_dates(months[0])[0], end_date=_month_dates(months[-1])[1])
+    )
+
+    wanted = set(months)
+    groups = {}
+    accounts = set()
+    for month, account, category, count, total in rows:
+        if month not in wanted:
+            continue
+        accounts.add(account)
+        group = groups.setdefault((month, account if by_account else None), {})
+        totals = group.setdefault(category, [0, 0.0])
+        totals[0] += count
+        totals[1] += total
+
+    generated_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    reports = []
+    for month in months:
+        for account in sorted(accounts) if by_account else [None]:
+            group = groups.get((month, account), {})
+            start, end = _month_dates(month)
+            label = query.replace(start_date=start, end_date=end, account=account or query.account).describe()
+            name = f"category_{month_to_str(month)}"
+            if account is not None:
+                name += "_" + re.sub(r"[^\w.-]", "_", account)
+            reports.append((f"{name}.csv", month, account, {
+                "period": label,
+                "total_expenses": sum(count for count, _ in group.values()),
+                "total_amount": sum(total for _, total in group.values()),
+                "categories": sorted(((category, total) for category, (_, total) in group.items()),
+                                     key=lambda item: item[1], reverse=True),
+                "generated_at": generated_at
+            }))
+
+    os.makedirs(directory, exist_ok=True)
+    paths = [os.path.join(directory, name) for name, _, _, _ in reports]
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(save_report_to_csv, [report for *_, report in reports], paths))
+    else:
+        for (_, _, _, report), path in zip(reports, paths):
+            save_report_to_csv(report, path)
+
+    manifest = {
+        "generated_at": generated_at,
+        "query": query.describe(),
+        "months": [month_to_str(month) for month in months],
+        "by_account": by_account,
+        "reports": [
+            {"file": name, "month": month_to_str(month), "account": account,
+             "total_expenses": report["total_expenses"], "total_amount": report["total_amount"]}
+            for name, month, account, report in reports
+        ],
+    }
+    with open(os.path.join(directory, BATCH_MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
 def save_report_to_csv(report: Dict, filename: str):
     """Сохраняет отчет в CSV файл.
 
@@ -79,30 +418,138 @@ def save_report_to_csv(report: Dict, filename: str):
                 writer.writerow(["Дата", "Сумма"])
                 for date, amount in report["daily_totals"].items():
                     writer.writerow([date, f"{amount:.2f}"])
+            elif "distribution" in report:
+                writer.writerow(["Категория", "Операций", "Медиана", "P90", "P99"])
+                for category, count, p50, p90, p99 in report["distribution"]:
+                    writer.writerow([category, count, f"{p50:.2f}", f"{p90:.2f}", f"{p99:.2f}"])
+            elif "timeseries" in report:
+                writer.writerow(["Интервал", "Операций", "Доходы", "Расходы", "Итого"])
+                for label, count, income, expense, total in report["timeseries"]:
+                    writer.writerow([label, count, f"{income:.2f}", f"{expense:.2f}", f"{total:.2f}"])
+            elif "anomalies" in report:
+                writer.writerow(["Дата", "Категория", "Сумма", "Описание", "Отклонение"])
+                for date, category, amount, description, score in report["anomalies"]:
+                    writer.writerow([date, category, f"{amount:.2f}", description, f"{score:.2f}"])
+            elif "accounts" in report:
+                writer.writerow(["Счет", "Операций", "Доходы", "Расходы", "Итого"])
+                for account, count, income, expense, total in report["accounts"]:
+                    writer.writerow([account, count, f"{income:.2f}", f"{expense:.2f}", f"{total:.2f}"])
+            elif "stats" in report:
+                writer.writerow(["Категория", "Операций", "Сумма", "Среднее", "Медиана", "P90",
+                                 "Стандартное отклонение"])
+                for category, count, amount, mean, median, p90, stddev in report["stats"]:
+                    writer.writerow([category, count, f"{amount:.2f}", f"{mean:.2f}", f"{median:.2f}",
+                                     f"{p90:.2f}", f"{stddev:.2f}"])
+            elif "merchants" in report:
+                writer.writerow(["Описание", "Операций", "Сумма"])
+                for merchant, count, amount in report["merchants"]:
+                    writer.writerow([merchant, count, f"{amount:.2f}"])
+            elif "tags" in report:
+                writer.writerow(["Метка", "Операций", "Сумма"])
+                for tag, count, amount in report["tags"]:
+                    writer.writerow([tag, count, f"{amount:.2f}"])
+            elif "tree" in report:
+                writer.writerow(["Категория", "Уровень", "Сумма с подкатегориями", "Собственная сумма", "Операций"])
+                for category, level, total, own, count in report["tree"]:
+                    writer.writerow([category, level, f"{total:.2f}", f"{own:.2f}", count])
+            elif "pivot" in report:
+                writer.writerow(["Категория"] + report["pivot"]["columns"] + ["Итого"])
+                for category, values, total in report["pivot"]["rows"]:
+                    writer.writerow([category] + [f"{value:.2f}" for value in values] + [f"{total:.2f}"])
 
         print(f"Отчет сохранен в файл: {filename}")
     except IOError as e:
         print(f"Ошибка сохранения отчета: {e}")
 
 
-def print_report(report: Dict):
-    """Выводит отчет в консоль в читаемом формате.
+def format_report(report: Dict) -> str:
+    """Формирует текст отчета в читаемом формате.
 
     Args:
-        report (Dict): Данные отчета для вывода.
+        report (Dict): Данные отчета.
+
+    Returns:
+        str: Текст отчета.
     """
-    print(f"\n=== ФИНАНСОВЫЙ ОТЧЕТ ===")
-    print(f"Период: {report['period']}")
-    print(f"Операций: {report['total_expenses']}")
-    print(f"Общая сумма: {report['total_amount']:.2f} руб.")
-    print(f"Сгенерирован: {report['generated_at']}")
+    lines = [
+        "\n=== ФИНАНСОВЫЙ ОТЧЕТ ===",
+        f"Период: {report['period']}",
+        f"Операций: {report['total_expenses']}",
+        f"Общая сумма: {report['total_amount']:.2f} руб.",
+        f"Сгенерирован: {report['generated_at']}",
+    ]
 
     if "categories" in report:
-        print("\n--- По категориям ---")
+        lines.append("\n--- По категориям ---")
         for category, amount in report["categories"]:
-            print(f"  {category}: {amount:.2f} руб.")
+            lines.append(f"  {category}: {amount:.2f} руб.")
 
     if "daily_totals" in report:
-        print("\n--- По дням ---")
+        lines.append("\n--- По дням ---")
         for date, amount in report["daily_totals"].items():
-            print(f"  {date}: {amount:.2f} руб.")
\ No newline at end of file
+            lines.append(f"  {date}: {amount:.2f} руб.")
+
+    if "distribution" in report:
+        lines.append("\n--- Распределение сумм ---")
+        for category, count, p50, p90, p99 in report["distribution"]:
+            lines.append(f"  {category}: {count} опер., медиана {p50:.2f}, p90 {p90:.2f}, p99 {p99:.2f} руб.")
+
+    if "timeseries" in report:
+        lines.append("\n--- Временной ряд ---")
+        for label, count, income, expense, total in report["timeseries"]:
+            lines.append(f"  {label}: {count} опер., доходы {income:.2f}, расходы {expense:.2f}, "
+                         f"итого {total:+.2f} руб.")
+
+    if "anomalies" in report:
+        lines.append("\n--- Необычные операции ---")
+        for date, category, amount, description, score in report["anomalies"]:
+            lines.append(f"  {date} | {category}: {amount:.2f} руб. ({score:+.1f} σ) {description}")
+
+    if "accounts" in report:
+        lines.append("\n--- По счетам ---")
+        for account, count, income, expense, total in report["accounts"]:
+            lines.append(f"  {account}: {count} опер., доходы {income:.2f}, расходы {expense:.2f}, "
+                         f"итого {total:+.2f} руб.")
+
+    if "stats" in report:
+        lines.append("\n--- Статистика сумм по категориям ---")
+        for category, count, amount, mean, median, p90, stddev in report["stats"]:
+            lines.append(f"  {category}: {count} опер., {amount:.2f} руб.; среднее {mean:.2f}, "
+                         f"медиана {median:.2f}, p90 {p90:.2f}, σ {stddev:.2f}")
+
+    if "merchants" in report:
+        lines.append("\n--- По описаниям ---")
+        for merchant, count, amount in report["merchants"]:
+            lines.append(f"  {merchant or '(без описания)'}: {count} опер., {amount:.2f} руб.")
+
+    if "tags" in report:
+        lines.append("\n--- По меткам ---")
+        for tag, count, amount in report["tags"]:
+            lines.append(f"  {tag}: {count} опер., {amount:.2f} руб.")
+
+    if "tree" in report:
+        lines.append("\n--- По дереву категорий ---")
+        for category, level, total, own, count in report["tree"]:
+            own_text = f" (собственные {own:.2f})" if own != total else ""
+            lines.append(f"  {'  ' * level}{category}: {total:.2f} руб.{own_text}, {count} опер.")
+
+    if "pivot" in report:
+        pivot = report["pivot"]
+        width = max([len(category) for category, _, _ in pivot["rows"]] + [9])
+        lines.append("\n--- Сводная таблица ---")
+        lines.append(f"  {'Категория':{width}} " + " ".join(f"{column:>12}" for column in pivot["columns"])
+                     + f" {'Итого':>12}")
+        for category, values, total in pivot["rows"]:
+            lines.append(f"  {category:{width}} " + " ".join(f"{value:12.2f}" for value in values)
+                         + f" {total:12.2f}")
+
+    return "\n".join(lines)
+
+
+def print_report(report: Dict):
+    """Выводит отчет в консоль одной записью.
+
+    Args:
+        report (Dict): Данные отчета для вывода.
+    """
+    print(format_report(report))
\ No newline at end of file
@@ -0,0 +1,181 @@
+"""Модуль с потоковыми квантильными скетчами.
+
+Содержит компактный объединяемый скетч в духе KLL, который позволяет
+оценивать медиану и перцентили сумм операций за ограниченное время
+и с ограниченной памятью, не выгружая все суммы из базы данных.
+"""
+
+import json
+from typing import List, Optional
+
+
+class QuantileSketch:
+    """Объединяемый скетч для оценки квантилей (упрощенный KLL).
+
+    Значения хранятся по уровням: элемент уровня ``h`` представляет
+    ``2 ** h`` исходных значений. Пока значений меньше ``k``, скетч
+    хранит их все и отвечает точно.
+
+    Attributes:
+        k (int): Параметр точности (емкость верхнего уровня).
+        count (int): Количество добавленных значений.
+        min (float): Минимальное значение или None.
+        max (float): Максимальное значение или None.
+    """
+
+    def __init__(self, k: int = 200):
+        """Инициализирует пустой скетч.
+
+        Args:
+            k (int, optional): Параметр точности. По умолчанию 200.
+        """
+        self.k = k
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.levels: List[List[float]] = [[]]
+        self._compactions = 0
+
+    def _capacity(self, level: int) -> int:
+        """Возвращает емкость уровня: нижние уровни меньше верхних."""
+        depth = len(self.levels) - level - 1
+        return max(8, int(self.k * (2 / 3) ** depth))
+
+    def _compress(self):
+        """Уплотняет переполненные уровни, поднимая половину значений выше."""
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) >= self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append([])
+                items.sort()
+                # При нечетном количестве одно значение остается на уровне
+                rest = [items.pop()] if len(items) % 2 else []
+                offset = self._compactions % 2
+                self._compactions += 1
+                self.levels[level + 1].extend(items[offset::2])
+                self.levels[level] = rest
+            level += 1
+
+    def add(self, value: float):
+        """Добавляет значение в скетч.
+
+        Args:
+            value (float): Добавляемое значение.
+        """
+        self.levels[0].append(value)
+        self.count += 1
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        if len(self.levels[0]) >= self._capacity(0):
+            self._compress()
+
+    def update(self, values: List[float]):
+        """Добавляет пачку значений.
+
+        Равносильно последовательным вызовам add, но быстрее: значения
+        переносятся на нижний уровень срезами по его емкости, и проверки
+        выполняются один раз на срез, а не на каждое значение.
+
+        Args:
+            values (List[float]): Добавляемые значения.
+        """
+        if not values:
+            return
+        self.count += len(values)
+        low, high = min(values), max(values)
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+        start = 0
+        while start < len(values):
+            bottom = self.levels[0]
+            end = start + max(self._capacity(0) - len(bottom), 1)
+            bottom.extend(values[start:end])
+            start = end
+            if len(bottom) >= self._capacity(0):
+                self._compress()
+
+    def merge(self, other: 'QuantileSketch') -> 'QuantileSketch':
+        """Объединяет другой скетч с текущим.
+
+        Args:
+            other (QuantileSketch): Скетч для объединения.
+
+        Returns:
+            QuantileSketch: Текущий скетч (для цепочек вызовов).
+        """
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for level, items in enumerate(other.levels):
+            self.levels[level].extend(items)
+        self.count += other.count
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        self._compress()
+        return self
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Оценивает квантиль уровня q.
+
+        Args:
+            q (float): Уровень квантиля от 0 до 1.
+
+        Returns:
+            Optional[float]: Оценка квантиля или None для пустого скетча.
+        """
+        if self.count == 0:
+            return None
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+
+        weighted = sorted(
+            (value, 1 << level)
+            for level, items in enumerate(self.levels)
+            for value in items
+        )
+        total_weight = sum(weight for _, weight in weighted)
+        target = q * total_weight
+        cumulative = 0
+        for value, weight in weighted:
+            cumulative += weight
+            if cumulative >= target:
+                return value
+        return self.max
+
+    def to_json(self) -> str:
+        """Сериализует скетч в JSON-строку для хранения в базе данных.
+
+        Returns:
+            str: JSON-представление скетча.
+        """
+        return json.dumps({
+            "k": self.k,
+            "n": self.count,
+            "min": self.min,
+            "max": self.max,
+            "c": self._compactions,
+            "levels": self.levels
+        }, separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, data: str) -> 'QuantileSketch':
+        """Восстанавливает скетч из JSON-строки.
+
+        Args:
+            data (str): JSON-представление скетча.
+
+        Returns:
+            QuantileSketch: Восстановленный скетч.
+        """
+        raw = json.loads(data)
+        sketch = cls(raw["k"])
+        sketch.count = raw["n"]
+        sketch.min = raw["min"]
+        sketch.max = raw["max"]
+        sketch._compactions = raw["c"]
+        sketch.levels = raw["levels"] or [[]]
+        return sketch
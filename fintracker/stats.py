@@ -0,0 +1,174 @@
+"""Модуль с потоковой статистикой сумм операций.
+
+Содержит накопитель среднего и дисперсии по алгоритму Уэлфорда,
+который обновляется за O(1) на каждую операцию и позволяет сразу
+оценить, насколько новая сумма необычна для своей категории.
+
+Здесь же определены агрегатные и скалярные функции SQL (``median``,
+``percentile``, ``stddev``, ``month_bucket``), которые регистрируются
+на каждом соединении с базой. Они вычисляют статистику прямо при
+просмотре строк в SQLite, не собирая значения в списки Python.
+"""
+
+import math
+import sqlite3
+from typing import Optional, Union
+from .models import month_to_str
+from .sketch import QuantileSketch
+
+# Количество значений, добавляемых в скетч агрегатной функции за раз
+SQL_AGGREGATE_BATCH = 1024
+
+
+class RunningStats:
+    """Среднее и дисперсия, обновляемые по одному значению (алгоритм Уэлфорда).
+
+    Attributes:
+        count (int): Количество учтенных значений.
+        mean (float): Среднее значение.
+        m2 (float): Сумма квадратов отклонений от среднего.
+    """
+
+    def __init__(self, count: int = 0, mean: float = 0.0, m2: float = 0.0):
+        """Инициализирует накопитель (по умолчанию пустой).
+
+        Args:
+            count (int, optional): Количество значений. По умолчанию 0.
+            mean (float, optional): Среднее значение. По умолчанию 0.0.
+            m2 (float, optional): Сумма квадратов отклонений. По умолчанию 0.0.
+        """
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def add(self, value: float):
+        """Учитывает новое значение."""
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def merge(self, other: 'RunningStats'):
+        """Учитывает все значения другого накопителя (формула Чана)."""
+        count = self.count + other.count
+        if not other.count:
+            return
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+
+    def remove(self, other: 'RunningStats'):
+        """Исключает значения, учтенные в другом накопителе (обратная формула Чана)."""
+        count = self.count - other.count
+        if count <= 0:
+            self.count, self.mean, self.m2 = 0, 0.0, 0.0
+            return
+        if not other.count:
+            return
+        mean = (self.count * self.mean - other.count * other.mean) / count
+        delta = other.mean - mean
+        self.m2 = max(self.m2 - other.m2 - delta * delta * count * other.count / self.count, 0.0)
+        self.mean = mean
+        self.count = count
+
+    @property
+    def variance(self) -> float:
+        """float: Выборочная дисперсия (0 для менее чем двух значений)."""
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stddev(self) -> float:
+        """float: Выборочное стандартное отклонение."""
+        return math.sqrt(self.variance)
+
+    def zscore(self, value: float, min_stddev: float = 0.0) -> Optional[float]:
+        """Возвращает отклонение значения от среднего в стандартных отклонениях.
+
+        Args:
+            value (float): Проверяемое значение.
+            min_stddev (float, optional): Нижняя граница стандартного отклонения,
+                чтобы одинаковые суммы в истории не давали нулевой разброс.
+                По умолчанию 0.0.
+
+        Returns:
+            Optional[float]: Z-оценка или None, если разброс еще не определен.
+        """
+        stddev = max(self.stddev, min_stddev)
+        if not stddev:
+            return None
+        return (value - self.mean) / stddev
+
+
+class StddevAggregate:
+    """Агрегатная функция SQL ``stddev(x)``: выборочное стандартное отклонение.
+
+    Значения накапливаются по алгоритму Уэлфорда, который не теряет
+    точность на больших значениях с малым разбросом, в отличие от формулы
+    через сумму квадратов. Значения NULL пропускаются, для пустой группы
+    возвращается NULL.
+    """
+
+    def __init__(self):
+        self.stats = RunningStats()
+
+    def step(self, value: Optional[float]):
+        if value is not None:
+            self.stats.add(value)
+
+    def finalize(self) -> Optional[float]:
+        return self.stats.stddev if self.stats.count else None
+
+
+class PercentileAggregate:
+    """Агрегатная функция SQL ``percentile(x, p)``: перцентиль p (от 0 до 100).
+
+    Значения накапливаются в QuantileSketch, поэтому память ограничена
+    независимо от размера группы; для групп меньше ``k`` значений ответ
+    точный (ближайший ранг, без интерполяции). Значения собираются в
+    пачки по SQL_AGGREGATE_BATCH и добавляются в скетч через update.
+    Значения NULL пропускаются, для пустой группы возвращается NULL.
+    """
+
+    def __init__(self):
+        self.sketch = QuantileSketch()
+        self.batch = []
+        self.level = None
+
+    def step(self, value: Optional[float], percent: float = 50.0):
+        if self.level is None:
+            if percent is None or not 0 <= percent <= 100:
+                raise ValueError(f"Перцентиль должен быть от 0 до 100: {percent!r}")
+            self.level = percent / 100
+        if value is not None:
+            self.batch.append(value)
+            if len(self.batch) >= SQL_AGGREGATE_BATCH:
+                self.sketch.update(self.batch)
+                self.batch = []
+
+    def finalize(self) -> Optional[float]:
+        self.sketch.update(self.batch)
+        return self.sketch.quantile(self.level) if self.sketch.count else None
+
+
+def month_bucket(value: Union[int, str, None]) -> Optional[str]:
+    """Скалярная функция SQL ``month_bucket(x)``: месяц в формате 'YYYY-MM'.
+
+    Принимает номер месяца (колонку ``expenses.month``) или дату строкой.
+    """
+    if value is None:
+        return None
+    if isinstance(value, int):
+        return month_to_str(value)
+    return str(value)[:7]
+
+
+def register_sql_functions(conn: sqlite3.Connection):
+    """Регистрирует статистические функции SQL на соединении.
+
+    ``median(x)`` равна ``percentile(x, 50)``.
+    """
+    conn.create_aggregate('stddev', 1, StddevAggregate)
+    conn.create_aggregate('median', 1, PercentileAggregate)
+    conn.create_aggregate('percentile', 2, PercentileAggregate)
+    conn.create_function('month_bucket', 1, month_bucket, deterministic=True)
@@ -1,68 +1,133 @@
 """Модуль для работы с хранением данных.
 
-Обеспечивает сохранение и загрузку финансовых данных из базы данных.
+Обеспечивает сохранение и загрузку финансовых данных через текущий
+движок хранения (по умолчанию - база данных SQLite).
 """
 
-from typing import List
+import csv
+from typing import List, Dict, Iterator, Union
 from .models import Expense, Category
-from .database import (
-    add_expense_to_db,
-    get_expenses_from_db,
-    add_category_to_db,
-    get_categories_from_db,
-    init_database
-)
+from .backends import StorageBackend, SQLiteBackend
+from .query import ExpenseQuery
+
+_backend: StorageBackend = SQLiteBackend()
+
+
+def get_backend() -> StorageBackend:
+    """Возвращает текущий движок хранения.
+
+    Returns:
+        StorageBackend: Движок, через который работают функции модуля.
+    """
+    return _backend
+
+
+def set_backend(backend: StorageBackend):
+    """Устанавливает движок хранения.
+
+    Args:
+        backend (StorageBackend): Новый движок, например MemoryBackend
+            для временных данных и тестов.
+    """
+    global _backend
+    _backend = backend
 
 
 def init_storage():
     """Инициализирует хранилище (базу данных)."""
-    init_database()
+    _backend.init()
 
 
-def add_expense(category: str, amount: float, description: str = "") -> bool:
+def add_expense(category: str, amount: float, description: str = "", date: str = None,
+                tags: List[str] = None, account: str = None) -> bool:
     """Добавляет новую финансовую операцию.
 
     Args:
         category (str): Категория операции.
         amount (float): Сумма операции.
         description (str, optional): Описание операции. По умолчанию "".
+        date (str, optional): Дата операции. По умолчанию текущее время.
+        tags (List[str], optional): Метки операции. По умолчанию без меток.
+        account (str, optional): Счет операции. По умолчанию основной счет.
 
     Returns:
         bool: True если операция успешно добавлена, иначе False.
     """
-    return add_expense_to_db(category, amount, description)
+    return _backend.add_expense(category, amount, description, date, tags, account)
 
 
-def get_expenses(period: str = "all") -> List[Expense]:
+def get_expenses(period: Union[str, ExpenseQuery] = "all") -> List[Expense]:
     """Получает список операций за указанный период.
 
     Args:
-        period (str, optional): Период для фильтрации.
-            Допустимые значения: 'today', 'month', 'all'. По умолчанию 'all'.
+        period (Union[str, ExpenseQuery], optional): Период для фильтрации
+            ('today', 'month', 'all') или запрос с фильтрами. По умолчанию 'all'.
 
     Returns:
         List[Expense]: Список операций за указанный период.
     """
-    expenses_data = get_expenses_from_db(period)
+    expenses_data = _backend.get_expenses(period)
     return [Expense.from_dict(exp) for exp in expenses_data]
 
 
-def get_categories() -> List[Category]:
-    """Получает список всех категорий.
+def iter_expenses(period: Union[str, ExpenseQuery] = "all") -> Iterator[Expense]:
+    """Построчно выдает операции за указанный период, не загружая их все в память.
+
+    Args:
+        period (Union[str, ExpenseQuery], optional): Период для фильтрации
+            ('today', 'month', 'all') или запрос с фильтрами. По умолчанию 'all'.
+
+    Yields:
+        Expense: Операции в порядке убывания даты.
+    """
+    for exp in _backend.iter_expenses(period):
+        yield Expense.from_dict(exp)
+
+
+def iter_changes(since: int = 0, chunk_size: int = 1000) -> Iterator[Dict]:
+    """Выдает изменения операций после указанного номера журнала.
+
+    Позволяет выгружать данные инкрементально: потребитель запоминает
+    номер 'seq' последнего обработанного изменения и в следующий раз
+    передает его в since. Вставки и изменения следует применять как
+    вставку-или-замену по 'expense_id'.
+
+    Args:
+        since (int, optional): Номер последнего обработанного изменения. По умолчанию 0.
+        chunk_size (int, optional): Количество изменений, читаемых за раз. По умолчанию 1000.
+
+    Yields:
+        Dict: Изменение с ключами 'seq', 'op' ('insert', 'update', 'delete'),
+            'expense_id', 'changed_at' и полями операции.
+
+    Raises:
+        ValueError: Если нужные изменения уже удалены сжатием журнала.
+    """
+    yield from _backend.iter_changes(since, chunk_size)
+
+
+def get_categories(account: str = None) -> List[Category]:
+    """Получает список категорий.
+
+    Args:
+        account (str, optional): Счет; если указан, возвращаются общие
+            категории и категории этого счета. По умолчанию все категории.
 
     Returns:
         List[Category]: Список объектов категорий.
     """
-    categories_data = get_categories_from_db()
+    categories_data = _backend.get_categories(account)
     return [Category.from_dict(cat) for cat in categories_data]
 
 
-def add_category(name: str, cat_type: str) -> bool:
+def add_category(name: str, cat_type: str, parent: str = None, account: str = None) -> bool:
     """Добавляет новую категорию.
 
     Args:
         name (str): Название категории.
         cat_type (str): Тип категории ('expense' или 'income').
+        parent (str, optional): Родительская категория. По умолчанию None.
+        account (str, optional): Счет категории. По умолчанию общая для всех счетов.
 
     Returns:
         bool: True если категория успешно добавлена, иначе False.
@@ -74,4 +139,47 @@ def add_category(name: str, cat_type: str) -> bool:
         print(f"Ошибка: тип категории должен быть 'expense' или 'income', получено: '{cat_type}'")
         return False
 
-    return add_category_to_db(name, cat_type)
\ No newline at end of file
+    return _backend.add_category(name, cat_type, parent, account)
+
+
+def import_expenses(filename: str, on_conflict: str = "ignore", account: str = None) -> Dict[str, int]:
+    """Импортирует операции из CSV-выгрузки банка.
+
+    Файл должен содержать колонки ``date``, ``amount``, ``category`` и
+    необязательные ``description``, ``external_id`` и ``account``.
+    Повторный импорт пересекающихся выгрузок безопасен: дубликаты
+    определяются по хешу содержимого за один проход.
+
+    Args:
+        filename (str): Путь к CSV-файлу.
+        on_conflict (str, optional): 'ignore' пропускает дубликаты,
+            'update' обновляет существующие операции. По умолчанию 'ignore'.
+        account (str, optional): Счет для строк без колонки ``account``.
+            По умолчанию основной счет.
+
+    Returns:
+        Dict[str, int]: Количество добавленных ('inserted') и повторных
+            ('duplicates') операций.
+
+    Raises:
+        ValueError: Если в строке файла нет обязательных полей или сумма некорректна.
+    """
+    rows = []
+    with open(filename, newline='', encoding='utf-8') as csvfile:
+        for line, record in enumerate(csv.DictReader(csvfile), 2):
+            if not record.get("date") or not record.get("category") or not record.get("amount"):
+                raise ValueError(f"строка {line}: обязательны поля date, amount и category")
+            try:
+                amount = float(record["amount"])
+            except ValueError:
+                raise ValueError(f"строка {line}: некорректная сумма '{record['amount']}'")
+            rows.append((
+                record["category"],
+                amount,
+                record.get("description") or "",
+                record["date"],
+                record.get("external_id") or None,
+                record.get("account") or account
+            ))
+
+    return _backend.import_expenses(rows, on_conflict)
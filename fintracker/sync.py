@@ -0,0 +1,220 @@
+"""Модуль двусторонней синхронизации двух файлов базы операций.
+
+Одна и та же операция имеет одинаковый хэш содержимого (``content_hash``)
+в любой копии базы. Для диапазонов дат трех уровней (год, месяц внутри
+года, день внутри месяца) каждая сторона считает количество операций
+и XOR их хэшей. Совпадающие диапазоны пропускаются целиком, в
+различающихся сравнение спускается на уровень ниже, а внутри
+различающегося дня сравниваются сами хэши. Сводки читаются из индекса
+``idx_expenses_sync`` без обращения к строкам таблицы, поэтому для почти
+одинаковых баз стоимость синхронизации - один проход по индексу каждой
+базы и чтение только недостающих строк.
+
+Синхронизация только дополняет базы: удаления, изменения уже
+существующих операций и метки не переносятся.
+"""
+
+import json
+import sqlite3
+from itertools import islice
+from typing import Dict, List, Tuple, Iterator
+from . import database
+from .database import get_connection, init_database, run_write, _insert_expenses
+from .query import DESCRIPTION_SQL
+
+# Колонки, переносимые между базами, в порядке строк _insert_expenses
+SYNC_COLUMNS = f"category, amount, {DESCRIPTION_SQL}, date, external_id, account"
+
+# Количество операций, записываемых одной транзакцией
+COPY_BATCH = 1000
+
+# Операции без хэша содержимого или с нераспознанной датой не синхронизируются
+_SYNCED = "content_hash IS NOT NULL AND day IS NOT NULL"
+
+
+class XorHash:
+    """Агрегатная функция SQL ``xor_hash``: XOR первых 64 бит хэшей содержимого.
+
+    XOR не зависит от порядка строк, поэтому сводки двух баз совпадают
+    при одинаковом наборе операций в диапазоне.
+    """
+
+    def __init__(self):
+        self.value = 0
+
+    def step(self, content_hash: str):
+        self.value ^= int(content_hash[:16], 16)
+
+    def finalize(self) -> str:
+        # Целые SQLite знаковые, поэтому 64-битное значение возвращается строкой
+        return format(self.value, "016x")
+
+
+class SyncPlan:
+    """Операции одной стороны, которых нет на другой.
+
+    Attributes:
+        ranges (list): Диапазоны (условие, параметры), отсутствующие на другой стороне целиком.
+        hashes (set): Хэши отдельных операций из различающихся дней.
+    """
+
+    def __init__(self):
+        self.ranges = []
+        self.hashes = set()
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    """Открывает базу и регистрирует агрегатную функцию xor_hash."""
+    conn = get_connection(path)
+    conn.create_aggregate("xor_hash", 1, XorHash)
+    return conn
+
+
+def _range_filter(level: str, bucket: int) -> Tuple[str, tuple]:
+    """Возвращает условие SQL для диапазона уровня 'year', 'month' или 'day'."""
+    if level == "year":
+        return "month BETWEEN ? AND ?", (bucket * 12, bucket * 12 + 11)
+    return f"{level} = ?", (bucket,)
+
+
+def _summaries(conn: sqlite3.Connection, group_by: str, condition: str = "1",
+               params: tuple = ()) -> Dict[int, Tuple[int, int]]:
+    """Считает количество и хэш операций по диапазонам.
+
+    Returns:
+        Dict[int, Tuple[int, int]]: Номер диапазона -> (количество, XOR хэшей).
+    """
+    cursor = conn.execute(
+        f'''SELECT {group_by}, COUNT(*), xor_hash(content_hash) FROM expenses
+            WHERE {_SYNCED} AND {condition} GROUP BY {group_by}''',
+        params
+    )
+    return {bucket: (count, int(digest, 16)) for bucket, count, digest in cursor}
+
+
+def _years(months: Dict[int, Tuple[int, int]]) -> Dict[int, Tuple[int, int]]:
+    """Сворачивает сводки месяцев в сводки лет."""
+    years = {}
+    for month, (count, digest) in months.items():
+        total, combined = years.get(month // 12, (0, 0))
+        years[month // 12] = (total + count, combined ^ digest)
+    return years
+
+
+def _day_hashes(conn: sqlite3.Connection, month: int, day: int) -> set:
+    """Возвращает хэши операций одного дня."""
+    cursor = conn.execute(f"SELECT content_hash FROM expenses WHERE {_SYNCED} AND month = ? AND day = ?",
+                          (month, day))
+    return {row[0] for row in cursor}
+
+
+def _compare(ours: Dict, theirs: Dict, level: str, push: SyncPlan, pull: SyncPlan,
+             stats: Dict[str, int]) -> List[int]:
+    """Сравнивает сводки диапазонов одного уровня.
+
+    Диапазоны, которые есть только на одной стороне, сразу попадают в план.
+
+    Returns:
+        List[int]: Различающиеся диапазоны, которые есть на обеих сторонах.
+    """
+    differing = []
+    for bucket in sorted(ours.keys() | theirs.keys()):
+        stats["ranges"] += 1
+        if ours.get(bucket) == theirs.get(bucket):
+            continue
+        stats["differing"] += 1
+        if bucket not in theirs:
+            push.ranges.append(_range_filter(level, bucket))
+        elif bucket not in ours:
+            pull.ranges.append(_range_filter(level, bucket))
+        else:
+            differing.append(bucket)
+    return differing
+
+
+def _diff(local: sqlite3.Connection, remote: sqlite3.Connection, push: SyncPlan, pull: SyncPlan,
+          stats: Dict[str, int]):
+    """Находит операции, которых нет на другой стороне, спускаясь по различающимся диапазонам."""
+    sides = (local, remote)
+    # Один проход по индексу дает сводки месяцев, из которых сворачиваются годы
+    months = [_summaries(conn, "month") for conn in sides]
+    for year in _compare(*map(_years, months), "year", push, pull, stats):
+        in_year = [{month: value for month, value in summary.items() if month // 12 == year}
+                   for summary in months]
+        for month in _compare(*in_year, "month", push, pull, stats):
+            days = [_summaries(conn, "day", "month = ?", (month,)) for conn in sides]
+            for day in _compare(*days, "day", push, pull, stats):
+                ours, theirs = (_day_hashes(conn, month, day) for conn in sides)
+                push.hashes |= ours - theirs
+                pull.hashes |= theirs - ours
+
+
+def _missing_rows(conn: sqlite3.Connection, plan: SyncPlan) -> Iterator[tuple]:
+    """Перебирает строки операций из плана в порядке их добавления."""
+    for condition, params in plan.ranges:
+        cursor = conn.execute(f"SELECT {SYNC_COLUMNS} FROM expenses WHERE {_SYNCED} AND {condition} ORDER BY id",
+                              params)
+        yield from map(tuple, cursor)
+    if plan.hashes:
+        cursor = conn.execute(
+            f'''SELECT {SYNC_COLUMNS} FROM expenses
+                WHERE content_hash IN (SELECT value FROM json_each(?)) ORDER BY id''',
+            (json.dumps(sorted(plan.hashes)),)
+        )
+        yield from map(tuple, cursor)
+
+
+def _copy(source: sqlite3.Connection, target_path: str, plan: SyncPlan, dry_run: bool) -> int:
+    """Копирует операции плана в другую базу пачками по COPY_BATCH.
+
+    Returns:
+        int: Количество добавленных (при dry_run - найденных) операций.
+    """
+    copied = 0
+    rows = _missing_rows(source, plan)
+    while True:
+        batch = list(islice(rows, COPY_BATCH))
+        if not batch:
+            return copied
+        if dry_run:
+            copied += len(batch)
+        else:
+            # Вставка через общий путь обновляет скетчи, статистику и журнал изменений
+            copied += sum(run_write(lambda cursor: _insert_expenses(cursor, batch), path=target_path))
+
+
+def sync_ledgers(remote_path: str, local_path: str = None, dry_run: bool = False) -> Dict[str, int]:
+    """Синхронизирует две базы операций в обе стороны.
+
+    Операции, которых нет в одной из баз, копируются в нее из другой.
+    Отсутствующая удаленная база создается.
+
+    Args:
+        remote_path (str): Файл второй базы.
+        local_path (str, optional): Файл первой базы. По умолчанию DATABASE_FILE.
+        dry_run (bool, optional): Только посчитать различия, ничего не записывая.
+            По умолчанию False.
+
+    Returns:
+        Dict[str, int]: Сравнено диапазонов ('ranges'), из них различающихся
+        ('differing'), получено в локальную базу ('pulled') и отправлено
+        в удаленную ('pushed'). Пустой словарь при ошибке.
+    """
+    local_path = local_path or database.DATABASE_FILE
+    init_database(remote_path)
+
+    stats = {"ranges": 0, "differing": 0, "pulled": 0, "pushed": 0}
+    local = _connect(local_path)
+    remote = _connect(remote_path)
+    try:
+        push, pull = SyncPlan(), SyncPlan()
+        _diff(local, remote, push, pull, stats)
+        stats["pushed"] = _copy(local, remote_path, push, dry_run)
+        stats["pulled"] = _copy(remote, local_path, pull, dry_run)
+        return stats
+    except sqlite3.Error as e:
+        print(f"Ошибка синхронизации: {e}")
+        return {}
+    finally:
+        local.close()
+        remote.close()
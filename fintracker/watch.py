@@ -0,0 +1,156 @@
+"""Модуль для наблюдения за отчетом по категориям в реальном времени.
+
+Агрегаты отчета хранятся в памяти и обновляются только по новым
+операциям (с идентификатором выше последнего обработанного), поэтому
+стоимость обновления зависит от количества новых строк, а не от
+размера всей базы. Изменение, удаление и восстановление существующих
+операций определяются по журналу изменений и вызывают полный пересчет.
+"""
+
+import time
+from datetime import datetime
+from typing import Dict, Callable
+from .database import get_connection
+from .report import print_report
+
+
+class IncrementalCategoryReport:
+    """Отчет по категориям с инкрементальным обновлением.
+
+    Изменения базы определяются через ``PRAGMA data_version``, который
+    меняется при фиксации транзакций другими соединениями. Новые операции
+    добавляются к агрегатам; если журнал изменений содержит изменение,
+    удаление или вставку (отмена удаления) операции с уже учтенным
+    номером, отчет пересчитывается заново через :meth:`reset`.
+
+    Attributes:
+        period (str): Период отчета ('today', 'month' или 'all').
+        account (str): Счет отчета (None - все счета).
+        watermark (int): Идентификатор последней учтенной операции.
+    """
+
+    def __init__(self, period: str = "month", account: str = None):
+        """Инициализирует отчет и открывает соединение с базой данных.
+
+        Args:
+            period (str, optional): Период отчета. По умолчанию 'month'.
+            account (str, optional): Счет отчета. По умолчанию все счета.
+        """
+        self.period = period
+        self.account = account
+        self.watermark = 0
+        self._conn = get_connection()
+        self._data_version = None
+        self._change_seq = None
+        self._prefix = None
+        self._totals = {}
+        self._count = 0
+        self._pending = True
+
+    def _current_prefix(self) -> str:
+        """Возвращает префикс даты для текущего периода."""
+        if self.period == "today":
+            return datetime.now().strftime('%Y-%m-%d')
+        if self.period == "month":
+            return datetime.now().strftime('%Y-%m')
+        return ""
+
+    def reset(self):
+        """Сбрасывает агрегаты, чтобы следующее обновление пересчитало отчет."""
+        self.watermark = 0
+        self._data_version = None
+        self._totals = {}
+        self._count = 0
+        self._pending = True
+
+    def refresh(self) -> bool:
+        """Применяет к агрегатам операции, добавленные после последнего обновления.
+
+        Returns:
+            bool: True если отчет изменился и его нужно перерисовать.
+        """
+        prefix = self._current_prefix()
+        if prefix != self._prefix:
+            # Начался новый день или месяц: агрегаты прошлого периода не нужны
+            self.reset()
+            self._prefix = prefix
+
+        data_version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+        if data_version == self._data_version:
+            return False
+        self._data_version = data_version
+
+        change_seq = self._conn.execute(
+            "SELECT seq FROM sqlite_sequence WHERE name = 'change_log'"
+        ).fetchone()
+        change_seq = change_seq[0] if change_seq else 0
+        if self._change_seq is not None:
+            # Уже учтенные номера изменились: изменение, удаление или
+            # восстановление операции инкрементально не учесть
+            stale = self._conn.execute(
+                'SELECT EXISTS (SELECT 1 FROM change_log WHERE seq > ? AND expense_id <= ?)',
+                (self._change_seq, self.watermark)
+            ).fetchone()[0]
+            if stale:
+                self.reset()
+                self._data_version = data_version
+        self._change_seq = change_seq
+
+        # После сброса отчет выводится даже без новых операций
+        changed, self._pending = self._pending, False
+        rows = self._conn.execute(
+            'SELECT id, category, amount, date, account FROM expenses WHERE id > ? ORDER BY id',
+            (self.watermark,)
+        )
+        for expense_id, category, amount, date, account in rows:
+            self.watermark = expense_id
+            if date.startswith(prefix) and self.account in (None, account):
+                self._totals[category] = self._totals.get(category, 0) + amount
+                self._count += 1
+                changed = True
+
+        return changed
+
+    def report(self) -> Dict:
+        """Возвращает текущее состояние отчета.
+
+        Returns:
+            Dict: Данные отчета в формате get_category_report_from_db.
+        """
+        return {
+            "period": f"{self.period}, счет: {self.account}" if self.account else self.period,
+            "total_expenses": self._count,
+            "total_amount": sum(self._totals.values()),
+            "categories": sorted(self._totals.items(), key=lambda item: item[1], reverse=True),
+            "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+    def close(self):
+        """Закрывает соединение с базой данных."""
+        self._conn.close()
+
+
+def watch_category_report(period: str = "month", interval: float = 2.0, iterations: int = None,
+                          render: Callable[[Dict], None] = print_report, account: str = None):
+    """Периодически обновляет и выводит отчет по категориям.
+
+    Args:
+        period (str, optional): Период отчета. По умолчанию 'month'.
+        interval (float, optional): Интервал опроса в секундах. По умолчанию 2.0.
+        iterations (int, optional): Количество опросов; None - до прерывания.
+        render (Callable, optional): Функция вывода отчета. По умолчанию print_report.
+        account (str, optional): Счет отчета. По умолчанию все счета.
+    """
+    report = IncrementalCategoryReport(period, account)
+    try:
+        done = 0
+        while iterations is None or done < iterations:
+            if report.refresh():
+                render(report.report())
+            done += 1
+            if iterations is None or done < iterations:
+                time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        report.close()
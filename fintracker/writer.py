@@ -0,0 +1,201 @@
+"""Модуль буферизованной записи операций с групповой фиксацией.
+
+Позволяет множеству потоков добавлять операции, не дожидаясь
+отдельного ``commit`` на каждую вставку: операции собираются в пакеты
+по размеру или по времени ожидания и фиксируются одной транзакцией.
+"""
+
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from .database import (
+    get_connection, _insert_expense, _insert_expenses, _is_busy, _backoff, WRITE_RETRIES
+)
+
+# Режим надежности -> PRAGMA synchronous. В режиме WAL только FULL выполняет
+# fsync при каждой фиксации; при NORMAL и OFF последние зафиксированные
+# пакеты могут пропасть при сбое питания или ОС
+DURABILITY_MODES = {
+    "full": "FULL",
+    "normal": "NORMAL",
+    "off": "OFF"
+}
+
+
+class BufferedWriter:
+    """Буферизованный писатель операций с групповой фиксацией.
+
+    Каждый вызов :meth:`submit` возвращает ``Future``, который
+    завершается после фиксации пакета, содержащего операцию: значением
+    True для новой операции, False для пропущенного дубликата, или
+    исключением, если вставка не удалась. Запись гарантированно сохранена
+    на диске только в режиме 'full'; в режимах 'normal' и 'off' ``Future``
+    подтверждает фиксацию, но не сохранность при сбое питания или ОС.
+
+    Attributes:
+        max_batch (int): Максимальное количество операций в пакете.
+        max_latency (float): Максимальное время ожидания пакета в секундах.
+        durability (str): Режим надежности ('full', 'normal' или 'off').
+    """
+
+    def __init__(self, max_batch: int = 500, max_latency: float = 0.05,
+                 durability: str = "full"):
+        """Инициализирует писатель и запускает фоновый поток записи.
+
+        Args:
+            max_batch (int, optional): Размер пакета. По умолчанию 500.
+            max_latency (float, optional): Задержка пакета в секундах.
+                По умолчанию 0.05.
+            durability (str, optional): Режим надежности: 'full' (fsync при
+                каждой фиксации), 'normal' (в режиме WAL без fsync при
+                фиксации) или 'off' (без fsync). По умолчанию 'full'.
+
+        Raises:
+            ValueError: Если указан неизвестный режим надежности.
+        """
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Неизвестный режим надежности: '{durability}'")
+
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.durability = durability
+        self._queue = queue.Queue()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, category: str, amount: float, description: str = "") -> Future:
+        """Ставит операцию в очередь на запись.
+
+        Args:
+            category (str): Категория операции.
+            amount (float): Сумма операции.
+            description (str, optional): Описание операции. По умолчанию "".
+
+        Returns:
+            Future: Завершается True (или False для дубликата) после
+                фиксации операции.
+
+        Raises:
+            RuntimeError: Если писатель уже закрыт.
+            ValueError: Если сумма не является числом.
+        """
+        try:
+            amount = float(amount)
+        except (TypeError, ValueError):
+            raise ValueError(f"Сумма должна быть числом: {amount!r}") from None
+        future = Future()
+        date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Писатель уже закрыт")
+            self._queue.put((future, (category, amount, description, date)))
+        return future
+
+    def close(self):
+        """Фиксирует оставшиеся операции и останавливает поток записи."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+
+    def __enter__(self) -> 'BufferedWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _run(self):
+        """Основной цикл потока записи: сбор пакетов и их фиксация."""
+        conn = get_connection()
+        conn.execute(f"PRAGMA synchronous = {DURABILITY_MODES[self.durability]}")
+        try:
+            stopping = False
+            while not stopping:
+                item = self._queue.get()
+                if item is None:
+                    break
+
+                batch = [item]
+                deadline = time.monotonic() + self.max_latency
+                while len(batch) < self.max_batch:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=timeout)
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stopping = True
+                        break
+                    batch.append(item)
+
+                try:
+                    self._commit_batch(conn, batch)
+                except Exception as e:
+                    # Поток записи не должен останавливаться: иначе Future
+                    # этого и всех следующих пакетов не завершатся никогда
+                    if conn.in_transaction:
+                        conn.rollback()
+                    for future, _ in batch:
+                        if not future.done():
+                            future.set_exception(e)
+        finally:
+            conn.close()
+
+    def _commit_batch(self, conn, batch):
+        """Записывает пакет одной транзакцией и завершает его Future.
+
+        Если база занята другим процессом, пакет повторяется с паузой,
+        а не переходит к построчной записи.
+        """
+        for attempt in range(WRITE_RETRIES + 1):
+            try:
+                cursor = conn.cursor()
+                cursor.execute('BEGIN IMMEDIATE')
+                inserted = _insert_expenses(cursor, [row for _, row in batch])
+                conn.commit()
+                break
+            except Exception as e:
+                conn.rollback()
+                if not isinstance(e, sqlite3.Error) or not _is_busy(e) or attempt == WRITE_RETRIES:
+                    self._commit_batch_by_row(conn, batch)
+                    return
+            _backoff(attempt)
+
+        for (future, _), is_new in zip(batch, inserted):
+            future.set_result(is_new)
+
+    def _commit_batch_by_row(self, conn, batch):
+        """Записывает пакет построчно, чтобы ошибка одной операции не отменяла остальные."""
+        cursor = conn.cursor()
+        written = []
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            for future, row in batch:
+                # Точка сохранения изолирует ошибку одной операции от пакета
+                cursor.execute('SAVEPOINT buffered_insert')
+                try:
+                    is_new = _insert_expense(cursor, *row)
+                except Exception as e:
+                    conn.rollback_to('buffered_insert')
+                    future.set_exception(e)
+                else:
+                    written.append((future, is_new))
+                cursor.execute('RELEASE buffered_insert')
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            for future, _ in written:
+                future.set_exception(e)
+            return
+
+        for future, is_new in written:
+            future.set_result(is_new)
@@ -1,5 +1,5 @@
 import sys
-from fintracker.commands import setup_commands, handle_add, handle_list, handle_report, handle_category
+from fintracker.commands import setup_commands, handle_add, handle_list, handle_report, handle_category, handle_import, handle_migrate_json, handle_edit, handle_delete, handle_undo, handle_maintenance, handle_backup, handle_export, handle_changes, handle_sync, handle_attach, handle_get_attachment
 from fintracker.storage import init_storage
 
 
@@ -27,6 +27,30 @@ def main():
             handle_report(args)
         elif args.command == "category":
             handle_category(args)
+        elif args.command == "import":
+            handle_import(args)
+        elif args.command == "migrate-json":
+            handle_migrate_json(args)
+        elif args.command == "edit":
+            handle_edit(args)
+        elif args.command == "delete":
+            handle_delete(args)
+        elif args.command == "undo":
+            handle_undo(args)
+        elif args.command == "maintenance":
+            handle_maintenance(args)
+        elif args.command == "backup":
+            handle_backup(args)
+        elif args.command == "export":
+            handle_export(args)
+        elif args.command == "changes":
+            handle_changes(args)
+        elif args.command == "sync":
+            handle_sync(args)
+        elif args.command == "attach":
+            handle_attach(args)
+        elif args.command == "get-attachment":
+            handle_get_attachment(args)
         else:
             print("Неизвестная команда")
 
@@ -6,10 +6,11 @@ import unittest
 import os
 import tempfile
 import shutil
+import sqlite3
 from datetime import datetime
 from fintracker.models import Expense, Category
 from fintracker.storage import add_expense, get_expenses, add_category, get_categories, init_storage
-from fintracker.report import generate_category_report, generate_period_report
+from fintracker.report import generate_category_report, generate_period_report, generate_tree_report
 from fintracker.database import get_connection, DATABASE_FILE
 
 
@@ -224,27 +225,22 @@ class TestReport(unittest.TestCase):
         add_category("зарплата", "income")
 
         # Добавляем тестовые операции с конкретными датами
-        from fintracker.database import add_expense_to_db
-
+        self.add_dated_expenses([
+            ("еда", -100, "Обед", "2025-01-15 12:00:00"),
+            ("еда", -150, "Ужин", "2025-01-15 19:00:00"),
+            ("транспорт", -50, "Такси", "2025-01-16 10:00:00"),
+            ("зарплата", 50000, "Зарплата", "2025-01-01 09:00:00"),
+        ])
+
+    def add_dated_expenses(self, rows):
+        """Добавляет операции с конкретными датами."""
         # Используем прямые вызовы к БД для установки конкретных дат
         conn = get_connection()
         try:
             cursor = conn.cursor()
-            cursor.execute(
-                'INSERT INTO expenses (category, amount, description, date) VALUES (?, ?, ?, ?)',
-                ("еда", -100, "Обед", "2025-01-15 12:00:00")
-            )
-            cursor.execute(
-                'INSERT INTO expenses (category, amount, description, date) VALUES (?, ?, ?, ?)',
-                ("еда", -150, "Ужин", "2025-01-15 19:00:00")
-            )
-            cursor.execute(
-                'INSERT INTO expenses (category, amount, description, date) VALUES (?, ?, ?, ?)',
-                ("транспорт", -50, "Такси", "2025-01-16 10:00:00")
-            )
-            cursor.execute(
+            cursor.executemany(
                 'INSERT INTO expenses (category, amount, description, date) VALUES (?, ?, ?, ?)',
-                ("зарплата", 50000, "Зарплата", "2025-01-01 09:00:00")
+                rows
             )
             conn.commit()
         finally:
@@ -458,6 +454,2349 @@ class TestDatabaseIntegration(unittest.TestCase):
             conn.close()
 
 
+class TestDistributionReport(unittest.TestCase):
+    """Тесты квантильных скетчей и отчета о распределении."""
+
+    def setUp(self):
+        """Настройка тестовой БД."""
+        self.test_dir = tempfile.mkdtemp()
+        self.test_db_file = os.path.join(self.test_dir, "test_financial.db")
+
+        import fintracker.database
+        self.original_db_file = fintracker.database.DATABASE_FILE
+        fintracker.database.DATABASE_FILE = self.test_db_file
+
+        init_storage()
+
+    def tearDown(self):
+        """Очистка после тестов."""
+        import fintracker.database
+        fintracker.database.DATABASE_FILE = self.original_db_file
+
+        if os.path.exists(self.test_db_file):
+            os.unlink(self.test_db_file)
+        shutil.rmtree(self.test_dir)
+
+    def test_sketch_quantiles_and_merge(self):
+        """Тест точности скетча и объединения скетчей."""
+        from fintracker.sketch import QuantileSketch
+
+        first, second = QuantileSketch(), QuantileSketch()
+        for value in range(1, 5001):
+            first.add(value)
+        for value in range(5001, 10001):
+            second.add(value)
+
+        merged = QuantileSketch.from_json(first.to_json()).merge(second)
+        self.assertEqual(merged.count, 10000)
+        self.assertAlmostEqual(merged.quantile(0.5), 5000, delta=300)
+        self.assertAlmostEqual(merged.quantile(0.9), 9000, delta=300)
+        self.assertEqual(merged.quantile(1), 10000)
+        self.assertLess(sum(len(level) for level in merged.levels), 1000)
+
+    def test_distribution_report(self):
+        """Тест отчета о распределении по добавленным операциям."""
+        add_category("еда", "expense")
+        for amount in (-100, -200, -300, -400, -1000):
+            add_expense("еда", amount, "Покупка")
+
+        from fintracker.report import generate_distribution_report
+        report = generate_distribution_report("month")
+
+        self.assertEqual(report["total_expenses"], 5)
+        self.assertEqual(report["total_amount"], -2000)
+        category, count, p50, p90, p99 = report["distribution"][0]
+        self.assertEqual((category, count), ("еда", 5))
+        self.assertEqual(p50, 300)
+        self.assertEqual(p99, 1000)
+
+    def test_rebuild_sketches(self):
+        """Тест перестроения скетчей по таблице операций."""
+        from fintracker.database import rebuild_sketches_in_db, get_distribution_report_from_db
+        from fintracker.query import ExpenseQuery
+
+        conn = get_connection()
+        try:
+            conn.execute(
+                'INSERT INTO expenses (category, amount, description, date) VALUES (?, ?, ?, ?)',
+                ("транспорт", -50, "Такси", "2025-01-16 10:00:00")
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+        self.assertEqual(get_distribution_report_from_db("all")["distribution"], [])
+        self.assertTrue(rebuild_sketches_in_db())
+
+        report = get_distribution_report_from_db(ExpenseQuery(start_date="2025-01-01", end_date="2025-12-31"))
+        self.assertEqual(report["distribution"], [("транспорт", 1, 50, 50, 50)])
+
+    def test_distribution_partial_months(self):
+        """Неполные крайние месяцы считаются по операциям, одна граница тоже учитывается."""
+        from fintracker.database import get_distribution_report_from_db
+        from fintracker.query import ExpenseQuery
+        for date, amount in (("2025-01-10", -10), ("2025-01-20", -20), ("2025-02-10", -30),
+                             ("2025-03-01", -40), ("2025-03-10", -50)):
+            add_expense("еда", amount, "Покупка", f"{date} 12:00:00")
+
+        def report(start=None, end=None):
+            return get_distribution_report_from_db(ExpenseQuery(start_date=start, end_date=end))
+
+        partial = report("2025-01-15", "2025-03-05")
+        self.assertEqual(partial["period"], "2025-01-15 - 2025-03-05")
+        self.assertEqual((partial["total_expenses"], partial["total_amount"]), (3, -90))
+        self.assertEqual(report("2025-01-12", "2025-01-25")["total_amount"], -20)
+        self.assertEqual(report("2025-02-15")["total_amount"], -90)
+        self.assertEqual(report(end="2025-01-15")["total_amount"], -10)
+        months = report("2025-02", "2025-03")
+        self.assertEqual(months["period"], "2025-02-01 - 2025-03-31")
+        self.assertEqual(months["total_amount"], -120)
+
+    def test_distribution_by_account_and_filters(self):
+        """Отчет учитывает счет по скетчам и прочие фильтры по операциям."""
+        from fintracker.database import get_distribution_report_from_db, rebuild_sketches_in_db
+        from fintracker.query import ExpenseQuery
+        add_expense("еда", -100, "Обед", "2025-03-01 12:00:00", account="карта")
+        add_expense("еда", -300, "Ужин", "2025-03-02 19:00:00", account="карта")
+        add_expense("еда", -5000, "Банкет", "2025-03-03 19:00:00", account="наличные")
+        add_expense("еда", 700, "Возврат", "2025-03-04 10:00:00", account="наличные")
+
+        def distribution(**filters):
+            return get_distribution_report_from_db(ExpenseQuery(**filters))["distribution"]
+
+        self.assertEqual(distribution(account="карта"), [("еда", 2, 100, 300, 300)])
+        self.assertEqual(distribution(account="наличные", kind="expense"), [("еда", 1, 5000, 5000, 5000)])
+        self.assertEqual(distribution(categories=["транспорт"]), [])
+        report = get_distribution_report_from_db(ExpenseQuery(account="наличные"))
+        self.assertEqual((report["total_expenses"], report["total_amount"]), (2, -4300))
+
+        rebuild_sketches_in_db()
+        self.assertEqual(distribution(account="карта"), [("еда", 2, 100, 300, 300)])
+
+
+class TestBufferedWriter(unittest.TestCase):
+    """Тесты буферизованной записи с групповой фиксацией."""
+
+    def setUp(self):
+        """Настройка тестовой БД."""
+        self.test_dir = tempfile.mkdtemp()
+        self.test_db_file = os.path.join(self.test_dir, "test_financial.db")
+
+        import fintracker.database
+        self.original_db_file = fintracker.database.DATABASE_FILE
+        fintracker.database.DATABASE_FILE = self.test_db_file
+
+        init_storage()
+
+    def tearDown(self):
+        """Очистка после тестов."""
+        import fintracker.database
+        fintracker.database.DATABASE_FILE = self.original_db_file
+
+        if os.path.exists(self.test_db_file):
+            os.unlink(self.test_db_file)
+        shutil.rmtree(self.test_dir)
+
+    def test_concurrent_submit(self):
+        """Тест записи операций из нескольких потоков."""
+        import threading
+        from fintracker.writer import BufferedWriter
+
+        futures = []
+        with BufferedWriter(max_batch=16, max_latency=0.01) as writer:
+            def worker(offset):
+                for i in range(25):
+                    futures.append(writer.submit("еда", -(offset * 100 + i), "Вебхук"))
+
+            threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertTrue(all(future.result(timeout=5) for future in futures))
+        self.assertEqual(len(get_expenses("all")), 100)
+
+        from fintracker.database import get_distribution_report_from_db
+        report = get_distribution_report_from_db("month")
+        self.assertEqual(report["total_expenses"], 100)
+
+    def test_failed_operation_does_not_stop_writer(self):
+        """Ошибка одной операции завершает только ее Future, писатель продолжает работу."""
+        from unittest import mock
+        import fintracker.database
+        from fintracker.writer import BufferedWriter
+
+        original = fintracker.database.compute_content_hash
+
+        def compute_content_hash(date, amount, category, description, *args):
+            if description == "сбой":
+                raise ValueError("некорректная операция")
+            return original(date, amount, category, description, *args)
+
+        with BufferedWriter(max_batch=16, max_latency=0.01) as writer:
+            with self.assertRaises(ValueError):
+                writer.submit("еда", "abc")
+            with mock.patch("fintracker.database.compute_content_hash", compute_content_hash):
+                failed = writer.submit("еда", -1, "сбой")
+                with self.assertRaises(ValueError):
+                    failed.result(timeout=5)
+            self.assertTrue(writer.submit("еда", -2, "после сбоя").result(timeout=5))
+        self.assertEqual([e.description for e in get_expenses("all")], ["после сбоя"])
+
+    def test_invalid_durability_and_closed_writer(self):
+        """Тест неверного режима надежности и записи в закрытый писатель."""
+        from fintracker.writer import BufferedWriter
+
+        with self.assertRaises(ValueError):
+            BufferedWriter(durability="always")
+
+        writer = BufferedWriter(durability="full")
+        writer.close()
+        with self.assertRaises(RuntimeError):
+            writer.submit("еда", -100)
+
+
+class TestDeduplication(unittest.TestCase):
+    """Тесты идемпотентного импорта по хешу содержимого."""
+
+    def setUp(self):
+        """Настройка тестовой БД."""
+        self.test_dir = tempfile.mkdtemp()
+        self.test_db_file = os.path.join(self.test_dir, "test_financial.db")
+
+        import fintracker.database
+        self.original_db_file = fintracker.database.DATABASE_FILE
+        fintracker.database.DATABASE_FILE = self.test_db_file
+
+        init_storage()
+
+    def tearDown(self):
+        """Очистка после тестов."""
+        import fintracker.database
+        fintracker.database.DATABASE_FILE = self.original_db_file
+
+        if os.path.exists(self.test_db_file):
+            os.unlink(self.test_db_file)
+        shutil.rmtree(self.test_dir)
+
+    def write_csv(self, name, rows):
+        """Записывает CSV-выгрузку для импорта."""
+        filename = os.path.join(self.test_dir, name)
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write("date,amount,category,description,external_id\n")
+            for row in rows:
+                f.write(",".join(str(value) for value in row) + "\n")
+        return filename
+
+    def test_reimport_overlapping_exports(self):
+        """Тест повторного импорта пересекающихся выгрузок."""
+        from fintracker.storage import import_expenses
+
+        january = self.write_csv("january.csv", [
+            ("2025-01-15 12:00:00", -100, "еда", "Обед", ""),
+            ("2025-01-31 19:00:00", -150, "еда", "Ужин", ""),
+        ])
+        february = self.write_csv("february.csv", [
+            ("2025-01-31 19:00:00", -150, "Еда", "  ужин ", ""),
+            ("2025-02-01 10:00:00", -50, "транспорт", "Такси", ""),
+        ])
+
+        self.assertEqual(import_expenses(january), {"inserted": 2, "duplicates": 0})
+        self.assertEqual(import_expenses(february), {"inserted": 1, "duplicates": 1})
+        self.assertEqual(import_expenses(january), {"inserted": 0, "duplicates": 2})
+        self.assertEqual(len(get_expenses("all")), 3)
+
+    def test_identical_operations_are_kept(self):
+        """Тест что одинаковые покупки за день при добавлении и в одной выгрузке не теряются."""
+        from fintracker.backends import MemoryBackend
+        from fintracker.storage import import_expenses
+
+        self.assertTrue(add_expense("еда", -100, "Кофе", "2025-01-15 09:00:00"))
+        self.assertTrue(add_expense("еда", -100, "Кофе", "2025-01-15 09:00:00", tags=["работа"]))
+        self.assertEqual(len(get_expenses("all")), 2)
+
+        export = self.write_csv("export.csv", [
+            ("2025-01-15 09:00:00", -100, "еда", "Кофе", ""),
+            ("2025-01-16 09:00:00", -100, "еда", "Кофе", ""),
+            ("2025-01-16 09:00:00", -100, "еда", "Кофе", ""),
+        ])
+        self.assertEqual(import_expenses(export), {"inserted": 2, "duplicates": 1})
+        self.assertEqual(import_expenses(export), {"inserted": 0, "duplicates": 3})
+        self.assertEqual(len(get_expenses("all")), 4)
+
+        memory = MemoryBackend()
+        self.assertTrue(memory.add_expense("еда", -100, "Кофе", "2025-01-15 09:00:00"))
+        self.assertTrue(memory.add_expense("еда", -100, "Кофе", "2025-01-15 09:00:00"))
+        rows = [("еда", -100, "Кофе", "2025-01-16 09:00:00")] * 2
+        self.assertEqual(memory.import_expenses(rows), {"inserted": 2, "duplicates": 0})
+        self.assertEqual(memory.import_expenses(rows), {"inserted": 0, "duplicates": 2})
+
+    def test_upsert_by_external_id(self):
+        """Тест обновления операции по внешнему идентификатору."""
+        from fintracker.storage import import_expenses
+
+        first = self.write_csv("first.csv", [("2025-01-15 12:00:00", -100, "еда", "Обед", "tx-1")])
+        fixed = self.write_csv("fixed.csv", [("2025-01-15 12:00:00", -120, "еда", "Обед", "tx-1")])
+
+        import_expenses(first)
+        self.assertEqual(import_expenses(fixed, "update"), {"inserted": 0, "duplicates": 1})
+
+        expenses = get_expenses("all")
+        self.assertEqual(len(expenses), 1)
+        self.assertEqual(expenses[0].amount, -120)
+
+    def test_upsert_refreshes_aggregates(self):
+        """Обновление по внешнему идентификатору переносит сумму в скетчах и статистике."""
+        from fintracker.storage import import_expenses
+        from fintracker.database import rebuild_sketches_in_db, rebuild_category_stats_in_db
+
+        def aggregates():
+            conn = get_connection()
+            try:
+                sketches = [tuple(row) for row in conn.execute(
+                    'SELECT category, month, total, sketch FROM expense_sketches ORDER BY 1, 2')]
+                stats = [(row[0], row[1], round(row[2], 6), round(row[3], 6)) for row in conn.execute(
+                    'SELECT category, count, mean, m2 FROM category_stats WHERE count > 0 ORDER BY 1')]
+                return sketches, stats
+            finally:
+                conn.close()
+
+        first = self.write_csv("first.csv", [("2025-01-15 12:00:00", -100, "еда", "Обед", "tx-1"),
+                                             ("2025-01-16 12:00:00", -300, "еда", "Ужин", "tx-2")])
+        fixed = self.write_csv("fixed.csv", [("2025-02-15 12:00:00", -900, "транспорт", "Обед", "tx-1")])
+        import_expenses(first)
+        import_expenses(fixed, "update")
+
+        updated = aggregates()
+        self.assertEqual([row[:3] for row in updated[0]],
+                         [("еда", "2025-01", -300.0), ("транспорт", "2025-02", -900.0)])
+        rebuild_sketches_in_db()
+        rebuild_category_stats_in_db()
+        self.assertEqual(aggregates(), updated)
+
+    def test_backfill_keeps_legacy_duplicates(self):
+        """Тест заполнения хешей в базе со старыми дубликатами."""
+        from fintracker.database import init_database
+
+        conn = get_connection()
+        try:
+            conn.execute('DROP INDEX idx_expenses_content_hash')
+            conn.execute('DROP INDEX idx_expenses_sync')
+            conn.execute('ALTER TABLE expenses DROP COLUMN content_hash')
+            for _ in range(2):
+                conn.execute(
+                    'INSERT INTO expenses (category, amount, description, date) VALUES (?, ?, ?, ?)',
+                    ("еда", -100, "Обед", "2025-01-15 12:00:00")
+                )
+            conn.commit()
+        finally:
+            conn.close()
+
+        init_database()
+
+        conn = get_connection()
+        try:
+            hashes = [row[0] for row in conn.execute('SELECT content_hash FROM expenses ORDER BY id')]
+        finally:
+            conn.close()
+        self.assertIsNotNone(hashes[0])
+        self.assertIsNone(hashes[1])
+
+
+class TestWatchReport(unittest.TestCase):
+    """Тесты инкрементального отчета для режима --watch."""
+
+    def setUp(self):
+        """Настройка тестовой БД."""
+        self.test_dir = tempfile.mkdtemp()
+        self.test_db_file = os.path.join(self.test_dir, "test_financial.db")
+
+        import fintracker.database
+        self.original_db_file = fintracker.database.DATABASE_FILE
+        fintracker.database.DATABASE_FILE = self.test_db_file
+
+        init_storage()
+
+    def tearDown(self):
+        """Очистка после тестов."""
+        import fintracker.database
+        fintracker.database.DATABASE_FILE = self.original_db_file
+
+        if os.path.exists(self.test_db_file):
+            os.unlink(self.test_db_file)
+        shutil.rmtree(self.test_dir)
+
+    def test_incremental_refresh(self):
+        """Тест применения только новых операций."""
+        from fintracker.watch import IncrementalCategoryReport
+
+        add_expense("еда", -100, "Обед")
+        report = IncrementalCategoryReport("month")
+        try:
+            self.assertTrue(report.refresh())
+            self.assertFalse(report.refresh())
+            first_watermark = report.watermark
+
+            add_expense("еда", -50, "Кофе")
+            add_expense("транспорт", -30, "Метро")
+            self.assertTrue(report.refresh())
+            self.assertGreater(report.watermark, first_watermark)
+
+            data = report.report()
+            self.assertEqual(data["total_expenses"], 3)
+            self.assertEqual(data["total_amount"], -180)
+            self.assertEqual(data["categories"], generate_category_report("month")["categories"])
+        finally:
+            report.close()
+
+    def test_refresh_after_edit_delete_and_undo(self):
+        """Тест пересчета отчета после изменения, удаления и отмены."""
+        from fintracker.edit import edit_expenses, delete_expenses, undo_last
+        from fintracker.storage import ExpenseQuery
+        from fintracker.watch import IncrementalCategoryReport
+
+        add_expense("еда", -100, "Обед")
+        add_expense("транспорт", -30, "Метро")
+        report = IncrementalCategoryReport("month")
+        try:
+            report.refresh()
+            edit_expenses(ExpenseQuery(categories=["еда"]), {"amount": -150})
+            self.assertTrue(report.refresh())
+            self.assertEqual(report.report()["categories"], generate_category_report("month")["categories"])
+
+            delete_expenses(ExpenseQuery(categories=["транспорт"]))
+            self.assertTrue(report.refresh())
+            self.assertEqual(report.report()["total_expenses"], 1)
+
+            undo_last()
+            self.assertTrue(report.refresh())
+            data = report.report()
+            self.assertEqual(data["total_expenses"], 2)
+            self.assertEqual(data["total_amount"], -180)
+            self.assertFalse(report.refresh())
+        finally:
+            report.close()
+
+    def test_watch_renders_once_without_changes(self):
+        """Тест что без новых операций отчет не перерисовывается."""
+        from fintracker.watch import watch_category_report
+
+        rendered = []
+        watch_category_report("month", interval=0, iterations=3, render=rendered.append)
+        self.assertEqual(len(rendered), 1)
+        self.assertEqual(rendered[0]["total_expenses"], 0)
+
+
+class TestMaintenance(unittest.TestCase):
+    """Тесты обслуживания базы данных."""
+
+    def setUp(self):
+        """Настройка тестовой БД."""
+        self.test_dir = tempfile.mkdtemp()
+        self.test_db_file = os.path.join(self.test_dir, "test_financial.db")
+
+        import fintracker.database
+        self.original_db_file = fintracker.database.DATABASE_FILE
+        fintracker.database.DATABASE_FILE = self.test_db_file
+
+        init_storage()
+
+    def tearDown(self):
+        """Очистка после тестов."""
+        import fintracker.database
+        fintracker.database.DATABASE_FILE = self.original_db_file
+
+        if os.path.exists(self.test_db_file):
+            os.unlink(self.test_db_file)
+        shutil.rmtree(self.test_dir)
+
+    def test_new_database_uses_incremental_vacuum(self):
+        """Тест что новая база создается с auto_vacuum=INCREMENTAL."""
+        from fintracker.maintenance import database_stats, incremental_vacuum
+
+        conn = get_connection()
+        try:
+            conn.executemany(
+                'INSERT INTO expenses (category, amount, description, date) VALUES (?, ?, ?, ?)',
+                [("еда", -i, "x" * 200, "2025-01-15 12:00:00") for i in range(500)]
+            )
+            conn.commit()
+            conn.execute('DELETE FROM expenses')
+            conn.commit()
+        finally:
+            conn.close()
+
+        stats = database_stats()
+        self.assertEqual(stats["auto_vacuum"], "incremental")
+        self.assertGreater(stats["freelist_count"], 0)
+
+        self.assertEqual(incremental_vacuum(), stats["freelist_count"])
+        self.assertEqual(database_stats()["freelist_count"], 0)
+
+    def test_run_maintenance(self):
+        """Тест полного цикла обслуживания с замером шагов."""
+        from fintracker.maintenance import run_maintenance
+
+        add_expense("еда", -100, "Обед")
+        results = run_maintenance()
+
+        steps = {item["step"]: item for item in results}
+        self.assertNotIn("compact_changes", steps)
+        self.assertEqual(steps["integrity_check"]["result"], ["ok"])
+        self.assertIn("idx_expenses_content_hash", steps["stats_after"]["result"]["indexes"])
+        self.assertTrue(all(item["seconds"] >= 0 for item in results))
+
+        conn = get_connection()
+        try:
+            stat_rows = conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'sqlite_stat1'")
+            self.assertEqual(stat_rows.fetchone()[0], 1)
+        finally:
+            conn.close()
+
+    def test_compact_changes_is_opt_in(self):
+        """Тест что обслуживание сжимает журнал изменений только по запросу."""
+        from fintracker.edit import edit_expenses
+        from fintracker.maintenance import run_maintenance
+        from fintracker.storage import ExpenseQuery
+
+        add_expense("еда", -100, "Обед")
+        edit_expenses(ExpenseQuery(categories=["еда"]), {"amount": -120})
+
+        def changes():
+            conn = get_connection()
+            try:
+                return conn.execute('SELECT COUNT(*) FROM change_log').fetchone()[0]
+            finally:
+                conn.close()
+
+        run_maintenance()
+        self.assertEqual(changes(), 2)
+        steps = {item["step"]: item for item in run_maintenance(compact_days=30)}
+        self.assertIn("замещенных 1", steps["compact_changes"]["result"])
+        self.assertEqual(changes(), 1)
+
+
+class MemoryBackendMixin:
+    """Запускает тесты хранилища на движке в памяти вместо файла SQLite."""
+
+    def setUp(self):
+        """Подключение движка в памяти."""
+        from fintracker import storage
+        from fintracker.backends import MemoryBackend
+
+        self.test_dir = tempfile.mkdtemp()
+        self.original_backend = storage.get_backend()
+        storage.set_backend(MemoryBackend())
+        self.setUpData()
+
+    def setUpData(self):
+        """Подготовка тестовых данных."""
+
+    def tearDown(self):
+        """Восстановление движка SQLite."""
+        from fintracker import storage
+
+        storage.set_backend(self.original_backend)
+        shutil.rmtree(self.test_dir)
+
+
+class TestStorageMemoryBackend(MemoryBackendMixin, TestStorage):
+    """Тесты хранения данных на движке в памяти."""
+
+
+class TestEdgeCasesMemoryBackend(MemoryBackendMixin, TestEdgeCases):
+    """Тесты граничных случаев на движке в памяти."""
+
+
+class TestReportMemoryBackend(MemoryBackendMixin, TestReport):
+    """Тесты отчетов на движке в памяти."""
+
+    def setUpData(self):
+        """Добавление тестовых категорий и операций."""
+        add_category("еда", "expense")
+        add_category("транспорт", "expense")
+        add_category("зарплата", "income")
+        self.add_dated_expenses([
+            ("еда", -100, "Обед", "2025-01-15 12:00:00"),
+            ("еда", -150, "Ужин", "2025-01-15 19:00:00"),
+            ("транспорт", -50, "Такси", "2025-01-16 10:00:00"),
+            ("зарплата", 50000, "Зарплата", "2025-01-01 09:00:00"),
+        ])
+
+    def add_dated_expenses(self, rows):
+        """Добавляет операции с конкретными датами через storage."""
+        for category, amount, description, date in rows:
+            add_expense(category, amount, description, date)
+
+
+class TestMemoryBackend(unittest.TestCase):
+    """Тесты индексов движка хранения в памяти."""
+
+    def test_date_index_and_upsert(self):
+        """Тест выборки по диапазону дат и обновления по внешнему идентификатору."""
+        from fintracker.backends import MemoryBackend
+
+        backend = MemoryBackend()
+        result = backend.import_expenses([
+            ("еда", -100, "Обед", "2025-01-15 12:00:00", "tx-1"),
+            ("еда", -150, "Ужин", "2025-01-14 19:00:00", "tx-2"),
+            ("такси", -50, "", "2025-02-01 10:00:00", "tx-3"),
+        ])
+        self.assertEqual(result, {"inserted": 3, "duplicates": 0})
+
+        backend.import_expenses([("еда", -120, "Обед", "2025-01-15 12:00:00", "tx-1")], "update")
+
+        report = backend.period_report("2025-01-01", "2025-01-31")
+        self.assertEqual(report["daily_totals"], {"2025-01-14": -150, "2025-01-15": -120})
+        self.assertEqual(backend.category_report("all")["categories"], [("такси", -50), ("еда", -270)])
+        self.assertEqual([e["date"][:10] for e in backend.get_expenses("all")],
+                         ["2025-02-01", "2025-01-15", "2025-01-14"])
+
+    def test_distribution_report_uses_backend(self):
+        """Отчет о распределении строится через текущий движок, а не по файлу базы."""
+        from unittest import mock
+        from fintracker import storage
+        from fintracker.backends import MemoryBackend
+        from fintracker.query import ExpenseQuery
+        from fintracker.report import generate_distribution_report
+
+        original = storage.get_backend()
+        storage.set_backend(MemoryBackend())
+        try:
+            for amount in (-100, -200, -300):
+                add_expense("еда", amount, "Покупка", "2025-01-15 12:00:00", account="карта")
+            add_expense("еда", -900, "Покупка", "2025-01-16 12:00:00")
+            with mock.patch("fintracker.database.get_connection", side_effect=AssertionError):
+                report = generate_distribution_report(ExpenseQuery(account="карта"))
+        finally:
+            storage.set_backend(original)
+        self.assertEqual(report["distribution"], [("еда", 3, 200, 300, 300)])
+        self.assertEqual(report["total_amount"], -600)
+
+    def test_incomplete_backend_rejected(self):
+        """Движок без всех методов интерфейса нельзя создать."""
+        from fintracker.backends import StorageBackend, MemoryBackend
+
+        class PartialBackend(StorageBackend):
+            def init(self):
+                pass
+
+        with self.assertRaises(TypeError):
+            PartialBackend()
+        self.assertIsInstance(MemoryBackend(), StorageBackend)
+
+
+class TestBackup(unittest.TestCase):
+    """Тесты онлайн-копирования и снимков базы данных."""
+
+    def setUp(self):
+        """Настройка тестовой БД."""
+        self.test_dir = tempfile.mkdtemp()
+        self.test_db_file = os.path.join(self.test_dir, "test_financial.db")
+
+        import fintracker.database
+        self.original_db_file = fintracker.database.DATABASE_FILE
+        fintracker.database.DATABASE_FILE = self.test_db_file
+
+        init_storage()
+
+    def tearDown(self):
+        """Очистка после тестов."""
+        import fintracker.database
+        fintracker.database.DATABASE_FILE = self.original_db_file
+
+        shutil.rmtree(self.test_dir)
+
+    def test_backup_and_restore(self):
+        """Тест создания копии по шагам и восстановления из нее."""
+        from fintracker.database import snapshot, restore_database
+
+        add_expense("еда", -100, "Обед")
+        backup_file = os.path.join(self.test_dir, "backup.db")
+        steps = []
+        snapshot(backup_file, pages=1, progress=lambda status, remaining, total: steps.append(remaining))
+        self.assertGreater(len(steps), 1)
+
+        add_expense("еда", -200, "Ужин")
+        self.assertEqual(len(get_expenses("all")), 2)
+
+        self.assertTrue(restore_database(backup_file))
+        expenses = get_expenses("all")
+        self.assertEqual([e.description for e in expenses], ["Обед"])
+
+    def test_restore_resets_tag_index(self):
+        """Тест что после восстановления фильтр по меткам не читает устаревший индекс."""
+        from fintracker.database import snapshot, restore_database
+        from fintracker.query import ExpenseQuery
+
+        add_expense("еда", -100, "Обед")
+        backup_file = os.path.join(self.test_dir, "backup.db")
+        snapshot(backup_file)
+
+        add_expense("еда", -200, "Ужин", tags=["дом"])
+        self.assertEqual([e.description for e in get_expenses(ExpenseQuery(tags=["дом"]))], ["Ужин"])
+
+        # После восстановления счетчик меток снова доходит до закэшированного значения
+        self.assertTrue(restore_database(backup_file))
+        add_expense("транспорт", -50, "Метро", tags=["работа"])
+        self.assertEqual(get_expenses(ExpenseQuery(tags=["дом"])), [])
+        self.assertEqual([e.description for e in get_expenses(ExpenseQuery(tags=["работа"]))], ["Метро"])
+
+    def test_read_snapshot(self):
+        """Тест отчетов по снимку в памяти, не видящему новые записи."""
+        from fintracker.database import read_snapshot
+        import sqlite3
+
+        add_expense("еда", -100, "Обед")
+        with read_snapshot() as conn:
+            # Запись в рабочую базу не блокируется снимком
+            writer = sqlite3.connect(self.test_db_file)
+            writer.execute(
+                'INSERT INTO expenses (category, amount, description, date) VALUES (?, ?, ?, ?)',
+                ("еда", -200, "Ужин", "2025-01-15 19:00:00")
+            )
+            writer.commit()
+            writer.close()
+
+            self.assertEqual(generate_category_report("all")["total_expenses"], 1)
+            with self.assertRaises(sqlite3.OperationalError):
+                conn.execute('DELETE FROM expenses')
+
+        self.assertEqual(generate_category_report("all")["total_expenses"], 2)
+
+
+class TestIntegerDates(unittest.TestCase):
+    """Тесты целочисленных колонок дат и группировки по ним."""
+
+    def setUp(self):
+        """Настройка тестовой БД."""
+        self.test_dir = tempfile.mkdtemp()
+        self.test_db_file = os.path.join(self.test_dir, "test_financial.db")
+
+        import fintracker.database
+        self.original_db_file = fintracker.database.DATABASE_FILE
+        fintracker.database.DATABASE_FILE = self.test_db_file
+
+        init_storage()
+
+    def tearDown(self):
+        """Очистка после тестов."""
+        import fintracker.database
+        fintracker.database.DATABASE_FILE = self.original_db_file
+
+        shutil.rmtree(self.test_dir)
+
+    def test_model_conversions(self):
+        """Тест преобразования дат на границе модели."""
+        from datetime import timezone, timedelta
+        from fintracker.models import day_number, day_to_date, month_number, month_to_str
+
+        self.assertEqual(day_number("1970-01-02 00:00:00"), 1)
+        self.assertEqual(day_to_date(day_number("2025-01-15 12:00:00")), "2025-01-15")
+        self.assertEqual(month_to_str(month_number("2025-12-31 23:59:59")), "2025-12")
+
+        aware = datetime(2025, 1, 15, 12, 0, tzinfo=timezone(timedelta(hours=3)))
+        expense = Expense("еда", -100, "Обед", aware)
+        self.assertEqual(expense.date, aware.astimezone().strftime('%Y-%m-%d %H:%M:%S'))
+        self.assertEqual(expense.day, day_number(aware.astimezone().replace(tzinfo=None)))
+
+    def test_columns_match_models_and_use_index(self):
+        """Тест что колонки day и month совпадают с моделью и отчеты используют индекс."""
+        from fintracker.models import day_number, month_number
+
+        add_expense("еда", -100, "Обед", "2025-03-09 23:30:00")
+        conn = get_connection()
+        try:
+            row = conn.execute('SELECT day, month FROM expenses').fetchone()
+            self.assertEqual(tuple(row), (day_number("2025-03-09"), month_number("2025-03-09")))
+
+            plan = " ".join(row[3] for row in conn.execute(
+                'EXPLAIN QUERY PLAN SELECT day, SUM(amount) FROM expenses WHERE day BETWEEN 1 AND 2 GROUP BY day'
+            ))
+            self.assertIn("idx_expenses_day", plan)
+        finally:
+            conn.close()
+
+    def test_weekly_and_monthly_buckets(self):
+        """Тест группировки отчета за период по неделям и месяцам."""
+        for date in ("2025-01-05 10:00:00", "2025-01-06 10:00:00", "2025-01-12 10:00:00", "2025-02-03 10:00:00"):
+            add_expense("еда", -10, f"Покупка {date}", date)
+
+        weekly = generate_period_report("2025-01-01", "2025-02-28", bucket="week")
+        self.assertEqual(weekly["daily_totals"], {"2024-12-30": -10, "2025-01-06": -20, "2025-02-03": -10})
+
+        monthly = generate_period_report("2025-01-01", "2025-02-28", bucket="month")
+        self.assertEqual(monthly["daily_totals"], {"2025-01": -30, "2025-02": -10})
+
+
+class TestRender(unittest.TestCase):
+    """Тесты буферизованного вывода списков операций."""
+
+    def setUp(self):
+        """Подготовка операций для вывода."""
+        self.expenses = [
+            Expense("еда", -100, "Обед", "2025-01-15 12:00:00"),
+            Expense("зарплата", 5000, "Аванс\tянварь", "2025-01-10 09:00:00"),
+        ]
+
+    def test_formats(self):
+        """Тест вывода в форматах table, tsv и json."""
+        import io
+        import json
+        from fintracker.render import render_expenses
+
+        out = io.StringIO()
+        self.assertEqual(render_expenses(self.expenses, "table", out, title="Список"), 2)
+        self.assertIn("1. 2025-01-15 12:00:00 | еда             | -   100.00 руб. | Обед", out.getvalue())
+        self.assertIn("Итого: +4900.00 руб.", out.getvalue())
+
+        out = io.StringIO()
+        render_expenses(self.expenses, "tsv", out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], "date\tcategory\tamount\tdescription")
+        self.assertEqual(lines[2], "2025-01-10 09:00:00\tзарплата\t5000\tАванс\\tянварь")
+
+        out = io.StringIO()
+        render_expenses(self.expenses, "json", out)
+        self.assertEqual([item["amount"] for item in json.loads(out.getvalue())], [-100, 5000])
+
+        out = io.StringIO()
+        self.assertEqual(render_expenses([], "table", out), 0)
+        self.assertEqual(out.getvalue(), "")
+
+    def test_stops_when_output_closed(self):
+        """Тест что при закрытом выводе операции перестают запрашиваться."""
+        from fintracker.render import render_expenses, SAMPLE_ROWS
+
+        class ClosedStream:
+            def write(self, text):
+                raise BrokenPipeError()
+
+            def flush(self):
+                pass
+
+        consumed = []
+
+        def expenses():
+            for i in range(SAMPLE_ROWS * 100):
+                consumed.append(i)
+                yield Expense("еда", -i, f"Операция {i}", "2025-01-15 12:00:00")
+
+        render_expenses(expenses(), "table", ClosedStream())
+        self.assertLess(len(consumed), SAMPLE_ROWS * 100)
+
+
+class TestColumnarExport(unittest.TestCase):
+    """Тесты колоночного экспорта операций."""
+
+    def setUp(self):
+        """Настройка тестовой БД."""
+        self.test_dir = tempfile.mkdtemp()
+        self.test_db_file = os.path.join(self.test_dir, "test_financial.db")
+
+        import fintracker.database
+        self.original_db_file = fintracker.database.DATABASE_FILE
+        fintracker.database.DATABASE_FILE = self.test_db_file
+
+        init_storage()
+
+    def tearDown(self):
+        """Очистка после тестов."""
+        import fintracker.database
+        fintracker.database.DATABASE_FILE = self.original_db_file
+
+        shutil.rmtree(self.test_dir)
+
+    def test_roundtrip(self):
+        """Тест экспорта и загрузки операций через отображение в память."""
+        from fintracker.columnar import export_columnar, load_columnar
+
+        add_expense("еда", -100, "Обед", "2025-01-15 12:00:00")
+        add_expense("зарплата", 5000, "", "2025-01-10 09:00:00")
+        add_expense("еда", -50.5, "Кофе ☕", "2025-01-16 08:00:00")
+
+        export_dir = os.path.join(self.test_dir, "export")
+        self.assertEqual(export_columnar(export_dir), 3)
+
+        with load_columnar(export_dir) as ledger:
+            self.assertEqual(len(ledger), 3)
+            self.assertEqual(ledger.categories, ["еда", "зарплата"])
+            self.assertEqual(list(ledger.amount), [-50.5, -100.0, 5000.0])
+            self.assertEqual(list(ledger.category), [0, 0, 1])
+            self.assertEqual(ledger.description(0), "Кофе ☕")
+            self.assertEqual(ledger.expense(1).to_dict(), {
+                "category": "еда", "amount": -100.0, "description": "Обед", "date": "2025-01-15 12:00:00"
+            })
+            self.assertEqual(ledger.category_totals(), {"еда": -150.5, "зарплата": 5000.0})
+
+    def test_npy_files_and_empty_export(self):
+        """Тест формата файлов .npy и экспорта пустого периода."""
+        from fintracker.columnar import export_columnar, load_columnar
+
+        export_dir = os.path.join(self.test_dir, "empty")
+        self.assertEqual(export_columnar(export_dir, "today"), 0)
+
+        with open(os.path.join(export_dir, "amount.npy"), "rb") as f:
+            header = f.read(128)
+        self.assertTrue(header.startswith(b"\x93NUMPY\x01\x00"))
+        self.assertIn(b"'descr': '<f8'", header)
+        self.assertIn(b"'shape': (0,)", header)
+
+        with load_columnar(export_dir) as ledger:
+            self.assertEqual(len(ledger), 0)
+            self.assertEqual(list(ledger.ts), [])
+
+
+class TestExpenseQuery(unittest.TestCase):
+    """Тесты запросов операций с фильтрами."""
+
+    def setUp(self):
+        """Настройка тестовой БД."""
+        self.test_dir = tempfile.mkdtemp()
+        self.test_db_file = os.path.join(self.test_dir, "test_financial.db")
+
+        import fintracker.database
+        self.original_db_file = fintracker.database.DATABASE_FILE
+        fintracker.database.DATABASE_FILE = self.test_db_file
+
+        init_storage()
+        add_expense("еда", -100, "Обед в Кафе", "2025-01-15 12:00:00")
+        add_expense("еда", -700, "Продукты", "2025-01-20 18:00:00")
+        add_expense("транспорт", -50, "Метро", "2025-01-21 08:00:00")
+        add_expense("зарплата", 5000, "Аванс", "2025-02-01 09:00:00")
+
+    def tearDown(self):
+        """Очистка после тестов."""
+        import fintracker.database
+        fintracker.database.DATABASE_FILE = self.original_db_file
+
+        shutil.rmtree(self.test_dir)
+
+    def check_backends(self, query, expected):
+        """Проверяет, что SQLite и движок в памяти возвращают одни и те же операции."""
+        from fintracker.backends import MemoryBackend
+        from fintracker.storage import ExpenseQuery
+
+        self.assertIsInstance(query, ExpenseQuery)
+        self.assertEqual([expense.description for expense in get_expenses(query)], expected)
+
+        memory = MemoryBackend()
+        memory.import_expenses([(e.category, e.amount, e.description, e.date) for e in get_expenses("all")])
+        self.assertEqual([expense["description"] for expense in memory.get_expenses(query)], expected)
+
+    def test_filters(self):
+        """Тест фильтров по датам, категориям, суммам, типу и тексту."""
+        from fintracker.storage import ExpenseQuery
+
+        self.check_backends(ExpenseQuery(start_date="2025-01-16", end_date="2025-01-31"), ["Метро", "Продукты"])
+        self.check_backends(ExpenseQuery(categories=["транспорт", "зарплата"]), ["Аванс", "Метро"])
+        self.check_backends(ExpenseQuery(min_amount=60, max_amount=1000), ["Продукты", "Обед в Кафе"])
+        self.check_backends(ExpenseQuery(kind="expense", min_amount=500), ["Продукты"])
+        self.check_backends(ExpenseQuery(kind="income"), ["Аванс"])
+        self.check_backends(ExpenseQuery(text="кафе"), ["Обед в Кафе"])
+
+    def test_reports_with_query(self):
+        """Тест отчетов по категориям и за период с фильтрами."""
+        from fintracker.storage import ExpenseQuery
+
+        report = generate_category_report(ExpenseQuery(kind="expense", start_date="2025-01-01"))
+        self.assertEqual(report["total_expenses"], 3)
+        self.assertEqual(dict(report["categories"]), {"еда": -800, "транспорт": -50})
+        self.assertEqual(report["period"], "2025-01-01 - ..., расходы")
+
+        report = generate_period_report("2025-01-01", "2025-01-31", query=ExpenseQuery(categories=["еда"]))
+        self.assertEqual(report["daily_totals"], {"2025-01-15": -100, "2025-01-20": -700})
+
+    def test_statement_cache_and_index(self):
+        """Тест что текст SQL кэшируется по набору фильтров и использует индекс дат."""
+        from fintracker.query import ExpenseQuery, _compile_sql
+
+        first_sql, first_params = ExpenseQuery(start_date="2025-01-01", categories=["еда"]).compile()
+        second_sql, second_params = ExpenseQuery(start_date="2024-06-01", categories=["транспорт"]).compile()
+        self.assertIs(first_sql, second_sql)
+        self.assertNotEqual(first_params, second_params)
+        self.assertGreater(_compile_sql.cache_info().hits, 0)
+
+        conn = get_connection()
+        try:
+            plan = " ".join(row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {first_sql}", first_params))
+            self.assertIn("SEARCH expenses USING INDEX idx_expenses_ts", plan)
+        finally:
+            conn.close()
+
+
+class TestTimeseriesPivot(unittest.TestCase):
+    """Тесты временных рядов и сводных таблиц."""
+
+    def setUp(self):
+        """Настройка тестовой БД."""
+        self.test_dir = tempfile.mkdtemp()
+        self.test_db_file = os.path.join(self.test_dir, "test_financial.db")
+
+        import fintracker.database
+        self.original_db_file = fintracker.database.DATABASE_FILE
+        fintracker.database.DATABASE_FILE = self.test_db_file
+
+        init_storage()
+        self.rows = [
+            ("еда", -100, "Обед", "2024-12-31 12:00:00"),
+            ("еда", -200, "Ужин", "2025-01-15 19:00:00"),
+            ("транспорт", -50, "Метро", "2025-01-20 08:00:00"),
+            ("зарплата", 1000, "Аванс", "2025-02-01 09:00:00"),
+        ]
+        for row in self.rows:
+            add_expense(*row)
+
+    def tearDown(self):
+        """Очистка после тестов."""
+        import fintracker.database
+        fintracker.database.DATABASE_FILE = self.original_db_file
+
+        shutil.rmtree(self.test_dir)
+
+    def test_timeseries_buckets(self):
+        """Тест временного ряда по месяцам и годам в обоих движках."""
+        from fintracker.backends import MemoryBackend
+        from fintracker.report import generate_timeseries_report
+
+        memory = MemoryBackend()
+        memory.import_expenses(self.rows)
+
+        monthly = generate_timeseries_report("all", "month")
+        self.assertEqual(monthly["timeseries"], [
+            ("2024-12", 1, 0, -100, -100), ("2025-01", 2, 0, -250, -250), ("2025-02", 1, 1000, 0, 1000)
+        ])
+        self.assertEqual(memory.timeseries_report("all", "month")["timeseries"], monthly["timeseries"])
+
+        yearly = generate_timeseries_report("all", "year")
+        self.assertEqual([row[0] for row in yearly["timeseries"]], ["2024", "2025"])
+        self.assertEqual(yearly["total_expenses"], 4)
+        self.assertEqual(memory.timeseries_report("all", "year")["timeseries"], yearly["timeseries"])
+
+    def test_pivot_and_csv(self):
+        """Тест сводной таблицы категория x месяц и ее сохранения в CSV."""
+        import csv
+        from fintracker.backends import MemoryBackend
+        from fintracker.report import generate_pivot_report, format_report
+
+        output = os.path.join(self.test_dir, "pivot.csv")
+        report = generate_pivot_report("all", "month", output)
+        self.assertEqual(report["pivot"]["columns"], ["2024-12", "2025-01", "2025-02"])
+        self.assertEqual(report["pivot"]["rows"], [
+            ("еда", [-100, -200, 0], -300), ("зарплата", [0, 0, 1000], 1000), ("транспорт", [0, -50, 0], -50)
+        ])
+        self.assertEqual(report["total_expenses"], 4)
+        self.assertIn("Сводная таблица", format_report(report))
+
+        memory = MemoryBackend()
+        memory.import_expenses(self.rows)
+        self.assertEqual(memory.pivot_report("all", "month")["pivot"], report["pivot"])
+
+        with open(output, encoding="utf-8") as f:
+            rows = list(csv.reader(f))
+        self.assertIn(["Категория", "2024-12", "2025-01", "2025-02", "Итого"], rows)
+        self.assertIn(["еда", "-100.00", "-200.00", "0.00", "-300.00"], rows)
+
+
+class TestAnomalies(unittest.TestCase):
+    """Тесты поиска необычных операций при добавлении."""
+
+    def setUp(self):
+        """Настройка тестовой БД."""
+        self.test_dir = tempfile.mkdtemp()
+        self.test_db_file = os.path.join(self.test_dir, "test_financial.db")
+
+        import fintracker.database
+        self.original_db_file = fintracker.database.DATABASE_FILE
+        fintracker.database.DATABASE_FILE = self.test_db_file
+
+        init_storage()
+        self.rows = [("еда", -amount, f"Продукты {i}", f"2025-01-{i + 1:02d} 18:00:00")
+                     for i, amount in enumerate([100, 120, 90, 110, 105, 95])]
+        self.rows.append(("еда", -1000, "Банкет", "2025-01-20 20:00:00"))
+        self.rows.append(("еда", -115, "Продукты 7", "2025-01-21 18:00:00"))
+
+    def tearDown(self):
+        """Очистка после тестов."""
+        import fintracker.database
+        fintracker.database.DATABASE_FILE = self.original_db_file
+
+        shutil.rmtree(self.test_dir)
+
+    def test_running_stats(self):
+        """Тест что статистика Уэлфорда совпадает с прямым расчетом."""
+        import statistics
+        from fintracker.stats import RunningStats
+
+        values = [100, 120, 90, 110, 105, 95]
+        stats = RunningStats()
+        for value in values:
+            stats.add(value)
+        self.assertAlmostEqual(stats.mean, statistics.mean(values))
+        self.assertAlmostEqual(stats.stddev, statistics.stdev(values))
+        self.assertIsNone(RunningStats().zscore(100))
+
+    def test_flag_on_insert_and_report(self):
+        """Тест отметки необычной суммы при добавлении и отчета по отметкам."""
+        import io
+        from contextlib import redirect_stdout
+        from fintracker.report import generate_anomaly_report
+
+        for row in self.rows[:-2]:
+            add_expense(*row)
+        output = io.StringIO()
+        with redirect_stdout(output):
+            add_expense(*self.rows[-2])
+            add_expense(*self.rows[-1])
+        self.assertEqual(output.getvalue().count("необычная сумма"), 1)
+
+        report = generate_anomaly_report("all")
+        self.assertEqual([row[3] for row in report["anomalies"]], ["Банкет"])
+        self.assertGreater(report["anomalies"][0][4], 3)
+
+        conn = get_connection()
+        try:
+            count, mean = conn.execute("SELECT count, mean FROM category_stats WHERE category = 'еда'").fetchone()
+        finally:
+            conn.close()
+        self.assertEqual(count, 8)
+        self.assertAlmostEqual(mean, sum(-row[1] for row in self.rows) / 8)
+
+    def test_edit_amount_recomputes_flag(self):
+        """Тест пересчета отметки при изменении суммы и ее отмены."""
+        from fintracker.database import import_expenses_to_db
+        from fintracker.edit import edit_expenses, undo_last
+        from fintracker.storage import ExpenseQuery
+
+        import_expenses_to_db(self.rows)
+        ids = {expense.description: expense.id for expense in get_expenses("all")}
+        edit_expenses(ExpenseQuery(ids=[ids["Банкет"]]), {"amount": -100})
+        self.assertEqual(get_expenses(ExpenseQuery(anomalies=True)), [])
+
+        edit_expenses(ExpenseQuery(ids=[ids["Продукты 7"]]), {"amount": -2000})
+        self.assertEqual([expense.description for expense in get_expenses(ExpenseQuery(anomalies=True))],
+                         ["Продукты 7"])
+
+        undo_last()
+        undo_last()
+        self.assertEqual([expense.description for expense in get_expenses(ExpenseQuery(anomalies=True))],
+                         ["Банкет"])
+
+    def test_memory_backend_and_rebuild(self):
+        """Тест отметок в движке в памяти и восстановления статистики при инициализации."""
+        from fintracker.backends import MemoryBackend
+        from fintracker.storage import ExpenseQuery
+
+        memory = MemoryBackend()
+        memory.import_expenses(self.rows)
+        self.assertEqual([row[3] for row in memory.anomaly_report("all")["anomalies"]], ["Банкет"])
+        self.assertEqual(len(memory.get_expenses(ExpenseQuery(anomalies=True))), 1)
+
+        from fintracker.database import import_expenses_to_db
+        import_expenses_to_db(self.rows)
+        conn = get_connection()
+        try:
+            conn.execute("DELETE FROM category_stats")
+            conn.commit()
+        finally:
+            conn.close()
+        init_storage()
+        conn = get_connection()
+        try:
+            self.assertEqual(conn.execute("SELECT count FROM category_stats").fetchone()[0], 8)
+        finally:
+            conn.close()
+
+
+def _concurrent_add(database_file, writer, count):
+    """Добавляет операции из отдельного процесса (для TestConcurrentWriters).
+
+    Описания общие для всех процессов, поэтому процессы одновременно
+    добавляют одни и те же новые описания в словарь.
+    """
+    import fintracker.database
+    fintracker.database.DATABASE_FILE = database_file
+    for i in range(count):
+        if not add_expense("еда", -(writer * count + i + 1), f"Операция {i}"):
+            raise SystemExit(1)
+
+
+class TestConcurrentWriters(unittest.TestCase):
+    """Тесты одновременной записи из нескольких соединений и процессов."""
+
+    def setUp(self):
+        """Настройка тестовой БД."""
+        self.test_dir = tempfile.mkdtemp()
+        self.test_db_file = os.path.join(self.test_dir, "test_financial.db")
+
+        import fintracker.database
+        self.original_db_file = fintracker.database.DATABASE_FILE
+        fintracker.database.DATABASE_FILE = self.test_db_file
+
+        init_storage()
+
+    def tearDown(self):
+        """Очистка после тестов."""
+        import fintracker.database
+        fintracker.database.DATABASE_FILE = self.original_db_file
+
+        shutil.rmtree(self.test_dir)
+
+    def test_connection_settings(self):
+        """Тест режима WAL, ожидания блокировки и BEGIN IMMEDIATE."""
+        import fintracker.database
+
+        conn = get_connection()
+        try:
+            self.assertEqual(conn.execute('PRAGMA journal_mode').fetchone()[0], "wal")
+            self.assertEqual(conn.execute('PRAGMA busy_timeout').fetchone()[0],
+                             fintracker.database.BUSY_TIMEOUT_MS)
+            self.assertEqual(conn.isolation_level, "IMMEDIATE")
+        finally:
+            conn.close()
+
+    def test_retry_when_locked(self):
+        """Тест что запись повторяется, пока другой процесс держит блокировку."""
+        import sqlite3
+        import threading
+        from unittest import mock
+        import fintracker.database
+
+        blocker = sqlite3.connect(self.test_db_file, isolation_level=None, check_same_thread=False)
+        blocker.execute('BEGIN IMMEDIATE')
+        timer = threading.Timer(0.3, blocker.rollback)
+        timer.start()
+        try:
+            with mock.patch.object(fintracker.database, "BUSY_TIMEOUT_MS", 20):
+                self.assertTrue(add_expense("еда", -100, "Обед"))
+        finally:
+            timer.join()
+            blocker.close()
+        self.assertEqual(len(get_expenses("all")), 1)
+
+    def test_no_lost_writes_across_processes(self):
+        """Тест что операции из нескольких процессов не теряются."""
+        import multiprocessing
+
+        processes = [multiprocessing.Process(target=_concurrent_add, args=(self.test_db_file, writer, 30))
+                     for writer in range(3)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        self.assertEqual([process.exitcode for process in processes], [0, 0, 0])
+        self.assertEqual(len(get_expenses("all")), 90)
+        conn = get_connection()
+        try:
+            stats_count = conn.execute("SELECT count FROM category_stats WHERE category = 'еда'").fetchone()[0]
+            descriptions = conn.execute('SELECT COUNT(*) FROM descriptions').fetchone()[0]
+        finally:
+            conn.close()
+        self.assertEqual(stats_count, 90)
+        self.assertEqual(descriptions, 30)
+
+    def test_category_stats_across_processes(self):
+        """Тест что статистика категории совпадает с операциями после записи из нескольких процессов."""
+        import multiprocessing
+
+        processes = [multiprocessing.Process(target=_concurrent_add, args=(self.test_db_file, writer, 40))
+                     for writer in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        conn = get_connection()
+        try:
+            count, mean, m2 = conn.execute(
+                "SELECT count, mean, m2 FROM category_stats WHERE category = 'еда'").fetchone()
+            expected = conn.execute(
+                "SELECT COUNT(*), AVG(ABS(amount)), stddev(ABS(amount)) FROM expenses WHERE category = 'еда'"
+            ).fetchone()
+        finally:
+            conn.close()
+        self.assertEqual(count, expected[0])
+        self.assertEqual(count, 160)
+        self.assertAlmostEqual(mean, expected[1])
+        self.assertAlmostEqual((m2 / (count - 1)) ** 0.5, expected[2])
+
+
+class TestCategoryTree(unittest.TestCase):
+    """Тесты вложенных категорий и сумм по поддеревьям."""
+
+    def setUp(self):
+        """Настройка тестовой БД."""
+        self.test_dir = tempfile.mkdtemp()
+        self.test_db_file = os.path.join(self.test_dir, "test_financial.db")
+
+        import fintracker.database
+        self.original_db_file = fintracker.database.DATABASE_FILE
+        fintracker.database.DATABASE_FILE = self.test_db_file
+
+        init_storage()
+
+    def tearDown(self):
+        """Очистка после тестов."""
+        import fintracker.database
+        fintracker.database.DATABASE_FILE = self.original_db_file
+
+        shutil.rmtree(self.test_dir)
+
+    def _fill(self, backend):
+        """Заполняет движок деревом категорий и операциями."""
+        backend.add_category("транспорт", "expense")
+        backend.add_category("такси", "expense", "транспорт")
+        backend.add_category("эконом", "expense", "такси")
+        backend.add_category("метро", "expense", "транспорт")
+        backend.add_category("еда", "expense")
+        backend.import_expenses([
+            ("транспорт", -50, "Парковка", "2025-01-01 10:00:00"),
+            ("такси", -300, "Такси", "2025-01-02 10:00:00"),
+            ("эконом", -200, "Такси эконом", "2025-01-03 10:00:00"),
+            ("метро", -60, "Метро", "2025-01-04 10:00:00"),
+            ("еда", -400, "Продукты", "2025-01-05 10:00:00"),
+            ("прочее", -10, "Без категории в дереве", "2025-01-06 10:00:00"),
+        ])
+
+    def test_subtree_totals(self):
+        """Тест что сумма категории включает все ее подкатегории."""
+        from fintracker.backends import SQLiteBackend
+
+        backend = SQLiteBackend()
+        self._fill(backend)
+        report = backend.tree_report("all")
+
+        rows = {row[0]: row for row in report["tree"]}
+        self.assertEqual([row[0] for row in report["tree"]],
+                         ["еда", "прочее", "транспорт", "метро", "такси", "эконом"])
+        self.assertEqual(rows["транспорт"][1:], (0, -610, -50, 4))
+        self.assertEqual(rows["такси"][1:], (1, -500, -300, 2))
+        self.assertEqual(rows["эконом"][1:], (2, -200, -200, 1))
+        self.assertEqual(report["total_amount"], -1020)
+        self.assertEqual(report["total_expenses"], 6)
+
+        # Фильтры запроса применяются до свертки по дереву
+        from fintracker.query import ExpenseQuery
+        filtered = backend.tree_report(ExpenseQuery(start_date="2025-01-03"))
+        self.assertEqual({row[0]: row[2] for row in filtered["tree"]}["транспорт"], -260)
+
+    def test_deep_hierarchy(self):
+        """Тест глубокой цепочки: строки замыкания и свертка до корня."""
+        depth = 60
+        add_category("уровень 0", "expense")
+        for level in range(1, depth):
+            self.assertTrue(add_category(f"уровень {level}", "expense", f"уровень {level - 1}"))
+        add_expense(f"уровень {depth - 1}", -5, "Лист", "2025-02-01 12:00:00")
+        add_expense("уровень 30", -7, "Середина", "2025-02-01 13:00:00")
+
+        conn = get_connection()
+        count = conn.execute("SELECT COUNT(*) FROM category_tree").fetchone()[0]
+        conn.close()
+        self.assertEqual(count, depth * (depth + 1) // 2)
+
+        report = generate_tree_report("all")
+        rows = {row[0]: row for row in report["tree"]}
+        self.assertEqual(len(report["tree"]), depth)
+        self.assertEqual(rows["уровень 0"][2], -12)
+        self.assertEqual(rows["уровень 31"][2], -5)
+        self.assertEqual(rows["уровень 30"][2:], (-12, -7, 2))
+        self.assertEqual(rows[f"уровень {depth - 1}"][1], depth - 1)
+
+        self.assertFalse(add_category("сирота", "expense", "нет такой"))
+        parents = {category.name: category.parent for category in get_categories()}
+        self.assertEqual(parents["уровень 1"], "уровень 0")
+        self.assertIsNone(parents["уровень 0"])
+
+    def test_memory_backend_parity(self):
+        """Тест что движок в памяти считает поддеревья так же, как SQLite."""
+        from fintracker.backends import SQLiteBackend, MemoryBackend
+
+        sqlite_backend = SQLiteBackend()
+        memory_backend = MemoryBackend()
+        self._fill(sqlite_backend)
+        self._fill(memory_backend)
+
+        self.assertEqual(memory_backend.tree_report("all")["tree"], sqlite_backend.tree_report("all")["tree"])
+        self.assertEqual(memory_backend.get_categories(), sqlite_backend.get_categories())
+
+
+class TestTags(unittest.TestCase):
+    """Тесты меток и битового индекса."""
+
+    def setUp(self):
+        """Настройка тестовой БД."""
+        self.test_dir = tempfile.mkdtemp()
+        self.test_db_file = os.path.join(self.test_dir, "test_financial.db")
+
+        import fintracker.database
+        self.original_db_file = fintracker.database.DATABASE_FILE
+        fintracker.database.DATABASE_FILE = self.test_db_file
+
+        init_storage()
+
+    def tearDown(self):
+        """Очистка после тестов."""
+        import fintracker.database
+        fintracker.database.DATABASE_FILE = self.original_db_file
+
+        shutil.rmtree(self.test_dir)
+
+    def _fill(self, backend):
+        """Добавляет операции с разными сочетаниями меток."""
+        backend.add_expense("транспорт", -3000, "Такси в аэропорт", "2025-03-01 08:00:00",
+                            ["бизнес", "командировка", "к-возмещению"])
+        backend.add_expense("жилье", -9000, "Гостиница", "2025-03-01 20:00:00", ["бизнес", "командировка"])
+        backend.add_expense("еда", -700, "Ужин с клиентом", "2025-03-02 21:00:00", [" бизнес ", "бизнес"])
+        backend.add_expense("еда", -300, "Кофе", "2025-03-03 09:00:00")
+
+    def test_bitmap_operations(self):
+        """Тест операций над битовым множеством в разреженных и плотных блоках."""
+        from fintracker.bitmap import Bitmap
+
+        sparse = set(range(0, 200000, 97))
+        dense = set(range(1000, 60000)) | {70000, 140000}
+        left, right = Bitmap(sparse), Bitmap(dense)
+
+        self.assertEqual(list(left & right), sorted(sparse & dense))
+        self.assertEqual(list(left | right), sorted(sparse | dense))
+        self.assertEqual(list(right - left), sorted(dense - sparse))
+        self.assertEqual(len(right), len(dense))
+
+        union = left | right
+        union.add(199999)
+        union.discard(70000)
+        self.assertIn(199999, union)
+        self.assertNotIn(70000, union)
+        self.assertNotIn(199999, left)
+        self.assertIn(70000, right)
+
+    def test_tag_filters_and_report(self):
+        """Тест фильтра по сочетанию меток и итогов по меткам."""
+        from fintracker.backends import SQLiteBackend
+        from fintracker.query import ExpenseQuery
+
+        backend = SQLiteBackend()
+        self._fill(backend)
+
+        query = ExpenseQuery(tags=["бизнес", "командировка"], exclude_tags=["к-возмещению"])
+        self.assertEqual([expense["description"] for expense in backend.get_expenses(query)], ["Гостиница"])
+        self.assertEqual(len(get_expenses(ExpenseQuery(exclude_tags=["бизнес"]))), 1)
+        self.assertEqual(get_expenses(ExpenseQuery(tags=["нет такой"])), [])
+
+        report = backend.tag_report("all")
+        self.assertEqual(report["tags"], [("бизнес", 3, -12700), ("командировка", 2, -12000),
+                                          ("к-возмещению", 1, -3000)])
+        self.assertEqual(report["total_expenses"], 4)
+
+        filtered = backend.tag_report(ExpenseQuery(categories=["еда"]))
+        self.assertEqual(filtered["tags"], [("бизнес", 1, -700)])
+
+    def test_index_follows_database(self):
+        """Тест что индекс перестраивается после изменения меток в базе."""
+        import fintracker.database
+        from fintracker import storage
+        from fintracker.query import ExpenseQuery
+
+        self._fill(storage.get_backend())
+        self.assertEqual(len(get_expenses(ExpenseQuery(tags=["командировка"]))), 2)
+
+        # Изменение мимо процесса: индекс должен заметить новую версию
+        conn = get_connection()
+        conn.execute("DELETE FROM expenses WHERE description_id = "
+                     "(SELECT id FROM descriptions WHERE text = 'Гостиница')")
+        conn.commit()
+        conn.close()
+        self.assertEqual(len(get_expenses(ExpenseQuery(tags=["командировка"]))), 1)
+        self.assertEqual(fintracker.database.rebuild_tag_index(), 3)
+
+    def test_memory_backend_parity(self):
+        """Тест что движок в памяти фильтрует и считает метки так же, как SQLite."""
+        from fintracker.backends import SQLiteBackend, MemoryBackend
+        from fintracker.query import ExpenseQuery
+
+        sqlite_backend = SQLiteBackend()
+        memory_backend = MemoryBackend()
+        self._fill(sqlite_backend)
+        self._fill(memory_backend)
+
+        for query in (ExpenseQuery(tags=["бизнес"], exclude_tags=["командировка"]),
+                      ExpenseQuery(exclude_tags=["к-возмещению"], kind="expense")):
+            self.assertEqual(memory_backend.get_expenses(query), sqlite_backend.get_expenses(query))
+        self.assertEqual(memory_backend.tag_report("all")["tags"], sqlite_backend.tag_report("all")["tags"])
+
+
+class TestAccounts(unittest.TestCase):
+    """Тесты нескольких счетов в одной базе."""
+
+    def setUp(self):
+        """Настройка тестовой БД."""
+        self.test_dir = tempfile.mkdtemp()
+        self.test_db_file = os.path.join(self.test_dir, "test_financial.db")
+
+        import fintracker.database
+        self.original_db_file = fintracker.database.DATABASE_FILE
+        fintracker.database.DATABASE_FILE = self.test_db_file
+
+        init_storage()
+
+    def tearDown(self):
+        """Очистка после тестов."""
+        import fintracker.database
+        fintracker.database.DATABASE_FILE = self.original_db_file
+
+        shutil.rmtree(self.test_dir)
+
+    def _fill(self, backend):
+        """Добавляет одинаковые и разные операции на несколько счетов."""
+        backend.add_expense("еда", -500, "Продукты", "2025-04-01 18:00:00")
+        backend.add_expense("еда", -500, "Продукты", "2025-04-01 18:00:00", account="card")
+        backend.add_expense("транспорт", -60, "Метро", "2025-04-02 09:00:00", account="card")
+        backend.add_expense("зарплата", 50000, "Зарплата", "2025-04-05 10:00:00", account="business")
+
+    def test_accounts_are_isolated(self):
+        """Тест что одинаковые операции разных счетов не считаются дубликатами."""
+        from fintracker import storage
+        from fintracker.query import ExpenseQuery
+
+        backend = storage.get_backend()
+        self._fill(backend)
+        self.assertEqual(len(get_expenses("all")), 4)
+        self.assertEqual(backend.import_expenses([("еда", -500, "Продукты", "2025-04-01 18:00:00", None, "card")]),
+                         {"inserted": 0, "duplicates": 1})
+
+        card = get_expenses(ExpenseQuery(account="card"))
+        self.assertEqual([(e.description, e.account) for e in card], [("Метро", "card"), ("Продукты", "card")])
+        self.assertEqual(get_expenses(ExpenseQuery(account="main"))[0].account, "main")
+
+        report = generate_category_report(ExpenseQuery(account="card"))
+        self.assertEqual(dict(report["categories"]), {"еда": -500, "транспорт": -60})
+
+    def test_account_queries_use_account_index(self):
+        """Тест что запрос по счету читает только диапазон индекса этого счета."""
+        from fintracker.query import ExpenseQuery
+
+        conn = get_connection()
+        for query, kwargs in ((ExpenseQuery(account="card", start_date="2025-04-01"), {}),
+                              (ExpenseQuery("month", account="card"),
+                               {"select": "category, SUM(amount)", "group_by": "category", "order_by": None})):
+            sql, params = query.compile(**kwargs)
+            plan = " ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+            self.assertIn("idx_expenses_account", plan)
+            self.assertIn("account=?", plan)
+        conn.close()
+
+    def test_cross_account_report(self):
+        """Тест сводного отчета по счетам и его совпадения в движке в памяти."""
+        from fintracker.backends import SQLiteBackend, MemoryBackend
+        from fintracker.report import generate_account_report
+
+        sqlite_backend = SQLiteBackend()
+        memory_backend = MemoryBackend()
+        self._fill(sqlite_backend)
+        self._fill(memory_backend)
+
+        report = generate_account_report("all")
+        self.assertEqual(report["accounts"], [
+            ("business", 1, 50000, 0, 50000), ("card", 2, 0, -560, -560), ("main", 1, 0, -500, -500)
+        ])
+        self.assertEqual(report["total_expenses"], 4)
+        self.assertEqual(memory_backend.account_report("all")["accounts"], report["accounts"])
+        self.assertEqual(memory_backend.get_expenses("all"), sqlite_backend.get_expenses("all"))
+
+    def test_account_categories_and_import(self):
+        """Тест категорий счета и импорта с колонкой account."""
+        from fintracker.storage import import_expenses
+
+        self.assertTrue(add_category("еда", "expense"))
+        self.assertTrue(add_category("командировки", "expense", account="business"))
+        self.assertEqual([c.name for c in get_categories("card")], ["еда"])
+        self.assertEqual([c.name for c in get_categories("business")], ["еда", "командировки"])
+        self.assertEqual(len(get_categories()), 2)
+
+        csv_file = os.path.join(self.test_dir, "bank.csv")
+        with open(csv_file, "w", encoding="utf-8") as f:
+            f.write("date,amount,category,description,account\n")
+            f.write("2025-04-01 10:00:00,-100,еда,Кофе,\n")
+            f.write("2025-04-01 10:00:00,-100,еда,Кофе,business\n")
+        self.assertEqual(import_expenses(csv_file, account="card")["inserted"], 2)
+        self.assertEqual(sorted(e.account for e in get_expenses("all")), ["business", "card"])
+
+
+class TestChangeFeed(unittest.TestCase):
+    """Тесты журнала изменений операций."""
+
+    def setUp(self):
+        """Настройка тестовой БД."""
+        self.test_dir = tempfile.mkdtemp()
+        self.test_db_file = os.path.join(self.test_dir, "test_financial.db")
+
+        import fintracker.database
+        self.original_db_file = fintracker.database.DATABASE_FILE
+        fintracker.database.DATABASE_FILE = self.test_db_file
+
+        init_storage()
+        for day in range(1, 6):
+            add_expense("еда", -100 * day, f"Покупка {day}", f"2025-05-{day:02d} 12:00:00")
+
+    def tearDown(self):
+        """Очистка после тестов."""
+        import fintracker.database
+        fintracker.database.DATABASE_FILE = self.original_db_file
+
+        shutil.rmtree(self.test_dir)
+
+    def _execute(self, *statements):
+        """Изменяет операции напрямую в базе, как это сделал бы другой процесс."""
+        conn = get_connection()
+        for statement in statements:
+            conn.execute(statement)
+        conn.commit()
+        conn.close()
+
+    def test_triggers_log_every_change(self):
+        """Тест что вставка, изменение и удаление попадают в журнал по порядку."""
+        from fintracker.storage import iter_changes
+
+        self._execute("UPDATE expenses SET amount = -150 WHERE id = 1",
+                      "UPDATE expenses SET amount = -150 WHERE id = 1",
+                      "DELETE FROM expenses WHERE id = 2")
+
+        changes = list(iter_changes(0, chunk_size=2))
+        self.assertEqual([change["seq"] for change in changes], list(range(1, 8)))
+        self.assertEqual([(change["op"], change["expense_id"]) for change in changes[5:]],
+                         [("update", 1), ("delete", 2)])
+        self.assertEqual(changes[5]["amount"], -150)
+        self.assertIsNone(changes[6]["category"])
+
+        self.assertEqual([change["seq"] for change in iter_changes(5)], [6, 7])
+        self.assertEqual(list(iter_changes(7)), [])
+
+    def test_compaction_and_retention(self):
+        """Тест что сжатие оставляет последнюю запись операции и отсекает устаревшие."""
+        from fintracker.database import compact_changes, get_change_head
+        from fintracker.storage import iter_changes
+
+        self._execute("UPDATE expenses SET description = 'Исправлено' WHERE id = 3")
+        self.assertEqual(compact_changes(), {"superseded": 1, "expired": 0})
+        changes = list(iter_changes(0))
+        self.assertEqual([change["seq"] for change in changes], [1, 2, 4, 5, 6])
+        self.assertEqual(changes[-1]["description"], "Исправлено")
+
+        # Записи старше срока хранения удаляются, отставшие потребители получают ошибку
+        self._execute("UPDATE change_log SET changed_at = '2000-01-01 00:00:00' WHERE seq <= 4")
+        self.assertEqual(compact_changes(30), {"superseded": 0, "expired": 3})
+        with self.assertRaises(ValueError):
+            list(iter_changes(2))
+        self.assertEqual([change["seq"] for change in iter_changes(4)], [5, 6])
+        self.assertEqual(get_change_head(), 6)
+
+    def test_memory_backend_changes(self):
+        """Тест журнала изменений движка в памяти."""
+        from fintracker.backends import MemoryBackend
+
+        memory = MemoryBackend()
+        memory.add_expense("еда", -100, "Кофе", "2025-05-01 09:00:00")
+        memory.import_expenses([("еда", -100, "Кофе", "2025-05-01 09:00:00", "ext-1"),
+                                ("еда", -120, "Кофе", "2025-05-01 09:00:00", "ext-1")], on_conflict="update")
+
+        changes = list(memory.iter_changes(1))
+        self.assertEqual([(change["seq"], change["op"]) for change in changes],
+                         [(2, "insert"), (3, "delete"), (4, "insert")])
+        self.assertEqual(changes[-1]["amount"], -120)
+
+
+class TestSync(unittest.TestCase):
+    """Тесты двусторонней синхронизации баз."""
+
+    def setUp(self):
+        """Настройка двух тестовых БД с общей историей."""
+        self.test_dir = tempfile.mkdtemp()
+        self.test_db_file = os.path.join(self.test_dir, "test_financial.db")
+        self.remote_db_file = os.path.join(self.test_dir, "remote.db")
+
+        import fintracker.database
+        self.original_db_file = fintracker.database.DATABASE_FILE
+        fintracker.database.DATABASE_FILE = self.test_db_file
+
+        init_storage()
+        for month in range(1, 13):
+            add_expense("еда", -10 * month, f"Покупка {month}", f"2024-{month:02d}-10 12:00:00")
+        fintracker.database.snapshot(self.remote_db_file)
+
+    def tearDown(self):
+        """Очистка после тестов."""
+        import fintracker.database
+        fintracker.database.DATABASE_FILE = self.original_db_file
+
+        shutil.rmtree(self.test_dir)
+
+    def _add_remote(self, *rows):
+        """Добавляет операции во вторую базу."""
+        from fintracker.database import run_write, _insert_expenses
+        run_write(lambda cursor: _insert_expenses(cursor, rows), path=self.remote_db_file)
+
+    def _descriptions(self, path=None):
+        from fintracker.query import DESCRIPTION_SQL
+        conn = get_connection(path)
+        try:
+            return sorted(row[0] for row in conn.execute(f"SELECT {DESCRIPTION_SQL} FROM expenses"))
+        finally:
+            conn.close()
+
+    def test_identical_ledgers_transfer_nothing(self):
+        """Одинаковые базы сравниваются только на верхнем уровне."""
+        from fintracker.sync import sync_ledgers
+        stats = sync_ledgers(self.remote_db_file)
+        self.assertEqual(stats, {"ranges": 1, "differing": 0, "pulled": 0, "pushed": 0})
+
+    def test_two_way_sync(self):
+        """Недостающие операции переносятся в обе стороны и повторная синхронизация ничего не меняет."""
+        from fintracker.sync import sync_ledgers
+        add_expense("кафе", -300, "Только локально", "2024-03-10 18:00:00")
+        self._add_remote(("зарплата", 5000, "Только на сервере", "2025-01-05 09:00:00"),
+                         ("еда", -70, "Еще на сервере", "2024-07-21 10:00:00"))
+
+        stats = sync_ledgers(self.remote_db_file)
+        self.assertEqual((stats["pulled"], stats["pushed"]), (2, 1))
+        self.assertEqual(self._descriptions(), self._descriptions(self.remote_db_file))
+        self.assertEqual(len(self._descriptions()), 15)
+        # Полученные операции учитываются в отчетах как добавленные локально
+        self.assertIn(("зарплата", 5000.0), generate_category_report("all")["categories"])
+
+        stats = sync_ledgers(self.remote_db_file)
+        self.assertEqual((stats["differing"], stats["pulled"], stats["pushed"]), (0, 0, 0))
+
+    def test_only_differing_day_is_compared(self):
+        """Сравнение спускается только в различающиеся год, месяц и день."""
+        from fintracker.sync import sync_ledgers
+        self._add_remote(("еда", -5, "Вторая покупка дня", "2024-05-10 20:00:00"))
+
+        stats = sync_ledgers(self.remote_db_file, dry_run=True)
+        # Год, 12 месяцев, один день; различаются год, май и 10 мая
+        self.assertEqual(stats, {"ranges": 14, "differing": 3, "pulled": 1, "pushed": 0})
+        self.assertEqual(len(self._descriptions()), 12)
+
+    def test_same_operation_added_on_both_sides(self):
+        """Одна и та же операция, добавленная в обе базы, не дублируется."""
+        from fintracker.sync import sync_ledgers
+        add_expense("кафе", -300, "Обед", "2024-06-10 13:00:00")
+        self._add_remote(("кафе", -300, "Обед", "2024-06-10 13:00:00"))
+
+        stats = sync_ledgers(self.remote_db_file)
+        self.assertEqual((stats["differing"], stats["pulled"], stats["pushed"]), (0, 0, 0))
+        self.assertEqual(len(self._descriptions()), 13)
+
+class TestDescriptions(unittest.TestCase):
+    """Тесты словаря описаний и отчета по описаниям."""
+
+    def setUp(self):
+        """Настройка тестовой БД."""
+        self.test_dir = tempfile.mkdtemp()
+        self.test_db_file = os.path.join(self.test_dir, "test_financial.db")
+
+        import fintracker.database
+        self.original_db_file = fintracker.database.DATABASE_FILE
+        fintracker.database.DATABASE_FILE = self.test_db_file
+
+        init_storage()
+
+    def tearDown(self):
+        """Очистка после тестов."""
+        import fintracker.database
+        fintracker.database.DATABASE_FILE = self.original_db_file
+
+        shutil.rmtree(self.test_dir)
+
+    def _fill(self, backend):
+        backend.add_expense("еда", -300, "Пятёрочка", "2025-05-01 10:00:00")
+        backend.add_expense("еда", -200, "Пятёрочка", "2025-05-02 10:00:00")
+        backend.add_expense("транспорт", -450, "Яндекс Такси", "2025-05-02 20:00:00")
+        backend.add_expense("еда", -100, "", "2025-05-03 10:00:00")
+
+    def _scalar(self, sql):
+        conn = get_connection()
+        try:
+            return conn.execute(sql).fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_descriptions_stored_once(self):
+        """Повторяющееся описание хранится в словаре один раз."""
+        from fintracker import storage
+        from fintracker.query import ExpenseQuery
+        self._fill(storage.get_backend())
+
+        self.assertEqual(self._scalar("SELECT COUNT(*) FROM descriptions"), 3)
+        self.assertEqual(self._scalar("SELECT COUNT(*) FROM expenses WHERE description IS NOT NULL"), 0)
+        self.assertEqual([e.description for e in get_expenses("all")],
+                         ["", "Яндекс Такси", "Пятёрочка", "Пятёрочка"])
+        self.assertEqual(len(get_expenses(ExpenseQuery(text="пятёр"))), 2)
+
+    def test_merchant_report(self):
+        """Отчет группирует операции по описанию так же в SQLite и в памяти."""
+        from fintracker.backends import SQLiteBackend, MemoryBackend
+        from fintracker.report import generate_merchant_report, format_report
+        sqlite_backend = SQLiteBackend()
+        memory_backend = MemoryBackend()
+        self._fill(sqlite_backend)
+        self._fill(memory_backend)
+
+        report = generate_merchant_report("all")
+        self.assertEqual(report["merchants"],
+                         [("Пятёрочка", 2, -500.0), ("Яндекс Такси", 1, -450.0), ("", 1, -100.0)])
+        self.assertEqual(report["total_expenses"], 4)
+        self.assertEqual(memory_backend.merchant_report("all")["merchants"], report["merchants"])
+        self.assertIn("(без описания): 1 опер.", format_report(report))
+
+    def test_migration_encodes_existing_descriptions(self):
+        """Описания старой базы переносятся в словарь без записей в журнал изменений."""
+        from fintracker.database import init_database, get_change_head
+        conn = get_connection()
+        try:
+            # Триггер журнала из версии без словаря описаний
+            conn.execute('DROP TRIGGER expenses_log_update')
+            conn.execute('''
+                CREATE TRIGGER expenses_log_update AFTER UPDATE ON expenses
+                WHEN old.description IS NOT new.description
+                BEGIN INSERT INTO change_log (op, expense_id) VALUES ('update', new.id); END
+            ''')
+            conn.execute('DROP INDEX idx_expenses_description')
+            conn.execute('ALTER TABLE expenses DROP COLUMN description_id')
+            conn.execute('DROP TABLE descriptions')
+            for day in (1, 2):
+                conn.execute(
+                    'INSERT INTO expenses (category, amount, description, date) VALUES (?, ?, ?, ?)',
+                    ("еда", -100 * day, "Пятёрочка", f"2025-05-0{day} 12:00:00")
+                )
+            conn.commit()
+        finally:
+            conn.close()
+        head = get_change_head()
+
+        init_database()
+        self.assertEqual(self._scalar("SELECT COUNT(*) FROM descriptions"), 1)
+        self.assertEqual(self._scalar("SELECT COUNT(*) FROM expenses WHERE description IS NOT NULL"), 0)
+        self.assertEqual([e.description for e in get_expenses("all")], ["Пятёрочка", "Пятёрочка"])
+        self.assertEqual(get_change_head(), head)
+
+    def test_rolled_back_description_not_cached(self):
+        """Номер описания из откаченной транзакции не остается в кэше."""
+        from fintracker.database import run_write, _insert_expenses
+
+        def failing(cursor):
+            _insert_expenses(cursor, [("еда", -100, "Новый магазин", "2025-05-01 10:00:00")])
+            raise sqlite3.IntegrityError("сбой после вставки")
+
+        with self.assertRaises(sqlite3.IntegrityError):
+            run_write(failing)
+        self.assertEqual(self._scalar("SELECT COUNT(*) FROM descriptions"), 0)
+
+        add_expense("еда", -100, "Новый магазин", "2025-05-01 10:00:00")
+        self.assertEqual(get_expenses("all")[0].description, "Новый магазин")
+
+    def test_savepoint_rollback_description_not_cached(self):
+        """Номер описания из отката до точки сохранения не попадает в кэш."""
+        from fintracker.writer import BufferedWriter
+        with BufferedWriter(max_batch=16, max_latency=0.5) as writer:
+            failed = writer.submit(None, -1, "Призрак")
+            written = writer.submit("еда", -2, "Настоящее")
+        with self.assertRaises(sqlite3.IntegrityError):
+            failed.result(timeout=5)
+        self.assertTrue(written.result(timeout=5))
+
+        add_expense("еда", -3, "Призрак", "2025-05-04 10:00:00")
+        descriptions = {e.amount: e.description for e in get_expenses("all")}
+        self.assertEqual(descriptions, {-2: "Настоящее", -3: "Призрак"})
+
+
+class TestAttachments(unittest.TestCase):
+    """Тесты вложений к операциям."""
+
+    def setUp(self):
+        """Настройка тестовой БД."""
+        self.test_dir = tempfile.mkdtemp()
+        self.test_db_file = os.path.join(self.test_dir, "test_financial.db")
+
+        import fintracker.database
+        self.original_db_file = fintracker.database.DATABASE_FILE
+        fintracker.database.DATABASE_FILE = self.test_db_file
+
+        init_storage()
+        add_expense("еда", -300, "Пятёрочка", "2025-05-01 10:00:00")
+        self.expense_id = get_expenses("all")[0].id
+
+    def tearDown(self):
+        """Очистка после тестов."""
+        import fintracker.database
+        fintracker.database.DATABASE_FILE = self.original_db_file
+
+        shutil.rmtree(self.test_dir)
+
+    def _file(self, name, size):
+        path = os.path.join(self.test_dir, name)
+        with open(path, "wb") as f:
+            f.write(bytes(i % 251 for i in range(size)))
+        return path
+
+    def test_inline_attachment_streamed_in_chunks(self):
+        """Небольшой файл хранится в базе и читается порциями."""
+        from fintracker.attachments import add_attachment, iter_attachment, list_attachments
+        path = self._file("чек.jpg", 50000)
+
+        attachment_id = add_attachment(self.expense_id, path)
+        chunks = list(iter_attachment(attachment_id, chunk_size=16384))
+        self.assertEqual([len(chunk) for chunk in chunks], [16384, 16384, 16384, 848])
+        with open(path, "rb") as f:
+            self.assertEqual(b"".join(chunks), f.read())
+
+        attachment, = list_attachments(self.expense_id)
+        self.assertEqual((attachment["name"], attachment["size"], attachment["path"]), ("чек.jpg", 50000, None))
+
+    def test_large_attachment_stored_as_file(self):
+        """Файл больше порога хранится вне базы, одинаковые файлы - один раз."""
+        import io
+        from fintracker.attachments import add_attachment, save_attachment, get_attachment, attachments_dir
+        path = self._file("скан.pdf", 300000)
+
+        first = add_attachment(self.expense_id, path, inline_limit=1024)
+        second = add_attachment(self.expense_id, path, name="копия.pdf", inline_limit=1024)
+        self.assertEqual(get_attachment(first)["path"], get_attachment(second)["path"])
+        stored = [name for _, _, files in os.walk(attachments_dir()) for name in files]
+        self.assertEqual(len(stored), 1)
+
+        target = io.BytesIO()
+        self.assertEqual(save_attachment(second, target), 300000)
+        with open(path, "rb") as f:
+            self.assertEqual(target.getvalue(), f.read())
+
+    def test_missing_expense_or_attachment(self):
+        """Вложение к несуществующей операции не добавляется."""
+        from fintracker.attachments import add_attachment, iter_attachment
+        path = self._file("чек.jpg", 10)
+        self.assertIsNone(add_attachment(self.expense_id + 1, path))
+        with self.assertRaises(ValueError):
+            list(iter_attachment(1))
+
+class TestMigrateJson(unittest.TestCase):
+    """Тесты переноса данных из data.json."""
+
+    def setUp(self):
+        """Настройка тестовой БД и файла прежнего формата."""
+        self.test_dir = tempfile.mkdtemp()
+        self.test_db_file = os.path.join(self.test_dir, "test_financial.db")
+        self.json_file = os.path.join(self.test_dir, "data.json")
+
+        import fintracker.database
+        self.original_db_file = fintracker.database.DATABASE_FILE
+        fintracker.database.DATABASE_FILE = self.test_db_file
+
+        init_storage()
+        self.expenses = [
+            {"category": "еда", "amount": -100 - i, "description": f"покупка {i}",
+             "date": f"2025-05-{i + 1:02d} 10:00:00"}
+            for i in range(20)
+        ]
+
+    def tearDown(self):
+        """Очистка после тестов."""
+        import fintracker.database
+        fintracker.database.DATABASE_FILE = self.original_db_file
+        shutil.rmtree(self.test_dir)
+
+    def _write(self, document):
+        import json
+        with open(self.json_file, "w", encoding="utf-8") as f:
+            json.dump(document, f, ensure_ascii=False, indent=2)
+
+    def test_migrate_object(self):
+        """Тест переноса операций и категорий из объекта с несколькими порциями."""
+        from fintracker.migrate import migrate_json
+        self._write({"version": 1,
+                     "categories": [{"name": "еда", "type": "expense"},
+                                    {"name": "фрукты", "type": "expense", "parent": "еда"}],
+                     "expenses": self.expenses})
+
+        result = migrate_json(self.json_file, batch_size=7)
+        self.assertEqual(result["expenses"], 20)
+        self.assertEqual(result["categories"], 2)
+        self.assertEqual(len(get_expenses("all")), 20)
+        self.assertEqual(get_categories()[1].parent, "еда")
+        # Повторный перенос того же файла ничего не делает
+        self.assertEqual(migrate_json(self.json_file), {})
+
+    def test_resume_after_interrupt(self):
+        """Тест продолжения прерванного переноса без повторной вставки."""
+        from unittest import mock
+        import fintracker.migrate
+        self._write(self.expenses)
+        calls = []
+
+        def interrupt(done, total, records):
+            calls.append(records)
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            fintracker.migrate.migrate_json(self.json_file, batch_size=6, progress=interrupt)
+        self.assertEqual(len(get_expenses("all")), 12)
+
+        with mock.patch.object(fintracker.migrate, "_insert_expenses",
+                               wraps=fintracker.migrate._insert_expenses) as insert:
+            result = fintracker.migrate.migrate_json(self.json_file, batch_size=6)
+        self.assertGreater(result["resumed_from"], 0)
+        self.assertEqual(result["expenses"], 8)
+        self.assertEqual(sum(len(call.args[1]) for call in insert.call_args_list), 8)
+        self.assertEqual(len(get_expenses("all")), 20)
+
+    def test_invalid_records_skipped(self):
+        """Тест пропуска некорректных записей."""
+        import io
+        from unittest import mock
+        from fintracker.migrate import migrate_json
+        self._write({"expenses": [{"category": "еда", "amount": -5}, "строка",
+                                  {"category": "еда", "amount": "много", "date": "2025-05-01 10:00:00"},
+                                  self.expenses[0]]})
+
+        with mock.patch("sys.stdout", new_callable=io.StringIO):
+            result = migrate_json(self.json_file)
+        self.assertEqual(result["invalid"], 3)
+        self.assertEqual(result["expenses"], 1)
+        self.assertEqual(len(result["errors"]), 3)
+
+
+class TestBatchReport(unittest.TestCase):
+    """Тесты пакетной генерации отчетов по месяцам."""
+
+    def setUp(self):
+        """Настройка тестовой БД."""
+        self.test_dir = tempfile.mkdtemp()
+        self.test_db_file = os.path.join(self.test_dir, "test_financial.db")
+
+        import fintracker.database
+        self.original_db_file = fintracker.database.DATABASE_FILE
+        fintracker.database.DATABASE_FILE = self.test_db_file
+
+        init_storage()
+        self.setUpData()
+
+    def setUpData(self):
+        """Добавление операций за несколько месяцев на двух счетах."""
+        add_category("еда", "expense")
+        add_category("транспорт", "expense")
+        add_category("зарплата", "income")
+        add_expense("еда", -100, "Обед", "2025-01-15 12:00:00")
+        add_expense("еда", -50, "Кофе", "2025-01-31 23:00:00", account="card")
+        add_expense("транспорт", -30, "Метро", "2025-02-01 08:00:00")
+        add_expense("зарплата", 1000, "Аванс", "2025-03-05 10:00:00", account="card")
+        add_expense("еда", -70, "Ужин", "2025-04-01 19:00:00")
+
+    def tearDown(self):
+        """Очистка после тестов."""
+        import fintracker.database
+        fintracker.database.DATABASE_FILE = self.original_db_file
+        shutil.rmtree(self.test_dir)
+
+    def test_parse_months(self):
+        """Тест разбора списка месяцев."""
+        from fintracker.report import parse_months
+        from fintracker.models import month_number
+        self.assertEqual(parse_months("2025-01..2025-03,2025-02,2025-12"),
+                         [month_number(f"2025-{m:02d}-01") for m in (1, 2, 3, 12)])
+        self.assertEqual(len(parse_months("2024")), 12)
+        for spec in ("2025-13", "январь", "2025-03..2025-01"):
+            with self.assertRaises(ValueError):
+                parse_months(spec)
+
+    def test_batch_matches_single_reports(self):
+        """Тест совпадения пакета с отдельными отчетами по каждому месяцу."""
+        import io
+        import json
+        from unittest import mock
+        from fintracker.report import generate_batch_reports, parse_months
+        from fintracker.storage import ExpenseQuery
+        directory = os.path.join(self.test_dir, "reports")
+
+        with mock.patch("sys.stdout", new_callable=io.StringIO):
+            manifest = generate_batch_reports(parse_months("2025-01..2025-03"), directory, workers=2)
+        self.assertEqual([entry["month"] for entry in manifest["reports"]], ["2025-01", "2025-02", "2025-03"])
+        with open(os.path.join(directory, "manifest.json"), encoding="utf-8") as f:
+            self.assertEqual(json.load(f), manifest)
+
+        for entry, (start, end) in zip(manifest["reports"], [("2025-01-01", "2025-01-31"),
+                                                             ("2025-02-01", "2025-02-28"),
+                                                             ("2025-03-01", "2025-03-31")]):
+            single = generate_category_report(ExpenseQuery(start_date=start, end_date=end))
+            self.assertEqual(entry["total_expenses"], single["total_expenses"])
+            self.assertGreater(entry["total_expenses"], 0)
+            self.assertAlmostEqual(entry["total_amount"], single["total_amount"])
+            self.assertTrue(os.path.exists(os.path.join(directory, entry["file"])))
+
+    def test_batch_by_account(self):
+        """Тест отдельных отчетов по счетам."""
+        import io
+        from unittest import mock
+        from fintracker.report import generate_batch_reports, parse_months
+
+        with mock.patch("sys.stdout", new_callable=io.StringIO):
+            manifest = generate_batch_reports(parse_months("2025-01"), os.path.join(self.test_dir, "reports"),
+                                              by_account=True)
+        totals = {entry["account"]: entry["total_amount"] for entry in manifest["reports"]}
+        self.assertEqual(totals, {"card": -50, "main": -100})
+        self.assertEqual(manifest["reports"][0]["file"], "category_2025-01_card.csv")
+
+
+class TestBatchReportMemoryBackend(MemoryBackendMixin, TestBatchReport):
+    """Тесты пакетной генерации отчетов на движке в памяти."""
+
+    def setUpData(self):
+        """Добавление операций за несколько месяцев на двух счетах."""
+        TestBatchReport.setUpData(self)
+
+
+class TestBulkEdit(unittest.TestCase):
+    """Тесты массового изменения и удаления операций с отменой."""
+
+    def setUp(self):
+        """Настройка тестовой БД."""
+        self.test_dir = tempfile.mkdtemp()
+        self.test_db_file = os.path.join(self.test_dir, "test_financial.db")
+
+        import fintracker.database
+        self.original_db_file = fintracker.database.DATABASE_FILE
+        fintracker.database.DATABASE_FILE = self.test_db_file
+
+        init_storage()
+        add_expense("еда", -100, "Пятёрочка", "2025-01-10 10:00:00", tags=["дом"])
+        add_expense("еда", -200, "Пятёрочка", "2025-01-20 10:00:00")
+        add_expense("еда", -300, "Магнит", "2025-02-05 10:00:00")
+        add_expense("транспорт", -50, "Метро", "2025-01-15 08:00:00")
+
+    def tearDown(self):
+        """Очистка после тестов."""
+        import fintracker.database
+        fintracker.database.DATABASE_FILE = self.original_db_file
+        shutil.rmtree(self.test_dir)
+
+    def _aggregates(self):
+        """Возвращает статистику категорий и скетчи в виде, пригодном для сравнения."""
+        conn = get_connection()
+        try:
+            stats = {row[0]: (row[1], round(row[2], 6), round(row[3], 6))
+                     for row in conn.execute('SELECT category, count, mean, m2 FROM category_stats WHERE count > 0')}
+            sketches = {(row[0], row[1], row[2]): (row[3], row[4]) for row in conn.execute(
+                'SELECT category, month, account, total, sketch FROM expense_sketches')}
+            return stats, sketches
+        finally:
+            conn.close()
+
+    def test_edit_and_undo(self):
+        """Тест изменения по фильтру, пересчета хеша и отмены."""
+        import io
+        from contextlib import redirect_stdout
+        from fintracker.database import compute_content_hash
+        from fintracker.edit import edit_expenses, undo_last
+        from fintracker.storage import ExpenseQuery
+        query = ExpenseQuery(categories=["еда"], start_date="2025-01-01", end_date="2025-01-31")
+        original = {expense.id: expense.to_dict() for expense in get_expenses("all")}
+
+        self.assertEqual(edit_expenses(query, {"category": "продукты"}, dry_run=True)["matched"], 2)
+        self.assertEqual(len(get_expenses(ExpenseQuery(categories=["продукты"]))), 0)
+
+        result = edit_expenses(query, {"category": "продукты", "description": "Перекрёсток"})
+        self.assertEqual(result["changed"], 2)
+        edited = get_expenses(ExpenseQuery(categories=["продукты"]))
+        self.assertEqual({expense.description for expense in edited}, {"Перекрёсток"})
+        conn = get_connection()
+        try:
+            expense = edited[0]
+            stored = conn.execute('SELECT content_hash FROM expenses WHERE id = ?', (expense.id,)).fetchone()[0]
+            updates = conn.execute("SELECT COUNT(*) FROM change_log WHERE op = 'update'").fetchone()[0]
+        finally:
+            conn.close()
+        self.assertEqual(stored, compute_content_hash(expense.date, expense.amount, "продукты", "Перекрёсток",
+                                                      None, expense.account))
+        self.assertEqual(updates, 2)
+
+        self.assertEqual(undo_last()["restored"], 2)
+        self.assertEqual({expense.id: expense.to_dict() for expense in get_expenses("all")}, original)
+        output = io.StringIO()
+        with redirect_stdout(output):
+            self.assertIsNone(undo_last())
+        self.assertIn("Нет изменений", output.getvalue())
+
+    def test_delete_and_undo_restores_tags(self):
+        """Тест удаления по номерам с сохранением вложений и восстановлением меток."""
+        from fintracker.attachments import list_attachments, add_attachment
+        from fintracker.edit import delete_expenses, undo_last
+        from fintracker.storage import ExpenseQuery
+        tagged = get_expenses(ExpenseQuery(tags=["дом"]))[0]
+        receipt = os.path.join(self.test_dir, "чек.txt")
+        with open(receipt, "wb") as f:
+            f.write(b"receipt")
+        add_attachment(tagged.id, receipt)
+
+        result = delete_expenses(ExpenseQuery(ids=[tagged.id]))
+        self.assertEqual(result["deleted"], 1)
+        self.assertEqual(len(get_expenses("all")), 3)
+        self.assertEqual(get_expenses(ExpenseQuery(tags=["дом"])), [])
+        self.assertEqual(len(list_attachments(tagged.id)), 1)
+
+        self.assertEqual(undo_last()["op"], "delete")
+        self.assertEqual([expense.id for expense in get_expenses(ExpenseQuery(tags=["дом"]))], [tagged.id])
+
+    def test_edit_skips_duplicates(self):
+        """Тест пропуска операций, которые после изменения совпали бы с существующей."""
+        from fintracker.edit import edit_expenses
+        from fintracker.storage import ExpenseQuery
+        add_expense("еда", -100, "Пятёрочка", "2025-01-10 10:00:00", account="card")
+
+        result = edit_expenses(ExpenseQuery(account="card"), {"account": "main"})
+        self.assertEqual((result["changed"], result["skipped"]), (0, 1))
+        self.assertIsNone(result["batch"])
+
+    def test_aggregates_match_rebuild(self):
+        """Тест совпадения обновленных агрегатов с перестроенными с нуля."""
+        from fintracker.database import rebuild_sketches_in_db, rebuild_category_stats_in_db
+        from fintracker.edit import edit_expenses, delete_expenses, undo_last
+        from fintracker.storage import ExpenseQuery
+        edit_expenses(ExpenseQuery(categories=["еда"]), {"category": "транспорт", "amount": -70})
+        delete_expenses(ExpenseQuery(start_date="2025-02-01"))
+        updated = self._aggregates()
+        rebuild_sketches_in_db()
+        rebuild_category_stats_in_db()
+        self.assertEqual(updated, self._aggregates())
+
+        undo_last()
+        undo_last()
+        restored = self._aggregates()
+        rebuild_sketches_in_db()
+        rebuild_category_stats_in_db()
+        self.assertEqual(restored, self._aggregates())
+
+
+class TestSqlStatistics(unittest.TestCase):
+    """Тесты статистических функций SQL и отчета stats."""
+
+    AMOUNTS = {"еда": [-120, -80, -450, -200, -95], "транспорт": [-50, -60, 1000]}
+
+    def setUp(self):
+        """Настройка тестовой БД."""
+        self.test_dir = tempfile.mkdtemp()
+        self.test_db_file = os.path.join(self.test_dir, "test_financial.db")
+
+        import fintracker.database
+        self.original_db_file = fintracker.database.DATABASE_FILE
+        fintracker.database.DATABASE_FILE = self.test_db_file
+
+        init_storage()
+
+    def tearDown(self):
+        """Очистка после тестов."""
+        import fintracker.database
+        fintracker.database.DATABASE_FILE = self.original_db_file
+        shutil.rmtree(self.test_dir)
+
+    def _fill(self, backend):
+        """Добавляет операции с известными суммами."""
+        day = 1
+        for category, amounts in self.AMOUNTS.items():
+            for amount in amounts:
+                backend.add_expense(category, amount, "", f"2025-03-{day:02d} 10:00:00")
+                day += 1
+
+    def test_sql_functions(self):
+        """median, percentile, stddev и month_bucket считаются внутри запроса."""
+        import statistics
+        conn = get_connection()
+        try:
+            conn.execute("CREATE TEMP TABLE t (g TEXT, x REAL)")
+            conn.executemany("INSERT INTO t VALUES (?, ?)",
+                             [("a", x) for x in (5, 1, 4, 2, 3)] + [("a", None), ("b", 7)])
+            rows = conn.execute("SELECT g, median(x), percentile(x, 100), percentile(x, 0), stddev(x) "
+                                "FROM t GROUP BY g ORDER BY g").fetchall()
+            self.assertEqual(tuple(rows[0])[:4], ("a", 3.0, 5.0, 1.0))
+            self.assertAlmostEqual(rows[0][4], statistics.stdev([1, 2, 3, 4, 5]))
+            self.assertEqual(tuple(rows[1]), ("b", 7.0, 7.0, 7.0, 0.0))
+            self.assertEqual(tuple(conn.execute("SELECT median(x), stddev(x) FROM t WHERE 0").fetchone()),
+                             (None, None))
+            self.assertEqual(tuple(conn.execute("SELECT month_bucket(24302), month_bucket('2025-03-15 10:00:00')")
+                                   .fetchone()), ("2025-03", "2025-03"))
+            with self.assertRaises(sqlite3.OperationalError):
+                conn.execute("SELECT percentile(x, 150) FROM t").fetchall()
+        finally:
+            conn.close()
+
+    def test_stddev_large_values(self):
+        """stddev не теряет точность на больших значениях с малым разбросом."""
+        import statistics
+        values = [1e9 + delta for delta in (0.01, 0.02, 0.03, 0.04)]
+        conn = get_connection()
+        try:
+            conn.execute("CREATE TEMP TABLE t (x REAL)")
+            conn.executemany("INSERT INTO t VALUES (?)", [(x,) for x in values])
+            result = conn.execute("SELECT stddev(x) FROM t").fetchone()[0]
+        finally:
+            conn.close()
+        self.assertAlmostEqual(result, statistics.stdev(values), places=4)
+
+    def test_sketch_update_matches_add(self):
+        """Пачка значений в update дает тот же скетч, что и последовательные add."""
+        import random
+        from fintracker.sketch import QuantileSketch
+        values = [random.Random(7).uniform(0, 1000) for _ in range(5000)]
+        one_by_one, batched = QuantileSketch(), QuantileSketch()
+        for value in values:
+            one_by_one.add(value)
+        for start in range(0, len(values), 1024):
+            batched.update(values[start:start + 1024])
+        self.assertEqual(batched.to_json(), one_by_one.to_json())
+
+    def test_stats_report(self):
+        """Отчет stats совпадает с расчетом по модулю statistics и с движком в памяти."""
+        import statistics
+        from fintracker.backends import SQLiteBackend, MemoryBackend
+        from fintracker.report import generate_stats_report, format_report
+        memory_backend = MemoryBackend()
+        self._fill(SQLiteBackend())
+        self._fill(memory_backend)
+
+        report = generate_stats_report("all")
+        self.assertEqual([row[0] for row in report["stats"]], ["еда", "транспорт"])
+        self.assertEqual(report["total_expenses"], 8)
+        self.assertEqual(report["total_amount"], sum(sum(amounts) for amounts in self.AMOUNTS.values()))
+        category, count, total, mean, median, p90, stddev = report["stats"][0]
+        values = [abs(x) for x in self.AMOUNTS["еда"]]
+        self.assertEqual((count, total, median, p90), (5, -945.0, 120.0, 450.0))
+        self.assertAlmostEqual(mean, statistics.mean(values))
+        self.assertAlmostEqual(stddev, statistics.stdev(values))
+
+        memory_report = memory_backend.stats_report("all")
+        for row, memory_row in zip(report["stats"], memory_report["stats"]):
+            self.assertEqual(row[:3], memory_row[:3])
+            for value, memory_value in zip(row[3:], memory_row[3:]):
+                self.assertAlmostEqual(value, memory_value)
+        self.assertIn("еда: 5 опер., -945.00 руб.; среднее 189.00, медиана 120.00", format_report(report))
+
+    def test_stats_report_csv(self):
+        """Отчет stats сохраняется в CSV и учитывает фильтры запроса."""
+        import csv
+        import io
+        from contextlib import redirect_stdout
+        from fintracker.backends import SQLiteBackend
+        from fintracker.report import generate_stats_report
+        from fintracker.query import ExpenseQuery
+        self._fill(SQLiteBackend())
+        output = os.path.join(self.test_dir, "stats.csv")
+        with redirect_stdout(io.StringIO()):
+            report = generate_stats_report(ExpenseQuery(categories=["транспорт"]), output)
+        self.assertEqual([row[0] for row in report["stats"]], ["транспорт"])
+        with open(output, encoding="utf-8") as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[-1][:5], ["транспорт", "3", "890.00", "370.00", "60.00"])
+
+
 if __name__ == '__main__':
     # Запускаем тесты
     unittest.main(verbosity=2)
\ No newline at end of file